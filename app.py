@@ -706,8 +706,12 @@ class AICompanionApp:
             'timestamp': event.timestamp
         })
         
-    def _process_user_input_async(self, user_input: str):
-        """Process user input asynchronously"""
+    def _process_user_input_async(self, user_input: str, cancel_token=None):
+        """
+        Process user input asynchronously.
+        ``cancel_token`` (from the sending client) stops generation and any TTS that
+        would follow once the client disconnects or sends a newer message.
+        """
         try:
             # Update personality based on input
             if personality_system:
@@ -715,35 +719,73 @@ class AICompanionApp:
                 
             # Get LLM response
             if llm_handler:
-                # Use the synchronous method instead of async
-                response = llm_handler.generate_response(user_input)
+                # Stream tokens to clients as they decode
+                response = self._stream_llm_response(user_input, cancel_token)
+                if cancel_token is not None and cancel_token.cancelled:
+                    logger.info(f"Dropped reply to cancelled message ({cancel_token.reason})")
+                    return
                 
                 # Store conversation
                 if db_manager:
                     db_manager.add_conversation("default_user", "user", user_input, None, None)
                     db_manager.add_conversation("default_user", "assistant", response, None, None)
                 
-                # Emit response to clients
+                from routes.app_routes_chat import detect_basic_emotions
+                emotions, primary_emotion = detect_basic_emotions(response)
+                
+                # Emit final response to clients
                 socketio.emit('ai_response', {
                     'user_input': user_input,
                     'response': response,
+                    'emotions': emotions,
+                    'primary_emotion': primary_emotion,
                     'timestamp': time.time(),
                     'personality_state': personality_system.get_personality_summary() if personality_system else None
                 })
                 
                 # Generate TTS if enabled
                 if tts_handler:
-                    self._generate_tts_sync(response)
+                    self._generate_tts_sync(response, cancel_token)
                     
         except Exception as e:
             logger.error(f"Error processing user input: {e}")
             socketio.emit('error', {'message': str(e)})
+        finally:
+            if cancel_token is not None and llm_handler:
+                llm_handler.cancellations.release(cancel_token)
+            
+    def _stream_llm_response(self, user_input: str, cancel_token=None) -> str:
+        """Generate a response, emitting each token as an 'ai_response_chunk' event"""
+        stream = llm_handler.generate_response(user_input, streaming=True, cancel_token=cancel_token)
+        if isinstance(stream, str):
+            return stream
+        
+        tokens = []
+        while True:
+            try:
+                token = next(stream)
+            except StopIteration as stop:
+                return stop.value if stop.value is not None else ''.join(tokens)
+            if cancel_token is not None and cancel_token.cancelled:
+                continue  # Drain what was decoded before the cancel without emitting it
+            tokens.append(token)
+            socketio.emit('ai_response_chunk', {
+                'user_input': user_input,
+                'token': token,
+                'index': len(tokens) - 1,
+                'timestamp': time.time()
+            })
             
-    def _generate_tts_sync(self, text: str):
-        """Generate TTS audio synchronously"""
+    def _generate_tts_sync(self, text: str, cancel_token=None):
+        """Generate TTS audio synchronously (skipped or discarded once ``cancel_token`` fires)"""
         try:
             if tts_handler and hasattr(tts_handler, 'synthesize_speech'):
+                if cancel_token is not None and cancel_token.cancelled:
+                    return
                 audio_data = tts_handler.synthesize_speech(text)
+                if cancel_token is not None and cancel_token.cancelled:
+                    logger.info(f"Discarded TTS audio for cancelled reply ({cancel_token.reason})")
+                    return
                 if audio_data:
                     # Emit audio data to clients
                     socketio.emit('tts_audio', {
@@ -224,15 +224,58 @@ class DatabaseManager:
             """, (user_id, model_id, session_id))
             row = cursor.fetchone()
             return json.loads(row[0]) if row else []
-    
+
+    # Batch writers used by the post-response queue; they write on the caller's
+    # connection (and transaction) when one is given
+    def add_conversations(self, rows: list, conn=None):
+        """Insert (user_id, model_id, message_type, content, emotion_detected, response_time_ms) rows"""
+        if conn is None:
+            with get_conversations_connection() as conn:
+                return self.add_conversations(rows, conn)
+        conn.executemany("""
+            INSERT INTO conversations (user_id, model_id, message_type, content, emotion_detected, response_time_ms)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, rows)
+
+    def append_conversation_context(self, user_id: str, session_id: str, messages: list,
+                                    model_id: str = "default", limit: int = 10, conn=None):
+        """Append messages to a session context, keeping the last ``limit`` messages"""
+        import json
+        if conn is None:
+            with get_conversations_connection() as conn:
+                return self.append_conversation_context(user_id, session_id, messages, model_id, limit, conn)
+        row = conn.execute("""
+            SELECT messages FROM conversation_contexts
+            WHERE user_id = ? AND model_id = ? AND session_id = ?
+        """, (user_id, model_id, session_id)).fetchone()
+        all_messages = (json.loads(row[0]) if row else []) + list(messages)
+        conn.execute("""
+            INSERT OR REPLACE INTO conversation_contexts (user_id, model_id, session_id, messages)
+            VALUES (?, ?, ?, ?)
+        """, (user_id, model_id, session_id, json.dumps(all_messages[-limit:])))
+
+    def add_conversation_history(self, rows: list, conn=None):
+        """Insert (user_id, avatar_id, user_message, ai_response, metadata) chat history rows"""
+        import json
+        if conn is None:
+            with get_conversations_connection() as conn:
+                return self.add_conversation_history(rows, conn)
+        conn.executemany("""
+            INSERT INTO conversation_history (user_id, avatar_id, user_message, ai_response, metadata)
+            VALUES (?, ?, ?, ?, ?)
+        """, [(user_id, avatar_id, user_message, ai_response, json.dumps(metadata))
+              for user_id, avatar_id, user_message, ai_response, metadata in rows])
+
     def cache_llm_response(self, input_hash: str, response: str, model_name: str, 
-                          temperature: float, model_id: str = "default"):
+                          temperature: float, model_id: str = "default", ttl_hours: float = 24):
         """Cache LLM response with model awareness"""
         from datetime import datetime, timedelta
-        expires_at = datetime.now() + timedelta(hours=24)
+        expires_at = datetime.now() + timedelta(hours=ttl_hours)
         
         with get_conversations_connection() as conn:
             cursor = conn.cursor()
+            # input_hash is not unique in the table, so replace the previous row explicitly
+            cursor.execute("DELETE FROM llm_cache WHERE input_hash = ? AND model_id = ?", (input_hash, model_id))
             cursor.execute("""
                 INSERT OR REPLACE INTO llm_cache 
                 (input_hash, model_id, response, model_name, temperature, expires_at)
@@ -252,6 +295,34 @@ class DatabaseManager:
             row = cursor.fetchone()
             return row[0] if row else None
     
+    def get_cached_llm_entry(self, input_hash: str, model_id: str = "default"):
+        """Get an unexpired cached LLM response with its expiry as (response, expires_at timestamp)"""
+        from datetime import datetime
+        with get_conversations_connection() as conn:
+            row = conn.execute("""
+                SELECT response, expires_at FROM llm_cache 
+                WHERE input_hash = ? AND model_id = ? AND expires_at > ?
+            """, (input_hash, model_id, datetime.now())).fetchone()
+            if not row:
+                return None
+            return row[0], datetime.fromisoformat(str(row[1])).timestamp()
+    
+    def purge_llm_cache(self, max_entries: int = 5000) -> int:
+        """Delete expired LLM cache rows and the oldest rows beyond max_entries"""
+        from datetime import datetime
+        with get_conversations_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM llm_cache WHERE expires_at IS NULL OR expires_at <= ?", (datetime.now(),))
+            removed = cursor.rowcount
+            cursor.execute("""
+                DELETE FROM llm_cache WHERE id NOT IN (
+                    SELECT id FROM llm_cache ORDER BY created_at DESC, id DESC LIMIT ?
+                )
+            """, (max_entries,))
+            removed += cursor.rowcount
+            conn.commit()
+            return removed
+    
     # Model-specific personality methods
     def get_model_personality(self, model_id: str):
         """Get personality data for a specific model - creates if missing"""
@@ -596,6 +667,122 @@ class DatabaseManager:
         
         return '; '.join(notes) if notes else "Virtual AI companion"
 
+# Full-text index over memories. Contentless, so it can carry an "owner" token
+# (hex of user_id and model_id) that scopes a MATCH to one user/model pair;
+# triggers keep it in sync and skip updates that only touch access tracking.
+MEMORY_FTS_OWNER_SQL = "'o' || hex({alias}.user_id) || 'x' || hex({alias}.model_id) || 'z'"
+
+
+def memory_fts_owner(user_id: str, model_id: str) -> str:
+    """The owner token the memory FTS triggers index for a user/model pair."""
+    return f"o{user_id.encode('utf-8').hex().upper()}x{model_id.encode('utf-8').hex().upper()}z"
+
+
+def ensure_memory_fts(conn) -> bool:
+    """
+    Create the memories_fts index and its triggers, populating it from existing
+    rows the first time. Returns False if SQLite was built without FTS5.
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'memories_fts'")
+    exists = cursor.fetchone() is not None
+    new_owner = MEMORY_FTS_OWNER_SQL.format(alias="new")
+    old_owner = MEMORY_FTS_OWNER_SQL.format(alias="old")
+    try:
+        cursor.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS memories_fts USING fts5(
+                owner, key_topic, value_content,
+                content='', tokenize='porter unicode61'
+            )
+        """)
+    except sqlite3.OperationalError as e:
+        logger.warning(f"FTS5 unavailable, memory search will use LIKE scans: {e}")
+        return False
+    
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS memories_fts_insert AFTER INSERT ON memories BEGIN
+            INSERT INTO memories_fts (rowid, owner, key_topic, value_content)
+            VALUES (new.id, {new_owner}, new.key_topic, new.value_content);
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS memories_fts_delete AFTER DELETE ON memories BEGIN
+            INSERT INTO memories_fts (memories_fts, rowid, owner, key_topic, value_content)
+            VALUES ('delete', old.id, {old_owner}, old.key_topic, old.value_content);
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS memories_fts_update
+        AFTER UPDATE OF user_id, model_id, key_topic, value_content ON memories BEGIN
+            INSERT INTO memories_fts (memories_fts, rowid, owner, key_topic, value_content)
+            VALUES ('delete', old.id, {old_owner}, old.key_topic, old.value_content);
+            INSERT INTO memories_fts (rowid, owner, key_topic, value_content)
+            VALUES (new.id, {new_owner}, new.key_topic, new.value_content);
+        END
+    """)
+    
+    if not exists:
+        # Migration: index the memories stored before the FTS table existed
+        cursor.execute(f"""
+            INSERT INTO memories_fts (rowid, owner, key_topic, value_content)
+            SELECT id, {MEMORY_FTS_OWNER_SQL.format(alias="memories")}, key_topic, value_content FROM memories
+        """)
+        migrated = cursor.rowcount
+        cursor.execute("INSERT INTO memories_fts (memories_fts) VALUES ('optimize')")
+        logger.info(f"Indexed {migrated} existing memories for full-text search")
+    return True
+
+
+def ensure_rag_outbox(conn):
+    """
+    Create the rag_outbox table and the conversations triggers that feed it.
+    Every stored assistant reply (which completes a user/assistant pair) and
+    every deleted message is queued for the RAG indexer. Only the indexer calls
+    this, since nothing else drains the table.
+    """
+    cursor = conn.cursor()
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS rag_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            conversation_id INTEGER NOT NULL,
+            operation TEXT NOT NULL,
+            created_at REAL NOT NULL DEFAULT (julianday('now')),
+            attempts INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT
+        )
+    """)
+    # Outboxes created before failed rows were counted
+    columns = {row[1] for row in cursor.execute("PRAGMA table_info(rag_outbox)")}
+    if 'attempts' not in columns:
+        cursor.execute("ALTER TABLE rag_outbox ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+    if 'last_error' not in columns:
+        cursor.execute("ALTER TABLE rag_outbox ADD COLUMN last_error TEXT")
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS conversations_rag_outbox_insert
+        AFTER INSERT ON conversations WHEN new.message_type = 'assistant' BEGIN
+            INSERT INTO rag_outbox (conversation_id, operation) VALUES (new.id, 'insert');
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS conversations_rag_outbox_delete
+        AFTER DELETE ON conversations BEGIN
+            INSERT INTO rag_outbox (conversation_id, operation) VALUES (old.id, 'delete');
+        END
+    """)
+
+
+def drop_rag_outbox(conn):
+    """
+    Remove the rag_outbox triggers and table when no indexer will drain them.
+    Conversations stored meanwhile are picked up by the watermark sync once an
+    indexer starts again.
+    """
+    cursor = conn.cursor()
+    cursor.execute("DROP TRIGGER IF EXISTS conversations_rag_outbox_insert")
+    cursor.execute("DROP TRIGGER IF EXISTS conversations_rag_outbox_delete")
+    cursor.execute("DROP TABLE IF EXISTS rag_outbox")
+
+
 def _populate_personality_data_from_config(conn):
     """Populate personality data from characters.json into the database"""
     import json
@@ -888,6 +1075,18 @@ def init_databases():
             )
         """)
         
+        # Journal of pending post-response bookkeeping (see models/post_response_queue.py)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS post_response_jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_type TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                enqueued_at REAL NOT NULL,
+                attempts INTEGER DEFAULT 0,
+                last_error TEXT
+            )
+        """)
+
         # Create indexes for performance
         try:
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_conv_user_model ON conversations(user_id, model_id)")
@@ -895,9 +1094,12 @@ def init_databases():
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_mem_topic ON memories(key_topic)")
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_context_user_model ON conversation_contexts(user_id, model_id)")
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_cache_hash_model ON llm_cache(input_hash, model_id)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_cache_expires ON llm_cache(expires_at)")
         except Exception as e:
             logger.warning(f"Some indexes may already exist: {e}")
         
+        ensure_memory_fts(conn)
+        
         conn.commit()
         logger.info("Conversations database initialized")
     
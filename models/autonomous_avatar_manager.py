@@ -10,10 +10,12 @@ import asyncio
 import random
 import time
 import logging
-import re
 from typing import List, Dict, Optional
 from datetime import datetime, timedelta
 
+from .llm_scheduler import RequestPriority
+from .emoji_rewriter import EMOJI_PATTERN, limit_emojis
+
 logger = logging.getLogger(__name__)
 
 class AutonomousAvatarManager:
@@ -173,7 +175,7 @@ class AutonomousAvatarManager:
         }
         
         # Emoji pattern for counting and limiting
-        self.emoji_pattern = re.compile(r'[\U0001F600-\U0001F64F\U0001F300-\U0001F5FF\U0001F680-\U0001F6FF\U0001F1E0-\U0001F1FF\U00002702-\U000027B0\U000024C2-\U0001F251]+')
+        self.emoji_pattern = EMOJI_PATTERN
         self.max_emojis_per_message = 4  # Conservative limit for quality
     
     def count_emojis(self, text: str) -> int:
@@ -185,23 +187,7 @@ class AutonomousAvatarManager:
         if max_emojis is None:
             max_emojis = self.max_emojis_per_message
             
-        emojis = self.emoji_pattern.findall(text)
-        if len(emojis) <= max_emojis:
-            return text
-            
-        # Remove excess emojis from the end
-        emoji_count = 0
-        result = ""
-        for char in text:
-            if self.emoji_pattern.match(char):
-                if emoji_count < max_emojis:
-                    result += char
-                    emoji_count += 1
-                # Skip excess emojis
-            else:
-                result += char
-        
-        return result.strip()
+        return limit_emojis(text, max_emojis, self.emoji_pattern)
     
     def start_autonomous_system(self):
         """Start the autonomous conversation system"""
@@ -700,7 +686,7 @@ class AutonomousAvatarManager:
         opening_prompt = "\n".join(prompt_parts)
         
         try:
-            opening_message = self.llm_handler.generate_response(opening_prompt)
+            opening_message = self.llm_handler.generate_response(opening_prompt, priority=RequestPriority.AUTONOMOUS)
             opening_message = self.limit_emojis(opening_message.strip())
         except Exception as e:
             logger.error(f"Failed to generate dynamic opening message: {e}")
@@ -842,7 +828,7 @@ class AutonomousAvatarManager:
         response_prompt = "\n".join(prompt_parts)
         
         try:
-            full_response = self.llm_handler.generate_response(response_prompt)
+            full_response = self.llm_handler.generate_response(response_prompt, priority=RequestPriority.AUTONOMOUS)
             full_response = self.limit_emojis(full_response.strip())
         except Exception as e:
             logger.error(f"Failed to generate dynamic response: {e}")
@@ -907,7 +893,7 @@ class AutonomousAvatarManager:
         opening_prompt = "\n".join(prompt_parts)
         
         try:
-            opening_message = self.llm_handler.generate_response(opening_prompt)
+            opening_message = self.llm_handler.generate_response(opening_prompt, priority=RequestPriority.AUTONOMOUS)
             opening_message = self.limit_emojis(opening_message.strip())
         except Exception as e:
             logger.error(f"Failed to generate opening message: {e}")
@@ -982,7 +968,7 @@ class AutonomousAvatarManager:
         response_prompt = "\n".join(prompt_parts)
         
         try:
-            response = self.llm_handler.generate_response(response_prompt)
+            response = self.llm_handler.generate_response(response_prompt, priority=RequestPriority.AUTONOMOUS)
             response = self.limit_emojis(response.strip())
         except Exception as e:
             logger.error(f"Failed to generate delayed response: {e}")
@@ -1027,7 +1013,7 @@ class AutonomousAvatarManager:
         reflection_prompt = "\n".join(prompt_parts)
         
         try:
-            message = self.llm_handler.generate_response(reflection_prompt)
+            message = self.llm_handler.generate_response(reflection_prompt, priority=RequestPriority.AUTONOMOUS)
             message = self.limit_emojis(message.strip())
         except Exception as e:
             logger.error(f"Failed to generate self-reflection: {e}")
@@ -1112,7 +1098,7 @@ class AutonomousAvatarManager:
         prompt = "\n".join(prompt_parts)
         
         try:
-            response = self.llm_handler.generate_response(prompt)
+            response = self.llm_handler.generate_response(prompt, priority=RequestPriority.AUTONOMOUS)
             # Apply emoji limiting and clean up
             cleaned_response = self.limit_emojis(response.strip())
             return cleaned_response
@@ -1161,7 +1147,7 @@ class AutonomousAvatarManager:
         prompt = "\n".join(prompt_parts)
         
         try:
-            response = self.llm_handler.generate_response(prompt)
+            response = self.llm_handler.generate_response(prompt, priority=RequestPriority.AUTONOMOUS)
             # Apply emoji limiting and clean up
             cleaned_response = self.limit_emojis(response.strip())
             return cleaned_response
@@ -1212,7 +1198,7 @@ class AutonomousAvatarManager:
         prompt = "\n".join(prompt_parts)
         
         try:
-            response = self.llm_handler.generate_response(prompt)
+            response = self.llm_handler.generate_response(prompt, priority=RequestPriority.AUTONOMOUS)
             response = self.limit_emojis(response.strip())
             return response
         except Exception as e:
@@ -0,0 +1,212 @@
+"""
+Embedding model backends for AI Companion application.
+``sentence_transformers`` loads the model through torch. ``onnx`` runs an
+exported MiniLM graph with onnxruntime and a fast (Rust) tokenizer, without
+importing torch, which starts faster and uses less memory on Raspberry
+Pi-class machines; the graph can optionally be int8-quantized.
+
+Both produce the same mean-pooled, L2-normalized vectors from the same
+weights, so a collection built with one stays searchable with the other. An
+int8 graph only approximates them; it gets its own embedding space and the
+collection is re-embedded when switching to or from it.
+"""
+
+import logging
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("sentence_transformers", "onnx")
+DEFAULT_ONNX_DIR = "~/.local/share/ai2d_chat/models/embeddings/all-MiniLM-L6-v2-onnx"
+ONNX_MODEL_FILE = "model.onnx"
+ONNX_QUANTIZED_FILE = "model_quantized.onnx"
+TOKENIZER_FILE = "tokenizer.json"
+
+
+def hub_model_name(model_name: str) -> str:
+    """Full Hugging Face id of a sentence-transformers model given by short name."""
+    return model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+
+
+class OnnxSentenceEncoder:
+    """
+    Drop-in for ``SentenceTransformer.encode`` over an exported transformer.
+
+    Texts are tokenized with ``tokenizers`` (truncated to ``max_length``,
+    padded per batch), run through the ONNX graph, mean-pooled over the
+    attention mask and L2-normalized, matching the sentence-transformers
+    pipeline of MiniLM models. Batches are formed from length-sorted texts
+    to keep padding short.
+    """
+
+    def __init__(self, model_dir: Union[str, Path], quantized: bool = False, max_length: int = 256,
+                 threads: Optional[int] = None):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        if np is None:
+            raise ImportError("NumPy is required for the ONNX embedding backend")
+
+        self.model_dir = Path(os.path.expanduser(str(model_dir)))
+        self.quantized = quantized
+        model_path = self.model_dir / (ONNX_QUANTIZED_FILE if quantized else ONNX_MODEL_FILE)
+        if not model_path.exists():
+            raise FileNotFoundError(f"ONNX embedding model not found: {model_path}")
+
+        self.tokenizer = Tokenizer.from_file(str(self.model_dir / TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(max_length=int(max_length))
+        self.tokenizer.enable_padding(pad_id=self.tokenizer.token_to_id("[PAD]") or 0, pad_token="[PAD]")
+
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = int(threads)
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(str(model_path), sess_options=options,
+                                            providers=["CPUExecutionProvider"])
+        self.input_names = {node.name for node in self.session.get_inputs()}
+        self.dimension = int(self.session.get_outputs()[0].shape[-1])
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dimension
+
+    def _encode_batch(self, texts: List[str], normalize: bool):
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([encoding.ids for encoding in encodings], dtype=np.int64)
+        attention_mask = np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.array([encoding.type_ids for encoding in encodings], dtype=np.int64)
+
+        hidden = self.session.run(None, feeds)[0]
+        mask = attention_mask[..., None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        if normalize:
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled.astype(np.float32)
+
+    def encode(self, sentences: Union[str, Sequence[str]], batch_size: int = 32,
+               normalize_embeddings: bool = False, show_progress_bar: bool = False, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        result = np.zeros((len(texts), self.dimension), dtype=np.float32)
+
+        order = sorted(range(len(texts)), key=lambda index: len(texts[index]))
+        batch_size = max(1, int(batch_size))
+        for start in range(0, len(order), batch_size):
+            indexes = order[start:start + batch_size]
+            result[indexes] = self._encode_batch([texts[index] for index in indexes], normalize_embeddings)
+        return result[0] if single else result
+
+
+def resolve_embedding_backend(embedding_config: Dict[str, Any]) -> str:
+    """
+    Backend named by ``rag.embedding.backend``. ``auto`` picks ONNX on the
+    performance tiers listed in ``onnx.auto_tiers`` (and on Raspberry Pi) when
+    onnxruntime and an exported model are available.
+    """
+    backend = embedding_config.get("backend", "sentence_transformers")
+    if backend in BACKENDS:
+        return backend
+    if backend != "auto":
+        logger.warning(f"Unknown embedding backend '{backend}', using sentence_transformers")
+        return "sentence_transformers"
+
+    onnx_config = embedding_config.get("onnx", {})
+    try:
+        from utils.system_detector import SystemDetector
+        detector = SystemDetector()
+        tier = detector.capabilities.get("performance_tier", "low")
+        is_raspberry_pi = detector.system_info.get("is_raspberry_pi", False)
+    except Exception as e:
+        logger.warning(f"System detection failed, using sentence_transformers embeddings: {e}")
+        return "sentence_transformers"
+    if not is_raspberry_pi and tier not in onnx_config.get("auto_tiers", ["low", "low-medium"]):
+        return "sentence_transformers"
+
+    model_dir = Path(os.path.expanduser(onnx_config.get("model_dir") or DEFAULT_ONNX_DIR))
+    model_file = ONNX_QUANTIZED_FILE if onnx_config.get("quantized", False) else ONNX_MODEL_FILE
+    try:
+        import onnxruntime  # noqa: F401
+        import tokenizers  # noqa: F401
+    except ImportError:
+        logger.info("onnxruntime/tokenizers not installed, using sentence_transformers embeddings")
+        return "sentence_transformers"
+    if not (model_dir / model_file).exists() or not (model_dir / TOKENIZER_FILE).exists():
+        logger.info(f"No exported ONNX embedding model in {model_dir}, using sentence_transformers embeddings "
+                    f"(export one with export_onnx_model)")
+        return "sentence_transformers"
+    return "onnx"
+
+
+def embedding_space(model_name: str, backend: str, embedding_config: Dict[str, Any]) -> str:
+    """
+    Identifier of the vector space a backend produces. Vectors with the same
+    identifier are interchangeable; a collection built in another space must be
+    re-embedded.
+    """
+    name = model_name.replace("sentence-transformers/", "")
+    if backend == "onnx" and embedding_config.get("onnx", {}).get("quantized", False):
+        return f"{name}+int8"
+    return name
+
+
+def load_embedding_model(model_name: str, backend: str, embedding_config: Dict[str, Any]):
+    """Load the embedding model for a backend (both expose ``encode``)."""
+    if backend == "onnx":
+        onnx_config = embedding_config.get("onnx", {})
+        logger.info(f"Loading ONNX embedding model from {onnx_config.get('model_dir') or DEFAULT_ONNX_DIR}"
+                    f"{' (int8)' if onnx_config.get('quantized', False) else ''}")
+        return OnnxSentenceEncoder(
+            onnx_config.get("model_dir") or DEFAULT_ONNX_DIR,
+            quantized=onnx_config.get("quantized", False),
+            max_length=onnx_config.get("max_length", 256),
+            threads=onnx_config.get("threads") or embedding_config.get("service", {}).get("torch_threads")
+        )
+
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name)
+
+
+def export_onnx_model(model_name: str, output_dir: Union[str, Path] = DEFAULT_ONNX_DIR,
+                      quantize: bool = True, opset: int = 14) -> Path:
+    """
+    Export a sentence-transformers model's transformer to ONNX, save its fast
+    tokenizer next to it and, with ``quantize``, write a dynamically
+    int8-quantized copy. Needs torch and transformers (only for the export).
+    """
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    output_dir = Path(os.path.expanduser(str(output_dir)))
+    output_dir.mkdir(parents=True, exist_ok=True)
+    hub_name = hub_model_name(model_name)
+
+    tokenizer = AutoTokenizer.from_pretrained(hub_name, use_fast=True)
+    model = AutoModel.from_pretrained(hub_name).eval()
+    inputs = tokenizer(["An example sentence to trace the graph."], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in inputs]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    model_path = output_dir / ONNX_MODEL_FILE
+    with torch.no_grad():
+        torch.onnx.export(
+            model, tuple(inputs[name] for name in input_names), str(model_path),
+            input_names=input_names, output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes, opset_version=opset, do_constant_folding=True
+        )
+    tokenizer.save_pretrained(str(output_dir))
+    logger.info(f"Exported {hub_name} to {model_path}")
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(str(model_path), str(output_dir / ONNX_QUANTIZED_FILE), weight_type=QuantType.QInt8)
+        logger.info(f"Wrote int8-quantized model to {output_dir / ONNX_QUANTIZED_FILE}")
+    return output_dir
@@ -0,0 +1,292 @@
+"""
+Embedding cache for AI Companion application.
+RAG embeds the same text over and over: repeated queries, documents re-read
+by a sync, the user's message embedded for search and again when the
+exchange is stored. Vectors are cached by content hash in an in-process LRU
+backed by a float16 memory-mapped store on disk that survives restarts.
+"""
+
+import hashlib
+import json
+import logging
+import shutil
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, one process per cache directory is assumed
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+CACHE_FORMAT_VERSION = 1
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Two-tier cache of normalized embeddings for one embedding model.
+
+    The memory tier is an LRU of float32 vectors (``max_entries``). The disk
+    tier is ``vectors.f16``, a float16 memmap with one row per cached text,
+    plus ``keys.txt`` with the matching content hashes in row order; a row is
+    written before its key, so an interrupted write leaves at most an unused
+    row, and a partially written last key is cut off when the store is opened.
+    ``meta.json`` records the model name and dimension: opening the directory
+    with another model discards the store, so vectors of different models are
+    never mixed. The directory is locked (``.lock``) by the process using it;
+    another process falls back to the memory tier instead of overwriting rows.
+    Without NumPy only the memory tier is used.
+    """
+
+    LOCK_FILE = ".lock"
+
+    def __init__(self, model_name: str, directory: Optional[Path] = None, max_entries: int = 4096,
+                 max_disk_entries: int = 200000):
+        self.model_name = model_name
+        self.directory = Path(directory) if directory and np is not None else None
+        self.max_entries = max(1, int(max_entries))
+        self.max_disk_entries = max(0, int(max_disk_entries))
+
+        self._memory: "OrderedDict[str, Any]" = OrderedDict()
+        self._disk_rows: Dict[str, int] = {}
+        self._next_row = 0
+        self._vectors = None
+        self._dim: Optional[int] = None
+        self._keys_file = None
+        self._lock_file = None
+        self._lock = threading.Lock()
+
+        self._stats = {
+            "requests": 0,
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "encode_calls": 0,
+            "encode_calls_saved": 0,
+            "evictions": 0,
+        }
+
+        if self.directory is not None:
+            try:
+                self._open_disk_tier()
+            except Exception as e:
+                logger.warning(f"Embedding disk cache unavailable, using memory only: {e}")
+                self.directory = None
+                if self._lock_file is not None:
+                    self._lock_file.close()  # Releases the directory lock
+                    self._lock_file = None
+
+    def _open_disk_tier(self) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._acquire_directory_lock()
+        meta_path = self.directory / "meta.json"
+        meta = None
+        if meta_path.exists():
+            with open(meta_path, "r") as f:
+                meta = json.load(f)
+        if meta and (meta.get("version") != CACHE_FORMAT_VERSION or meta.get("model_name") != self.model_name):
+            logger.info(f"Embedding model changed ({meta.get('model_name')} -> {self.model_name}), "
+                        f"clearing embedding cache")
+            self._reset_directory()
+            meta = None
+        if not meta or not meta.get("dim"):
+            return
+
+        self._dim = int(meta["dim"])
+        keys = self._read_keys(self.directory / "keys.txt")
+        vectors_path = self.directory / "vectors.f16"
+        capacity = vectors_path.stat().st_size // (2 * self._dim) if vectors_path.exists() else 0
+        keys = keys[:capacity]
+        self._disk_rows = {key: row for row, key in enumerate(keys)}
+        self._next_row = len(keys)
+        if capacity:
+            self._vectors = np.memmap(vectors_path, dtype=np.float16, mode="r+", shape=(capacity, self._dim))
+        logger.info(f"Loaded {len(self._disk_rows)} cached embeddings for {self.model_name}")
+
+    def _acquire_directory_lock(self) -> None:
+        """Take the directory for this process; raises if another process holds it."""
+        if fcntl is None:
+            return
+        lock_file = open(self.directory / self.LOCK_FILE, "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            raise RuntimeError(f"{self.directory} is in use by another process")
+        self._lock_file = lock_file
+
+    @staticmethod
+    def _read_keys(keys_path: Path) -> List[str]:
+        """
+        Read the row keys, truncating the file after the last complete line so
+        the next append starts on a fresh line. Keys after a malformed line are
+        dropped too, since their row numbers can no longer be trusted.
+        """
+        if not keys_path.exists():
+            return []
+        data = keys_path.read_bytes()
+        complete = data[:data.rfind(b"\n") + 1]
+        keys = []
+        for line in complete.decode("ascii", errors="replace").splitlines():
+            if len(line) != 40 or any(c not in "0123456789abcdef" for c in line):
+                break
+            keys.append(line)
+        valid_length = sum(len(key) + 1 for key in keys)
+        if valid_length != len(data):
+            logger.warning(f"Discarding {len(data) - valid_length} bytes of incomplete embedding cache keys")
+            with open(keys_path, "r+b") as f:
+                f.truncate(valid_length)
+        return keys
+
+    def _reset_directory(self) -> None:
+        for path in self.directory.iterdir():
+            if path.name == self.LOCK_FILE:
+                continue
+            if path.is_dir():
+                shutil.rmtree(path)
+            else:
+                path.unlink()
+
+    def _init_disk_store(self, dim: int) -> None:
+        """Record the model and dimension the first time vectors are written."""
+        self._dim = dim
+        with open(self.directory / "meta.json", "w") as f:
+            json.dump({"version": CACHE_FORMAT_VERSION, "model_name": self.model_name, "dim": dim}, f)
+
+    def _ensure_capacity(self, rows: int) -> None:
+        """Grow the memmap (doubling) so it holds at least ``rows`` rows."""
+        capacity = 0 if self._vectors is None else self._vectors.shape[0]
+        if rows <= capacity:
+            return
+        new_capacity = max(rows, capacity * 2, 1024)
+        if self._vectors is not None:
+            self._vectors.flush()
+            self._vectors = None
+        vectors_path = self.directory / "vectors.f16"
+        with open(vectors_path, "ab") as f:
+            f.truncate(new_capacity * self._dim * 2)
+        self._vectors = np.memmap(vectors_path, dtype=np.float16, mode="r+", shape=(new_capacity, self._dim))
+
+    def _store_on_disk(self, items: List[tuple]) -> None:
+        """Append (key, vector) pairs to the disk tier."""
+        if self.directory is None:
+            return
+        items = [(key, vector) for key, vector in items if key not in self._disk_rows]
+        room = self.max_disk_entries - self._next_row
+        items = items[:max(0, room)]
+        if not items:
+            return
+        try:
+            if self._dim is None:
+                self._init_disk_store(len(items[0][1]))
+            start = self._next_row
+            self._ensure_capacity(start + len(items))
+            self._vectors[start:start + len(items)] = np.asarray([vector for _, vector in items], dtype=np.float16)
+            self._vectors.flush()
+            if self._keys_file is None:
+                self._keys_file = open(self.directory / "keys.txt", "a")
+            self._keys_file.write("".join(f"{key}\n" for key, _ in items))
+            self._keys_file.flush()
+            for offset, (key, _) in enumerate(items):
+                self._disk_rows[key] = start + offset
+            self._next_row = start + len(items)
+        except Exception as e:
+            logger.warning(f"Could not write embeddings to disk cache: {e}")
+
+    def _remember(self, key: str, vector: Any) -> None:
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def encode(self, texts: Sequence[str], encode_fn: Callable[[List[str]], Any]) -> List[Any]:
+        """
+        Vectors for ``texts`` in order. Texts missing from both tiers are encoded
+        with a single ``encode_fn(unique_missing_texts)`` call.
+        """
+        keys = [text_hash(text) for text in texts]
+        results: List[Any] = [None] * len(texts)
+        missing: Dict[str, List[int]] = {}
+
+        with self._lock:
+            self._stats["requests"] += len(texts)
+            for index, key in enumerate(keys):
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    self._stats["memory_hits"] += 1
+                    results[index] = vector
+                    continue
+                row = self._disk_rows.get(key)
+                if row is not None:
+                    vector = np.array(self._vectors[row], dtype=np.float32)
+                    self._remember(key, vector)
+                    self._stats["disk_hits"] += 1
+                    results[index] = vector
+                    continue
+                missing.setdefault(key, []).append(index)
+
+        if missing:
+            indexes = list(missing.values())
+            encoded = encode_fn([texts[positions[0]] for positions in indexes])
+            if np is not None:
+                encoded = np.asarray(encoded, dtype=np.float32)
+            with self._lock:
+                self._stats["encode_calls"] += 1
+                self._stats["misses"] += len(missing)
+                new_items = []
+                for (key, positions), vector in zip(missing.items(), encoded):
+                    self._remember(key, vector)
+                    new_items.append((key, vector))
+                    for index in positions:
+                        results[index] = vector
+                self._store_on_disk(new_items)
+
+        with self._lock:
+            # Texts served without encoding (cached, or repeated within this request)
+            self._stats["encode_calls_saved"] += len(texts) - len(missing)
+        return results
+
+    def clear(self) -> None:
+        """Drop both tiers."""
+        with self._lock:
+            self._memory.clear()
+            self._disk_rows.clear()
+            self._next_row = 0
+            self._vectors = None
+            self._dim = None
+            if self._keys_file is not None:
+                self._keys_file.close()
+                self._keys_file = None
+            if self.directory is not None:
+                self._reset_directory()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get hit/miss counters, encode calls saved and the size of each tier."""
+        with self._lock:
+            stats = dict(self._stats)
+            requests = stats["requests"]
+            disk_entries = len(self._disk_rows)
+            stats.update({
+                "model_name": self.model_name,
+                "memory_entries": len(self._memory),
+                "max_entries": self.max_entries,
+                "disk_entries": disk_entries,
+                "disk_bytes": disk_entries * self._dim * 2 if self._dim else 0,
+                "disk_enabled": self.directory is not None,
+                "hit_ratio": round((stats["memory_hits"] + stats["disk_hits"]) / requests, 3) if requests else 0.0,
+            })
+            return stats
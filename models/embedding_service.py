@@ -0,0 +1,233 @@
+"""
+Micro-batching embedding service for AI Companion application.
+Concurrent chats each used to call ``SentenceTransformer.encode`` on their own
+request thread, with every call's torch thread pool contending for the same
+cores. One worker per embedding model now collects requests for a few
+milliseconds (or until ``max_batch`` texts are waiting), encodes them as one
+batch and resolves each caller's future with its rows.
+"""
+
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+
+def default_torch_threads() -> int:
+    """Intra-op threads for the single encoding worker: leave a core for the rest of the app."""
+    return max(1, min(4, (os.cpu_count() or 2) - 1))
+
+
+class _EmbeddingRequest:
+    __slots__ = ("texts", "future", "enqueued_at")
+
+    def __init__(self, texts: List[str]):
+        self.texts = texts
+        self.future: Future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class EmbeddingService:
+    """
+    Single-worker batcher in front of a SentenceTransformer-like ``model``.
+
+    ``submit`` queues texts and returns a Future of their normalized vectors
+    (one row per text); ``encode`` waits for it. The worker takes the first
+    waiting request, keeps collecting for up to ``max_wait_ms`` while fewer
+    than ``max_batch`` texts are gathered, and encodes them in one call.
+    Requests arriving during an encode are batched into the next round, so
+    under load batches fill without waiting. Before ``start`` (or after
+    ``stop``) requests are encoded on the caller's thread.
+    """
+
+    def __init__(self, model: Any, max_batch: int = 32, max_wait_ms: float = 2.0,
+                 torch_threads: Optional[int] = None):
+        self.model = model
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000
+        self.torch_threads = int(torch_threads) if torch_threads else default_torch_threads()
+
+        self._queue: "queue.Queue[_EmbeddingRequest]" = queue.Queue()
+        self._stop_event = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+        self._stats = {
+            "requests": 0,
+            "texts": 0,
+            "batches": 0,
+            "max_batch_texts": 0,
+            "errors": 0,
+            "inline_requests": 0,
+            "queue_time": 0.0,
+            "encode_time": 0.0,
+        }
+
+    def start(self) -> None:
+        """Start the encoding worker."""
+        if self._worker and self._worker.is_alive():
+            return
+        self._stop_event.clear()
+        self._worker = threading.Thread(target=self._worker_loop, name="embedding-service", daemon=True)
+        self._worker.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._worker:
+            self._worker.join(timeout=5)
+            self._worker = None
+
+    def _set_torch_threads(self) -> None:
+        # Process-wide in torch; applied once the worker is the only encoder. Only
+        # when the model already loaded torch (the ONNX backend runs without it).
+        torch = sys.modules.get('torch')
+        if torch is None:
+            return
+        try:
+            torch.set_num_threads(self.torch_threads)
+        except Exception as e:
+            logger.warning(f"Could not set torch threads for embedding worker: {e}")
+
+    def _encode(self, texts: List[str]):
+        return self.model.encode(texts, batch_size=self.max_batch,
+                                 normalize_embeddings=True, show_progress_bar=False)
+
+    def submit(self, texts: Sequence[str]) -> Future:
+        """Queue texts for the next batch; the future resolves to their vectors."""
+        request = _EmbeddingRequest(list(texts))
+        if not request.texts:
+            request.future.set_result([])
+            return request.future
+        if not (self._worker and self._worker.is_alive()):
+            with self._lock:
+                self._stats["inline_requests"] += 1
+            try:
+                request.future.set_result(self._encode(request.texts))
+            except Exception as e:
+                request.future.set_exception(e)
+            return request.future
+        self._queue.put(request)
+        return request.future
+
+    def encode(self, texts: Sequence[str], timeout: Optional[float] = None):
+        """Vectors for texts (blocking)."""
+        return self.submit(texts).result(timeout)
+
+    def _collect(self, first: _EmbeddingRequest) -> List[_EmbeddingRequest]:
+        batch = [first]
+        count = len(first.texts)
+        deadline = time.perf_counter() + self.max_wait
+        while count < self.max_batch:
+            try:
+                # Whatever queued up during the previous encode is taken without waiting
+                request = self._queue.get_nowait()
+            except queue.Empty:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            batch.append(request)
+            count += len(request.texts)
+        return batch
+
+    def _worker_loop(self) -> None:
+        self._set_torch_threads()
+        while not self._stop_event.is_set():
+            try:
+                first = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            batch = self._collect(first)
+            texts = [text for request in batch for text in request.texts]
+
+            started = time.perf_counter()
+            try:
+                vectors = self._encode(texts)
+            except Exception as e:
+                logger.error(f"Error encoding embedding batch: {e}")
+                with self._lock:
+                    self._stats["errors"] += 1
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+            finished = time.perf_counter()
+
+            offset = 0
+            for request in batch:
+                request.future.set_result(vectors[offset:offset + len(request.texts)])
+                offset += len(request.texts)
+
+            with self._lock:
+                self._stats["requests"] += len(batch)
+                self._stats["texts"] += len(texts)
+                self._stats["batches"] += 1
+                self._stats["max_batch_texts"] = max(self._stats["max_batch_texts"], len(texts))
+                self._stats["queue_time"] += sum(started - request.enqueued_at for request in batch)
+                self._stats["encode_time"] += finished - started
+
+        # Requests still queued when stop() was called are encoded before exiting
+        while True:
+            try:
+                request = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                request.future.set_result(self._encode(request.texts))
+            except Exception as e:
+                request.future.set_exception(e)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get batch sizes, queueing delay and encode time."""
+        with self._lock:
+            stats = dict(self._stats)
+            requests, batches = stats["requests"], stats["batches"]
+            queue_time = stats.pop("queue_time")
+            encode_time = stats.pop("encode_time")
+            stats.update({
+                "running": bool(self._worker and self._worker.is_alive()),
+                "pending": self._queue.qsize(),
+                "avg_batch_texts": round(stats["texts"] / batches, 2) if batches else 0.0,
+                "avg_requests_per_batch": round(requests / batches, 2) if batches else 0.0,
+                "avg_queue_ms": round(queue_time / requests * 1000, 3) if requests else 0.0,
+                "avg_encode_ms": round(encode_time / batches * 1000, 3) if batches else 0.0,
+                "max_batch": self.max_batch,
+                "max_wait_ms": round(self.max_wait * 1000, 3),
+                "torch_threads": self.torch_threads,
+            })
+            return stats
+
+
+_services: Dict[str, EmbeddingService] = {}
+_services_lock = threading.Lock()
+
+
+def get_embedding_service(model_name: str, model_factory: Callable[[], Any],
+                          config: Optional[Dict[str, Any]] = None) -> EmbeddingService:
+    """
+    Shared, started service for an embedding model (or embedding space), so
+    every component that embeds with the same model uses one copy of it and
+    one worker.
+    """
+    key = model_name.replace('sentence-transformers/', '')
+    with _services_lock:
+        service = _services.get(key)
+        if service is None:
+            config = config or {}
+            service = EmbeddingService(
+                model_factory(),
+                max_batch=config.get('max_batch', 32),
+                max_wait_ms=config.get('max_wait_ms', 2.0),
+                torch_threads=config.get('torch_threads')
+            )
+            service.start()
+            _services[key] = service
+        return service
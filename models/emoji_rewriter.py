@@ -0,0 +1,233 @@
+"""
+Emoji rewriting for AI Companion application.
+Turns the model's emote tags (``*smile*``, ``*thumbs up*``) and "<name> emoji"
+phrases into emojis with one precompiled matcher, on finished text or
+incrementally on a token stream.
+"""
+
+import re
+from typing import Dict, Optional, Set
+
+# Emote tag (case-insensitive, without the asterisks) -> emoji
+EMOTE_EMOJIS: Dict[str, str] = {
+    # Faces and emotions
+    'smile': '😊', 'smiles': '😊', 'smiling': '😊', 'happy': '😊',
+    'grin': '😄', 'grins': '😄',
+    'laugh': '😂', 'laughs': '😂',
+    'giggle': '😄', 'giggles': '😄',
+    'wink': '😉', 'winks': '😉',
+    'blush': '😊', 'blushing': '😊',
+    'excited': '🤩', 'excitement': '🤩',
+    'love': '💕', 'heart': '❤️', 'hearts': '💕',
+    'crying': '😢', 'sad': '😢', 'worried': '😟',
+    'thinking': '🤔', 'confused': '😕', 'surprised': '😮',
+    'shock': '😱', 'shocked': '😱',
+    'curious': '🤔', 'interested': '😊',
+    'sleepy': '😴', 'tired': '😴',
+
+    # Gestures and actions
+    'thumbs up': '👍',
+    'wave': '👋', 'waves': '👋', 'waving': '👋',
+    'clap': '👏', 'claps': '👏', 'clapping': '👏', 'applause': '👏',
+    'hug': '🤗', 'hugs': '🤗', 'hugging': '🤗',
+    'kiss': '😘',
+    'nod': '👍', 'nods': '👍', 'nodding': '👍',
+    'shrug': '🤷', 'shrugs': '🤷',
+    'peace': '✌️',
+
+    # Objects and symbols
+    'sparkle': '✨', 'sparkles': '✨',
+    'star': '⭐', 'stars': '⭐',
+    'fire': '🔥', 'rainbow': '🌈', 'sun': '☀️', 'moon': '🌙',
+    'flower': '🌸', 'flowers': '🌸',
+    'music': '🎵', 'coffee': '☕',
+    'book': '📚', 'books': '📚',
+
+    # Activities
+    'dance': '💃', 'dancing': '💃',
+    'party': '🎉', 'celebrate': '🎉', 'celebration': '🎉',
+    'game': '🎮', 'gaming': '🎮',
+    'art': '🎨',
+    'cook': '🍳', 'cooking': '🍳',
+
+    # Nature and animals
+    'cat': '🐱', 'dog': '🐶', 'bird': '🐦',
+    'tree': '🌳', 'ocean': '🌊', 'mountain': '⛰️',
+}
+
+# Emoji words written without asterisks (matched on word boundaries)
+PHRASE_EMOJIS: Dict[str, str] = {
+    'smile emoji': '😊',
+    'heart emoji': '❤️',
+    'laugh emoji': '😂',
+    'wink emoji': '😉',
+    'thumbsup emoji': '👍',
+    'thumbsdown emoji': '👎',
+    'wave emoji': '👋',
+}
+
+# Runs of emoji code points, as counted by the avatar emoji limit
+EMOJI_PATTERN = re.compile(
+    r'[\U0001F600-\U0001F64F\U0001F300-\U0001F5FF\U0001F680-\U0001F6FF\U0001F1E0-\U0001F1FF'
+    r'\U00002702-\U000027B0\U000024C2-\U0001F251]+'
+)
+
+
+class EmojiRewriter:
+    """
+    Single-pass emote-to-emoji rewriter.
+
+    All tags and phrases are folded into one case-insensitive alternation
+    (longest first), so a response is scanned once instead of once per tag.
+    """
+
+    def __init__(self, emotes: Optional[Dict[str, str]] = None, phrases: Optional[Dict[str, str]] = None):
+        self.emotes = {tag.lower(): emoji for tag, emoji in (emotes or EMOTE_EMOJIS).items()}
+        self.phrases = {phrase.lower(): emoji for phrase, emoji in (phrases or PHRASE_EMOJIS).items()}
+
+        def alternation(words):
+            return "|".join(re.escape(word) for word in sorted(words, key=len, reverse=True))
+
+        self.pattern = re.compile(
+            rf"\*({alternation(self.emotes)})\*|\b({alternation(self.phrases)})\b",
+            re.IGNORECASE
+        )
+
+        # Lower-cased text a stream may end on while a match is still possible
+        candidates = [f"*{tag}*" for tag in self.emotes] + list(self.phrases)
+        self.partial_matches: Set[str] = set()
+        for candidate in candidates:
+            # Emotes are complete once closed; phrases still need the next character
+            # to rule out a longer word ("smile emojis")
+            end = len(candidate) if candidate in self.phrases else len(candidate) - 1
+            for length in range(1, end + 1):
+                self.partial_matches.add(candidate[:length])
+        self.max_match_length = max(len(candidate) for candidate in candidates)
+        self.phrase_initials = {phrase[0] for phrase in self.phrases}
+
+    def replacement(self, match: "re.Match") -> str:
+        tag, phrase = match.group(1), match.group(2)
+        if tag is not None:
+            return self.emotes[tag.lower()]
+        return self.phrases[phrase.lower()]
+
+    def rewrite(self, text: str) -> str:
+        """Replace every emote tag and emoji phrase in ``text``."""
+        if not text:
+            return text
+        return self.pattern.sub(self.replacement, text)
+
+    def stream(self) -> "EmojiStreamRewriter":
+        """Create an incremental rewriter for one token stream."""
+        return EmojiStreamRewriter(self)
+
+
+class EmojiStreamRewriter:
+    """
+    Incremental rewriter for a token stream.
+
+    ``feed`` returns the text that can be emitted so far, holding back a tail
+    that could still become a tag (``"*thu"``) or phrase; ``flush`` returns
+    whatever is left at the end of the stream. The concatenated output equals
+    ``EmojiRewriter.rewrite`` of the whole text.
+    """
+
+    def __init__(self, rewriter: EmojiRewriter):
+        self.rewriter = rewriter
+        self._buffer = ""
+        # Last character already emitted, kept so word boundaries see across feeds
+        self._previous = ""
+
+    def feed(self, token: str) -> str:
+        rewriter = self.rewriter
+        offset = len(self._previous)
+        text = self._previous + self._buffer + token
+        end = len(text)
+
+        # Earliest position whose tail may still grow into a match
+        hold = end
+        for start in range(max(offset, end - rewriter.max_match_length), end):
+            char = text[start]
+            if char != "*":
+                # Phrases only start on a word boundary
+                if char.lower() not in rewriter.phrase_initials:
+                    continue
+                if start and (text[start - 1].isalnum() or text[start - 1] == "_"):
+                    continue
+            if text[start:].lower() in rewriter.partial_matches:
+                hold = start
+                break
+
+        if hold == end and "*" not in token and "emoji" not in text.lower():
+            emitted = text[offset:]
+        else:
+            emitted, hold = self._rewrite(text, offset, hold)
+
+        if hold > offset:
+            self._previous = text[hold - 1]
+        self._buffer = text[hold:]
+        return emitted
+
+    def flush(self) -> str:
+        """Rewrite and return the held-back tail at the end of the stream."""
+        text = self._previous + self._buffer
+        emitted, _ = self._rewrite(text, len(self._previous), len(text))
+        self._buffer = ""
+        self._previous = ""
+        return emitted
+
+    def _rewrite(self, text: str, offset: int, hold: int):
+        """Rewrite ``text[offset:hold]``; a complete match straddling ``hold`` is emitted whole."""
+        rewriter = self.rewriter
+        parts = []
+        last = offset
+        for match in rewriter.pattern.finditer(text, offset):
+            if match.start() >= hold:
+                break
+            parts.append(text[last:match.start()])
+            parts.append(rewriter.replacement(match))
+            last = match.end()
+        hold = max(hold, last)
+        parts.append(text[last:hold])
+        return "".join(parts), hold
+
+
+def limit_emojis(text: str, max_emojis: int, pattern: "re.Pattern" = EMOJI_PATTERN) -> str:
+    """
+    Keep the first ``max_emojis`` emoji characters of ``text`` in one pass.
+
+    Text with at most ``max_emojis`` emoji runs is returned unchanged.
+    """
+    # Splitting on a capturing group yields [text, run, text, run, ...] in one scan
+    parts = _capturing(pattern).split(text)
+    if len(parts) // 2 <= max_emojis:
+        return text
+
+    kept = 0
+    for index in range(1, len(parts), 2):
+        allowed = parts[index][:max(0, max_emojis - kept)]
+        kept += len(allowed)
+        parts[index] = allowed
+    return "".join(parts).strip()
+
+
+_capturing_patterns: Dict[str, "re.Pattern"] = {}
+
+
+def _capturing(pattern: "re.Pattern") -> "re.Pattern":
+    """Capturing-group variant of an emoji pattern, compiled once."""
+    compiled = _capturing_patterns.get(pattern.pattern)
+    if compiled is None:
+        compiled = _capturing_patterns[pattern.pattern] = re.compile(f"({pattern.pattern})", pattern.flags)
+    return compiled
+
+
+_default_rewriter: Optional[EmojiRewriter] = None
+
+
+def get_emoji_rewriter() -> EmojiRewriter:
+    """Shared rewriter with the default tag tables (compiled on first use)."""
+    global _default_rewriter
+    if _default_rewriter is None:
+        _default_rewriter = EmojiRewriter()
+    return _default_rewriter
@@ -7,29 +7,53 @@ intelligent caching, and memory integration.
 import logging
 import json
 import time
-import hashlib
 import os
 import sys
 from typing import Dict, List, Optional, Generator, Any
 from pathlib import Path
+import queue
 import threading
+from concurrent.futures import CancelledError, ThreadPoolExecutor
 from dataclasses import dataclass
 
 # Add the src directory to Python path for absolute imports
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
 try:
-    from llama_cpp import Llama, LlamaGrammar
+    from llama_cpp import Llama, LlamaGrammar, StoppingCriteriaList
 except ImportError:
     Llama = None
     LlamaGrammar = None
+    StoppingCriteriaList = None
+
+try:
+    from llama_cpp.llama_speculative import LlamaPromptLookupDecoding
+except ImportError:
+    LlamaPromptLookupDecoding = None
 
 from .memory_system import MemorySystem
-from utils.system_detector import SystemDetector
+from .llm_scheduler import LLMScheduler, RequestPriority
+from .llm_cancellation import CancellationRegistry, CancellationToken
+from .llm_lifecycle import ModelLifecycleManager
+from .llm_prefix_cache import PromptPrefixCache
+from .llm_state_store import SessionStateStore, get_model_signature
+from .llm_worker_pool import LLMWorkerPool
+from .llm_response_cache import ResponseCache
+from .prompt_assembler import PromptAssembler, PromptSection
+from .post_response_queue import PostResponseQueue
+from .emoji_rewriter import get_emoji_rewriter
+from .embedding_backends import embedding_space, load_embedding_model, resolve_embedding_backend
+from .embedding_service import EmbeddingService, get_embedding_service
+from .text_analyzer import TextFeatures, get_text_analyzer
+from utils.system_detector import KV_CACHE_GGML_TYPES, KV_CACHE_PRESETS, SystemDetector, kv_cache_llama_kwargs
 from utils.model_downloader import ModelDownloader
 from databases.database_manager import DatabaseManager
 
 
+# Marks the end of a token stream handed over from a decode slot
+_STREAM_END = object()
+
+
 @dataclass
 class ConversationContext:
     """Holds conversation context and state."""
@@ -39,6 +63,10 @@ class ConversationContext:
     bonding_progress: Dict[str, Any]
     avatar_state: Dict[str, Any]
     max_context_length: int = 4096
+    model_personality: Optional[Dict[str, Any]] = None
+    memory_context: str = ""
+    prompt_prefix: str = ""
+    prompt_usage: Optional[Dict[str, Any]] = None
 
 
 class EnhancedLLMHandler:
@@ -50,20 +78,91 @@ class EnhancedLLMHandler:
         self.logger = logging.getLogger(__name__)
         self.config_path = config_path
         self.db_manager = db_manager or DatabaseManager()
+        self.config = self._load_config()
+        llm_config = self.config.get('integrated_models', {}).get('llm', {})
         
         # Initialize memory system
-        self.memory_system = MemorySystem(self.db_manager)
+        self.memory_system = MemorySystem(
+            self.db_manager,
+            access_tracking=llm_config.get('memory_access_tracking', {}),
+            context_cache=llm_config.get('memory_cache', {}),
+            consolidation=llm_config.get('memory_consolidation', {})
+        )
+        
+        # One-pass message analysis shared by memory extraction, bonding XP and personality
+        self.text_analyzer = get_text_analyzer()
+        
+        # Write-behind queue for conversation storage, memory extraction and bonding updates
+        post_response_config = llm_config.get('post_response_queue', {})
+        self.post_response_queue: Optional[PostResponseQueue] = None
+        self.post_response_read_timeout = float(post_response_config.get('read_timeout', 2.0))
+        if post_response_config.get('enabled', True):
+            self.post_response_queue = self._create_post_response_queue(post_response_config)
         
         # Model management
         self.model = None
         self.model_path = None
         self.model_loaded = False
         self.loading_lock = threading.Lock()
-        self.generation_lock = threading.Lock()  # Add generation lock for thread safety
         
-        # Response caching
-        self.enable_caching = True
-        self.cache_ttl_hours = 24
+        # Request scheduling - generations are queued and dispatched to decode slots
+        scheduler_config = llm_config.get('scheduler', {})
+        self.parallel_slots = int(scheduler_config.get('parallel_slots', 1))
+        self.max_queue_size = int(scheduler_config.get('max_queue_size', 64))
+        self.max_preemptions = int(scheduler_config.get('max_preemptions', 3))
+        self.scheduler: Optional[LLMScheduler] = None
+        # Requests past lifecycle.touch(); an idle unload waits for them to finish
+        self._requests_in_flight = 0
+        self._requests_lock = threading.Lock()
+        self.optimization_flags: Dict[str, Any] = {}
+        
+        # Opt-in prompt-lookup speculative decoding (per-tier presets from SystemDetector)
+        self.speculative_config = llm_config.get('speculative_decoding', {})
+        
+        # KV cache type, flash attention, batch sizes and context shift (per-tier presets from SystemDetector)
+        self.kv_cache_config = llm_config.get('kv_cache', {})
+        
+        # Where decoding runs: "in_process" or "worker_pool" (dedicated processes)
+        self.backend = llm_config.get('backend', 'in_process')
+        self.worker_pool_config = llm_config.get('worker_pool', {})
+        self.worker_pool: Optional[LLMWorkerPool] = None
+        
+        # Evaluated static prompt prefixes, restored with load_state on a new turn
+        prefix_cache_config = llm_config.get('prefix_cache', {})
+        self.prefix_cache: Optional[PromptPrefixCache] = None
+        if prefix_cache_config.get('enabled', True):
+            self.prefix_cache = PromptPrefixCache(
+                max_entries=prefix_cache_config.get('max_entries', 8),
+                max_size_mb=prefix_cache_config.get('max_size_mb', 512)
+            )
+        
+        # Per-session context snapshots persisted to disk when a session leaves its slot or goes idle
+        session_state_config = llm_config.get('session_state', {})
+        self.session_idle_seconds = int(session_state_config.get('idle_seconds', 300))
+        self.state_store: Optional[SessionStateStore] = None
+        if session_state_config.get('enabled', True):
+            self.state_store = self._create_state_store(session_state_config)
+        self._slot_sessions: Dict[int, Dict[str, Any]] = {}
+        self._session_sweeper_stop = threading.Event()
+        self._session_sweeper: Optional[threading.Thread] = None
+        
+        # Response caching: in-process LRU + SQLite, optional similarity lookup
+        cache_config = llm_config.get('response_cache', {})
+        semantic_config = cache_config.get('semantic', {})
+        self.enable_caching = cache_config.get('enabled', True)
+        self.cache_ttl_hours = cache_config.get('ttl_hours', 24)
+        self.response_cache = ResponseCache(
+            self.db_manager,
+            ttl_hours=self.cache_ttl_hours,
+            memory_entries=cache_config.get('memory_entries', 256),
+            max_entries=cache_config.get('max_entries', 5000),
+            purge_interval=cache_config.get('purge_interval', 600),
+            semantic_threshold=semantic_config.get('threshold', 0.92) if semantic_config.get('enabled', False) else None,
+            semantic_max_entries=semantic_config.get('max_entries', 200),
+            embed_fn=self._embed_for_cache if semantic_config.get('enabled', False) else None
+        )
+        self.response_cache.start()
+        self._cache_embedder = None
         
         # System detection and optimization
         self.system_detector = SystemDetector()
@@ -75,8 +174,41 @@ class EnhancedLLMHandler:
         self.top_p = 0.9
         self.context_length = self.system_detector.capabilities.get("max_context_length", 2048)
         
+        # Background warm-up after each load; idle auto-unload on low-RAM tiers
+        lifecycle_config = llm_config.get('lifecycle', {})
+        idle_unload_minutes = lifecycle_config.get('idle_unload_minutes', 15)
+        idle_unload_tiers = lifecycle_config.get('idle_unload_tiers')
+        tier = self.system_detector.capabilities.get("performance_tier", "low")
+        if idle_unload_tiers is not None and tier not in idle_unload_tiers:
+            idle_unload_minutes = None
+        self.lifecycle = ModelLifecycleManager(
+            self._unload_idle_model,
+            self._has_pending_work,
+            idle_unload_seconds=idle_unload_minutes * 60 if idle_unload_minutes else None,
+            warmup_mode=lifecycle_config.get('warmup', 'page_in')
+        )
+        self.lifecycle.start()
+        
         # Session management
         self.active_sessions = {}
+        
+        # Per-turn context reads (history, profile, bonding, memories...) run concurrently; the
+        # pool is sized on first use to one worker per fetch unless context_fetch.max_workers is set
+        self.context_fetch_workers = llm_config.get('context_fetch', {}).get('max_workers')
+        self._context_executor: Optional[ThreadPoolExecutor] = None
+        self._context_executor_lock = threading.Lock()
+        self.last_context_fetch_ms: Optional[float] = None
+        
+        # Emote tag -> emoji rewriting (shared precompiled matcher)
+        self.emoji_rewriter = get_emoji_rewriter()
+        
+        # In-flight generation per client (SocketIO sid / HTTP client key)
+        self.cancellations = CancellationRegistry()
+        
+        # Token accounting for prompt assembly (uses the model tokenizer once loaded)
+        self._tokenizer_model = None
+        self.prompt_assembler = PromptAssembler(self._tokenize_for_budget)
+        self.last_prompt_usage: Optional[Dict[str, Any]] = None
     
     def initialize_model(self, force_reload: bool = False) -> bool:
         """Initialize the LLM model with optimal settings."""
@@ -109,56 +241,48 @@ class EnhancedLLMHandler:
                 
                 # Get optimization flags based on system
                 optimization_flags = self.system_detector.get_optimization_flags()
+                optimization_flags["speculative_decoding"] = self._resolve_speculative_decoding(
+                    optimization_flags.get("speculative_decoding")
+                )
+                optimization_flags["kv_cache"] = self._resolve_kv_cache(optimization_flags.get("kv_cache"))
                 
                 self.logger.info(f"Loading LLM model: {model_path}")
                 self.logger.info(f"Optimization flags: {optimization_flags}")
                 
-                # Initialize model with optimizations and terminal interference prevention
-                import sys
-                import os
-                from contextlib import redirect_stdout, redirect_stderr
-                
-                # Temporarily disable terminal manipulation and redirect output
-                old_stdout = sys.stdout
-                old_stderr = sys.stderr
+                # (Re)start the request scheduler on top of the loaded model
+                self._stop_scheduler()
                 
-                try:
-                    with open(os.devnull, 'w') as devnull:
-                        with redirect_stdout(devnull), redirect_stderr(devnull):
-                            # Set environment variables to prevent terminal manipulation
-                            old_term = os.environ.get('TERM')
-                            old_terminfo = os.environ.get('TERMINFO')
-                            os.environ['TERM'] = 'dumb'  # Use dumb terminal to prevent escape sequences
-                            if 'TERMINFO' in os.environ:
-                                del os.environ['TERMINFO']
-                            
-                            try:
-                                self.model = Llama(
-                                    model_path=str(model_path),
-                                    n_ctx=self.context_length,
-                                    n_threads=optimization_flags["n_threads"],
-                                    n_gpu_layers=optimization_flags.get("n_gpu_layers", 0),
-                                    use_mmap=optimization_flags.get("use_mmap", True),
-                                    use_mlock=optimization_flags.get("use_mlock", False),
-                                    verbose=False
-                                )
-                            finally:
-                                # Restore terminal environment
-                                if old_term is not None:
-                                    os.environ['TERM'] = old_term
-                                else:
-                                    os.environ.pop('TERM', None)
-                                if old_terminfo is not None:
-                                    os.environ['TERMINFO'] = old_terminfo
-                finally:
-                    # Ensure stdout/stderr are restored
-                    sys.stdout = old_stdout
-                    sys.stderr = old_stderr
+                load_started = time.perf_counter()
+                if self.backend == 'worker_pool':
+                    self.model = self._start_worker_pool(model_path, optimization_flags)
+                else:
+                    self.model = self._create_llama(model_path, optimization_flags)
                 
                 self.model_path = model_path
+                self.optimization_flags = optimization_flags
+                self._tokenizer_model = self._create_tokenizer_model(model_path)
                 self.model_loaded = True
                 
-                self.logger.info("✅ LLM model loaded successfully")
+                if self.state_store:
+                    self.state_store.set_model_signature(get_model_signature(str(model_path), self.model.n_ctx()))
+                    self._start_session_sweeper()
+                if self.prefix_cache:
+                    self.prefix_cache.clear()  # States belong to the previous model
+                self.scheduler = LLMScheduler(
+                    self._create_slot_model,
+                    parallel_slots=self.worker_pool.size if self.worker_pool else self.parallel_slots,
+                    max_queue_size=self.max_queue_size,
+                    max_preemptions=self.max_preemptions
+                )
+                self.scheduler.start()
+                
+                load_time = time.perf_counter() - load_started
+                self.lifecycle.record_load(load_time)
+                # The weights are still mostly on disk; page them in before the first prompt
+                if not optimization_flags.get("use_mlock", False):
+                    self.lifecycle.start_warmup(model_path, self._warm_up_model)
+                
+                self.logger.info(f"✅ LLM model loaded successfully in {load_time:.2f}s")
                 return True
                 
             except Exception as e:
@@ -167,27 +291,407 @@ class EnhancedLLMHandler:
                 self.model_loaded = False
                 return False
     
+    def _load_config(self) -> Dict[str, Any]:
+        """Load application configuration, falling back to built-in defaults."""
+        try:
+            from config.config_manager import ConfigManager
+            return ConfigManager().load_config() or {}
+        except Exception as e:
+            self.logger.warning(f"Could not load configuration, using LLM defaults: {e}")
+            return {}
+    
+    def _resolve_speculative_decoding(self, tier_preset: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Combine the tier's speculative decoding preset with the user configuration."""
+        config = self.speculative_config
+        if not config.get('enabled', False):
+            return None
+        
+        tier = self.system_detector.capabilities.get("performance_tier", "low")
+        enabled_tiers = config.get('tiers')
+        if enabled_tiers is not None and tier not in enabled_tiers:
+            self.logger.info(f"Speculative decoding not enabled for the '{tier}' tier")
+            return None
+        if tier_preset is None and enabled_tiers is None:
+            return None
+        
+        settings = dict(tier_preset or {"mode": "prompt_lookup", "num_pred_tokens": 2, "max_ngram_size": 2})
+        for key in ("num_pred_tokens", "max_ngram_size"):
+            if config.get(key) is not None:
+                settings[key] = int(config[key])
+        
+        if settings.get("mode") != "prompt_lookup":
+            self.logger.warning(f"Unsupported speculative decoding mode: {settings.get('mode')}")
+            return None
+        if LlamaPromptLookupDecoding is None:
+            self.logger.warning("Speculative decoding requested but llama-cpp-python lacks prompt lookup support")
+            return None
+        return settings
+    
+    def _resolve_kv_cache(self, tier_preset: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """Combine the tier's KV cache preset with the user configuration."""
+        config = self.kv_cache_config
+        name = config.get('preset') or (tier_preset or {}).get('preset') or "f16"
+        if name not in KV_CACHE_PRESETS:
+            self.logger.warning(f"Unknown KV cache preset '{name}', using f16")
+            name = "f16"
+        settings = {"preset": name, **KV_CACHE_PRESETS[name]}
+        for key in ("type_k", "type_v", "flash_attn", "n_batch", "n_ubatch", "context_shift", "min_reply_tokens"):
+            if config.get(key) is not None:
+                settings[key] = config[key]
+        
+        for key in ("type_k", "type_v"):
+            if settings[key] not in KV_CACHE_GGML_TYPES:
+                self.logger.warning(f"Unsupported KV cache {key} '{settings[key]}', using f16")
+                settings[key] = "f16"
+        if settings["context_shift"] not in ("trim_prompt", "truncate_reply"):
+            self.logger.warning(f"Unknown context_shift '{settings['context_shift']}', using trim_prompt")
+            settings["context_shift"] = "trim_prompt"
+        if settings["type_v"] != "f16" and not settings["flash_attn"]:
+            self.logger.info("A quantized V cache needs flash attention; enabling it")
+            settings["flash_attn"] = True
+        return settings
+    
+    def _reply_token_reserve(self) -> int:
+        """Tokens kept free for the reply when the prompt is fitted into the context."""
+        kv_cache = self.optimization_flags.get("kv_cache") or {}
+        if kv_cache.get("context_shift") == "truncate_reply":
+            return min(self.max_tokens, int(kv_cache.get("min_reply_tokens", 128)))
+        return self.max_tokens
+    
+    def _reply_max_tokens(self, prompt_usage: Optional[Dict[str, Any]]) -> int:
+        """Reply length for a generation: with truncate_reply, whatever the prompt left free."""
+        if not prompt_usage or prompt_usage["max_tokens"] >= self.max_tokens:
+            return self.max_tokens
+        room = prompt_usage["context_length"] - prompt_usage["used"] - self.prompt_assembler.safety_margin
+        return max(prompt_usage["max_tokens"], min(self.max_tokens, room))
+    
+    def _build_llama_kwargs(self, optimization_flags: Dict[str, Any]) -> Dict[str, Any]:
+        """Translate optimization flags into llama.cpp constructor arguments."""
+        kwargs = {
+            "n_ctx": self.context_length,
+            "n_threads": optimization_flags["n_threads"],
+            "n_gpu_layers": optimization_flags.get("n_gpu_layers", 0),
+            "use_mmap": optimization_flags.get("use_mmap", True),
+            "use_mlock": optimization_flags.get("use_mlock", False),
+        }
+        
+        if optimization_flags.get("kv_cache"):
+            kwargs.update(kv_cache_llama_kwargs(optimization_flags["kv_cache"]))
+        
+        speculative = optimization_flags.get("speculative_decoding")
+        if speculative and LlamaPromptLookupDecoding is not None:
+            # Drafts n-grams from the prompt, which companion replies echo a lot
+            kwargs["draft_model"] = LlamaPromptLookupDecoding(
+                num_pred_tokens=speculative["num_pred_tokens"],
+                max_ngram_size=speculative.get("max_ngram_size", 2)
+            )
+        return kwargs
+    
+    def _create_llama(self, model_path: Path, optimization_flags: Dict[str, Any]):
+        """Create a llama.cpp context for the model without letting it touch the terminal."""
+        from contextlib import redirect_stdout, redirect_stderr
+        
+        # Temporarily disable terminal manipulation and redirect output
+        old_stdout = sys.stdout
+        old_stderr = sys.stderr
+        
+        try:
+            with open(os.devnull, 'w') as devnull:
+                with redirect_stdout(devnull), redirect_stderr(devnull):
+                    # Set environment variables to prevent terminal manipulation
+                    old_term = os.environ.get('TERM')
+                    old_terminfo = os.environ.get('TERMINFO')
+                    os.environ['TERM'] = 'dumb'  # Use dumb terminal to prevent escape sequences
+                    if 'TERMINFO' in os.environ:
+                        del os.environ['TERMINFO']
+                    
+                    try:
+                        llama_model = Llama(
+                            model_path=str(model_path),
+                            verbose=False,
+                            **self._build_llama_kwargs(optimization_flags)
+                        )
+                    finally:
+                        # Restore terminal environment
+                        if old_term is not None:
+                            os.environ['TERM'] = old_term
+                        else:
+                            os.environ.pop('TERM', None)
+                        if old_terminfo is not None:
+                            os.environ['TERMINFO'] = old_terminfo
+        finally:
+            # Ensure stdout/stderr are restored
+            sys.stdout = old_stdout
+            sys.stderr = old_stderr
+        
+        return llama_model
+    
+    def _warm_up_model(self):
+        """One-token decode on a slot: touches every weight and allocates compute buffers."""
+        def warm(model):
+            model.eval(model.tokenize(b"Hello"))
+            model.reset()
+        
+        self.scheduler.run(warm, priority=RequestPriority.BACKGROUND, preemptible=False)
+    
+    def _has_pending_work(self) -> bool:
+        """True while a request is being handled or the scheduler has queued or running work."""
+        scheduler = self.scheduler
+        return self._requests_in_flight > 0 or (scheduler is not None and not scheduler.is_idle())
+    
+    def _begin_request(self) -> None:
+        """Hold off idle unloads until ``_end_request``; waits for an unload already under way."""
+        with self._requests_lock:
+            self._requests_in_flight += 1
+    
+    def _end_request(self) -> None:
+        with self._requests_lock:
+            self._requests_in_flight -= 1
+    
+    def _require_scheduler(self) -> LLMScheduler:
+        """The running scheduler, reloading the model if it was unloaded since the caller checked."""
+        scheduler = self.scheduler
+        if scheduler is None:
+            if not self.initialize_model() or self.scheduler is None:
+                raise RuntimeError("LLM model is not available")
+            scheduler = self.scheduler
+        return scheduler
+    
+    def _unload_idle_model(self) -> bool:
+        """Unload the model for the lifecycle monitor unless a request arrived meanwhile."""
+        # Holding _requests_lock keeps new requests from starting until the unload is done;
+        # they then see the model unloaded and reload it
+        with self.loading_lock, self._requests_lock:
+            if not self.model_loaded or self._has_pending_work():
+                return False
+            if self.lifecycle.idle_seconds() < self.lifecycle.idle_unload_seconds:
+                return False
+            self._unload_model_locked()
+            return True
+    
+    def _create_slot_model(self, slot_index: int):
+        """Provide the llama.cpp context for a scheduler decode slot."""
+        if self.worker_pool:
+            return self.worker_pool.workers[slot_index]
+        if slot_index == 0:
+            return self.model
+        
+        # Extra slots get their own context (KV cache) but always mmap the GGUF,
+        # so the weights are shared through the page cache instead of copied.
+        slot_flags = dict(self.optimization_flags)
+        slot_flags["use_mmap"] = True
+        slot_flags["use_mlock"] = False
+        self.logger.info(f"Creating LLM decode slot {slot_index}")
+        return self._create_llama(self.model_path, slot_flags)
+    
+    def _create_state_store(self, session_state_config: Dict[str, Any]) -> Optional[SessionStateStore]:
+        """Create the on-disk session snapshot store under the user cache directory."""
+        try:
+            from config.config_manager import get_cache_path
+            return SessionStateStore(
+                get_cache_path('llm_state'),
+                max_size_mb=session_state_config.get('max_size_mb', 2048),
+                max_pending=session_state_config.get('max_pending', 2)
+            )
+        except Exception as e:
+            self.logger.warning(f"LLM session snapshots disabled: {e}")
+            return None
+
+    def _create_post_response_queue(self, post_response_config: Dict[str, Any]) -> Optional[PostResponseQueue]:
+        """Create and start the write-behind queue for post-response bookkeeping."""
+        try:
+            post_response_queue = PostResponseQueue(
+                self.db_manager.get_conversations_connection,
+                batch_size=post_response_config.get('batch_size', 64),
+                flush_interval=post_response_config.get('flush_interval', 0.2),
+                max_attempts=post_response_config.get('max_attempts', 5)
+            )
+            post_response_queue.register("conversation_turn", self._apply_conversation_turns,
+                                         after_commit=self._finish_conversation_turns)
+            post_response_queue.register("chat_history", self._apply_chat_history,
+                                         after_commit=self._finish_chat_history)
+            post_response_queue.start()
+            return post_response_queue
+        except Exception as e:
+            self.logger.warning(f"Post-response queue disabled, bookkeeping runs inline: {e}")
+            return None
+
+    def _create_tokenizer_model(self, model_path: Path):
+        """Model used for prompt token accounting in this process."""
+        if not self.worker_pool:
+            return self.model
+        # Worker proxies serialize calls behind generation, so load just the vocabulary here
+        try:
+            return Llama(model_path=str(model_path), vocab_only=True, verbose=False)
+        except Exception as e:
+            self.logger.warning(f"Could not load tokenizer, estimating prompt tokens: {e}")
+            return None
+    
+    def _tokenize_for_budget(self, text: str) -> List[int]:
+        """Tokenize prompt text for budgeting, estimating when no tokenizer is loaded."""
+        if self._tokenizer_model is None:
+            return [0] * (len(text) // 4 + 1)
+        return self._tokenizer_model.tokenize(text.encode("utf-8"), add_bos=False, special=True)
+    
+    def _start_worker_pool(self, model_path: Path, optimization_flags: Dict[str, Any]):
+        """Start the worker processes and return the proxy for the first one."""
+        if self.worker_pool:
+            self.worker_pool.shutdown()
+        self.worker_pool = LLMWorkerPool(
+            str(model_path),
+            self._build_llama_kwargs(optimization_flags),
+            size=self.worker_pool_config.get('size', 1),
+            threads_per_worker=self.worker_pool_config.get('threads_per_worker'),
+            health_check_interval=self.worker_pool_config.get('health_check_interval', 15),
+            startup_timeout=self.worker_pool_config.get('startup_timeout', 300)
+        )
+        self.worker_pool.start()
+        return self.worker_pool.workers[0]
+    
+    def _stop_scheduler(self):
+        """Stop the scheduler and persist the sessions its slots were holding."""
+        if not self.scheduler:
+            return
+        slot_models = self.scheduler.get_slot_models()
+        self.scheduler.shutdown()
+        self.scheduler = None
+        for model in slot_models:
+            self._persist_slot_session(model)
+        self._slot_sessions.clear()
+        if self.state_store:
+            self.state_store.flush()
+    
+    def _prepare_session_state(self, model, session_key: tuple) -> bool:
+        """
+        Switch a slot context to a session, handing the session it held before to the
+        background snapshot writer. Returns True when the context now holds the
+        session (already resident or restored), so its prompt prefix is in place.
+        """
+        if self.state_store is None:
+            return False
+        resident = self._slot_sessions.get(id(model))
+        if resident and resident["key"] == session_key:
+            return True
+        if resident:
+            self._persist_slot_session(model)
+        try:
+            state = self.state_store.load(session_key)
+            if state is not None:
+                model.load_state(state)
+                return True
+        except Exception as e:
+            self.logger.warning(f"Could not restore LLM session state: {e}")
+        return False
+    
+    def _mark_session_resident(self, model, session_key: tuple) -> None:
+        """Record that a slot context now holds an unsaved turn of a session."""
+        if self.state_store is not None:
+            scheduler = self.scheduler
+            slot = scheduler.current_slot() if scheduler else None
+            self._slot_sessions[id(model)] = {"key": session_key, "dirty": True, "last_active": time.time(),
+                                              "slot": slot}
+    
+    def _persist_slot_session(self, model, idle_only: bool = False) -> None:
+        """
+        Snapshot the session held by a slot context if it has unsaved turns. Only the
+        in-memory copy is taken here; pickling and the disk write happen on the
+        state store's writer thread.
+        """
+        resident = self._slot_sessions.get(id(model))
+        if self.state_store is None or not resident or not resident["dirty"]:
+            return
+        if idle_only and time.time() - resident["last_active"] < self.session_idle_seconds:
+            return
+        try:
+            if self.state_store.save_async(resident["key"], model.save_state()):
+                resident["dirty"] = False
+        except Exception as e:
+            self.logger.warning(f"Could not snapshot LLM session state: {e}")
+    
+    def _start_session_sweeper(self):
+        """Start the background thread that snapshots idle sessions."""
+        if self._session_sweeper and self._session_sweeper.is_alive():
+            return
+        self._session_sweeper_stop.clear()
+        self._session_sweeper = threading.Thread(
+            target=self._session_sweeper_loop, name="llm-session-sweeper", daemon=True
+        )
+        self._session_sweeper.start()
+    
+    def _session_sweeper_loop(self):
+        """Queue a background snapshot job on the slot of each session that has gone idle."""
+        interval = max(5, min(60, self.session_idle_seconds))
+        while not self._session_sweeper_stop.wait(interval):
+            scheduler = self.scheduler
+            if not scheduler:
+                continue
+            now = time.time()
+            for resident in list(self._slot_sessions.values()):
+                if (not resident["dirty"] or resident["slot"] is None
+                        or now - resident["last_active"] < self.session_idle_seconds):
+                    continue
+                # Snapshots must be taken on the slot's own thread, against the context holding the session
+                try:
+                    scheduler.submit(lambda model: self._persist_slot_session(model, idle_only=True),
+                                     priority=RequestPriority.BACKGROUND, preemptible=False,
+                                     slot=resident["slot"])
+                except Exception as e:
+                    self.logger.debug(f"Skipping idle session snapshot: {e}")
+    
+    def _build_stopping_criteria(self, cancel_token: Optional[CancellationToken] = None,
+                                 preemptible: bool = True):
+        """
+        Stopping criteria that ends decoding when the generation is cancelled or,
+        if ``preemptible``, when the scheduler preempts it.
+        
+        Streams are not preemptible: tokens already sent can't be taken back, so a
+        requeued stream would repeat them.
+        """
+        if StoppingCriteriaList is None:
+            return None
+        if preemptible and self.scheduler:
+            scheduler = self.scheduler
+            return StoppingCriteriaList([lambda input_ids, logits: scheduler.should_stop()])
+        if cancel_token is not None:
+            return StoppingCriteriaList([lambda input_ids, logits: cancel_token.cancelled])
+        return None
+    
     def generate_response(self, user_input: str, user_id: str = "default_user", 
                          streaming: bool = False, session_id: str = "default", 
-                         model_id: str = "default") -> str | Generator[str, None, None]:
+                         model_id: str = "default",
+                         priority: RequestPriority = RequestPriority.INTERACTIVE,
+                         cancel_token: Optional[CancellationToken] = None) -> str | Generator[str, None, str]:
         """
         Generate a response using the LLM with memory and personality context.
-        Now supports model-specific isolation.
+        Now supports model-specific isolation. ``priority`` selects the scheduler
+        lane; autonomous and background requests yield to interactive chat.
+        Cancelling ``cancel_token`` stops decoding and frees the slot; the reply is
+        then empty (or the partial stream) and nothing is cached or stored.
         """
-        if not self.model_loaded:
-            if not self.initialize_model():
-                return "I'm sorry, I'm not available right now. Please try again later."
-        
+        # Marks activity before the load check so an idle unload can't slip in between;
+        # an idle-unloaded model is reloaded here. loading_lock is only taken when the
+        # model isn't loaded, so concurrent requests don't serialize on it.
+        self.lifecycle.touch()
+        self._begin_request()
         try:
-            # Check cache first (if enabled and not streaming)
-            if self.enable_caching and not streaming:
-                cached_response = self._check_cache(user_input, user_id, model_id)
+            if not self.model_loaded and not self.initialize_model():
+                return "I'm sorry, I'm not available right now. Please try again later."
+            
+            # Check cache first (if enabled)
+            if self.enable_caching:
+                cached_response = self._check_cache(user_input, user_id, model_id, priority)
                 if cached_response:
                     self.logger.info("🔄 Returning cached response")
                     # Still update conversation state for cached responses
                     self._store_conversation_only(user_id, user_input, cached_response, session_id, model_id)
+                    if streaming:
+                        return self._stream_cached_response(cached_response)
                     return cached_response
             
+            # A superseded request can be dropped before any context is read
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
+            
             # Build conversation context with memory
             context = self._build_enhanced_conversation_context(user_id, session_id, user_input, model_id)
             
@@ -200,18 +704,31 @@ class EnhancedLLMHandler:
             start_time = time.time()
             
             if streaming:
-                return self._generate_streaming_response(prompt, user_id, user_input, session_id, model_id)
+                return self._generate_streaming_response(prompt, user_id, user_input, session_id, model_id,
+                                                         priority, context.prompt_prefix, context, cancel_token)
             else:
-                # Use generation lock to prevent concurrent access to LLM
-                with self.generation_lock:
-                    response = self.model(
+                # Queue the generation on the scheduler's next free decode slot
+                stopping_criteria = self._build_stopping_criteria(cancel_token)
+                
+                session_key = (user_id, model_id, session_id)
+                
+                def complete(model):
+                    # A restored session already starts with its prefix; re-preparing it could reset the context
+                    if not self._prepare_session_state(model, session_key):
+                        self._prepare_prompt_prefix(model, context.prompt_prefix)
+                    result = model(
                         prompt,
-                        max_tokens=self.max_tokens,
+                        max_tokens=self._reply_max_tokens(context.prompt_usage),
                         temperature=self.temperature,
                         top_p=self.top_p,
                         stop=["Human:", "Assistant:", "\n\n", "User:"],
-                        echo=False
+                        echo=False,
+                        stopping_criteria=stopping_criteria
                     )
+                    self._mark_session_resident(model, session_key)
+                    return result
+                
+                response = self._require_scheduler().run(complete, priority=priority, cancel_token=cancel_token)
                 
                 generated_text = response['choices'][0]['text'].strip()
                 
@@ -223,93 +740,104 @@ class EnhancedLLMHandler:
                 
                 # Cache response (if enabled)
                 if self.enable_caching:
-                    self._cache_response(user_input, user_id, generated_text, model_id)
+                    self._cache_response(user_input, user_id, generated_text, model_id, priority)
                 
                 # Store conversation, extract memories, and update state
                 self._update_enhanced_conversation_state(user_id, user_input, generated_text, context, session_id, model_id)
                 
                 return generated_text
                 
+        except CancelledError:
+            # GenerationCancelled from a slot, or the request was dropped while queued
+            self.logger.info(f"Generation cancelled ({cancel_token.reason if cancel_token else 'unknown'})")
+            return ""
         except Exception as e:
             self.logger.error(f"Error generating response: {e}")
             return "I'm sorry, I'm having trouble understanding. Could you try rephrasing that?"
+        finally:
+            self._end_request()
     
     def _build_enhanced_conversation_context(self, user_id: str, session_id: str, current_input: str, model_id: str = "default") -> ConversationContext:
-        """Build enhanced conversation context with memory integration and model isolation."""
-        try:
-            # Get recent conversation history for this model
-            messages = self.db_manager.get_conversation_history(user_id, model_id, limit=10)
-            
-            # Get session context for this model
-            session_context = self.db_manager.get_conversation_context(user_id, session_id, model_id)
-            
-            # Get personality traits for this model
-            personality_traits = self.db_manager.get_personality_profile(user_id, model_id)
-            
-            # Get relevant memories based on current input for this model
-            relevant_memories = self.memory_system.get_relevant_memories(user_id, current_input, limit=10, model_id=model_id)
-            user_memories = [
-                {
-                    'memory_type': mem.memory_type,
-                    'key_topic': mem.key_topic,
-                    'value_content': mem.value_content,
-                    'importance_score': mem.importance_score
-                }
-                for mem in relevant_memories
-            ]
-            
-            # Get bonding progress for this model
-            bonding_progress = self.db_manager.get_bonding_progress(user_id, model_id)
-            
-            # Get avatar state for this model
-            avatar_state = self.db_manager.get_avatar_state(user_id, model_id)
-            
-            return ConversationContext(
-                messages=messages + session_context,
-                personality_traits=personality_traits,
-                user_memories=user_memories,
-                bonding_progress=bonding_progress,
-                avatar_state=avatar_state,
-                max_context_length=self.context_length
-            )
-            
-        except Exception as e:
-            self.logger.error(f"Error building enhanced conversation context: {e}")
-            return ConversationContext(
-                messages=[],
-                personality_traits={},
-                user_memories=[],
-                bonding_progress={},
-                avatar_state={},
-                max_context_length=self.context_length
-            )
+        """
+        Build the per-turn conversation context with model isolation.
+        
+        Everything the turn needs is read once, concurrently, and carried on the
+        returned context through prompt building and the post-response update.
+        """
+        started = time.perf_counter()
+        
+        # Let queued writes from this user's previous exchange land before reading history
+        if self.post_response_queue:
+            self.post_response_queue.wait_for_scope((user_id, model_id), self.post_response_read_timeout)
+        
+        fetches = {
+            'history': (lambda: self.db_manager.get_conversation_history(user_id, model_id, limit=10), []),
+            'session': (lambda: self.db_manager.get_conversation_context(user_id, session_id, model_id), []),
+            'personality_traits': (lambda: self.db_manager.get_personality_profile(user_id, model_id), {}),
+            'bonding_progress': (lambda: self.db_manager.get_bonding_progress(user_id, model_id), {}),
+            'avatar_state': (lambda: self.db_manager.get_avatar_state(user_id, model_id), {}),
+            'model_personality': (lambda: self.db_manager.get_model_personality(model_id), None),
+            'memories': (lambda: self.memory_system.get_relevant_memories(
+                user_id, current_input, limit=self.memory_system.max_context_memories, model_id=model_id), []),
+            'core_memories': (lambda: self.memory_system.get_core_memories(user_id, model_id), {}),
+        }
+        executor = self._get_context_executor(len(fetches))
+        futures = {name: executor.submit(fetch) for name, (fetch, _) in fetches.items()}
+        
+        results = {}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                self.logger.error(f"Error fetching {name} for conversation context: {e}")
+                results[name] = fetches[name][1]
+        
+        relevant_memories = results['memories'] or []
+        user_memories = [
+            {
+                'memory_type': mem.memory_type,
+                'key_topic': mem.key_topic,
+                'value_content': mem.value_content,
+                'importance_score': mem.importance_score
+            }
+            for mem in relevant_memories
+        ]
+        
+        self.last_context_fetch_ms = round((time.perf_counter() - started) * 1000, 2)
+        return ConversationContext(
+            messages=(results['history'] or []) + (results['session'] or []),
+            personality_traits=results['personality_traits'] or {},
+            user_memories=user_memories,
+            bonding_progress=results['bonding_progress'] or {},
+            avatar_state=results['avatar_state'] or {},
+            max_context_length=self.context_length,
+            model_personality=results['model_personality'],
+            memory_context=self.memory_system.format_memories_for_llm(relevant_memories, results['core_memories'])
+        )
+    
+    def _get_context_executor(self, fetch_count: int) -> ThreadPoolExecutor:
+        """Thread pool for the per-turn context fetches, created on first use."""
+        with self._context_executor_lock:
+            if self._context_executor is None:
+                self._context_executor = ThreadPoolExecutor(
+                    max_workers=int(self.context_fetch_workers or fetch_count), thread_name_prefix="llm-context"
+                )
+            return self._context_executor
     
     def _build_enhanced_prompt(self, user_input: str, context: ConversationContext, model_id: str = "default") -> str:
-        """Build enhanced prompt with memory context and model-specific personality."""
-        # Build memory context string for this model
-        memory_context = self.memory_system.build_context_for_llm(
-            user_id="default_user",  # Use default user for now
-            current_query=user_input,
-            model_id=model_id
-        )
+        """
+        Build enhanced prompt with memory context and model-specific personality.
         
-        # Get model-specific personality information
-        model_personality = self.db_manager.get_model_personality(model_id)
-        if model_personality:
-            character_name = model_personality.get("name", model_id.title())
-            character_description = model_personality.get("description", "")
-            background_story = model_personality.get("background_story", "")
-            favorite_things = model_personality.get("favorite_things", "")
-            personality_notes = model_personality.get("personality_notes", "")
-            appearance_notes = model_personality.get("appearance_notes", "")
-        else:
-            # If no personality data exists, create it dynamically or use model_id as fallback
-            character_name = model_id.title()
-            character_description = f"AI companion {model_id.title()}"
-            background_story = f"An AI assistant companion named {model_id.title()}"
-            favorite_things = "helping users, learning new things"
-            personality_notes = "Friendly and helpful AI companion"
-            appearance_notes = ""
+        The prompt starts with a static per-model prefix (stored on the context) so
+        the evaluated prefix can be reused across turns; everything that changes
+        turn to turn follows it. Sections are filled by priority within the
+        token budget left after reserving room for the reply (``max_tokens``, or
+        less under the truncate_reply context shift).
+        """
+        # Memories were retrieved (and access-tracked) once, with the rest of the context
+        memory_context = context.memory_context
+        
+        static_prefix = self._build_static_prompt_prefix(model_id, context.model_personality)
         
         # Build personality description
         personality_desc = self._format_personality_description(context.personality_traits)
@@ -329,6 +857,68 @@ class EnhancedLLMHandler:
         # Generate proactive conversation suggestions
         proactive_suggestions = self._generate_proactive_suggestions(context, user_input)
         
+        # Recent conversation, oldest first
+        history_lines = []
+        recent_messages = context.messages[-6:] if context.messages else []  # Last 6 messages
+        for msg in recent_messages:
+            # Handle both 'message_type' and 'type' field names for compatibility
+            msg_type = msg.get('message_type') or msg.get('type', 'user')
+            role = "You" if msg_type == 'assistant' else "Human"
+            history_lines.append(f"{role}: {msg['content']}")
+        
+        memory_lines = [line for line in memory_context.split("\n") if line.strip()]
+        
+        # Sections in prompt order; priority decides what survives a tight token budget
+        sections = [
+            PromptSection("character", static_prefix, required=True, static=True),
+            PromptSection("personality", f"Your personality traits:\n{personality_desc}\n\n", priority=3),
+            PromptSection("emotional_state", f"""Your current emotional state:
+- Mood: {avatar_state.get('current_mood', 'curious')}
+- Energy: {avatar_state.get('energy_level', 0.8):.1f}/1.0
+- Happiness: {avatar_state.get('happiness_level', 0.7):.1f}/1.0
+- Trust: {avatar_state.get('trust_level', 0.5):.1f}/1.0
+
+""", priority=1),
+            PromptSection("user_knowledge", f"What you know about the user:\n{name_context}\n\n", priority=2)
+            if not memory_lines else
+            PromptSection("user_knowledge", units=memory_lines, priority=2,
+                          header=f"What you know about the user:\n{name_context}\n", footer="\n"),
+            PromptSection("relationship", f"Your relationship: {relationship_stage} (Bond Level: {bond_level})\n\n", priority=1),
+            PromptSection("proactive_suggestions", f"{proactive_suggestions}\n\n" if proactive_suggestions else "", priority=5),
+            PromptSection("conversation", units=history_lines, priority=2, keep_latest=True,
+                          header="Recent conversation:\n", footer="\n"),
+            PromptSection("user_input", f"Human: {user_input}\nYou:", required=True),
+        ]
+        
+        assembled = self.prompt_assembler.assemble(sections, self.context_length, self._reply_token_reserve())
+        context.prompt_prefix = static_prefix
+        context.prompt_usage = assembled["usage"]
+        self.last_prompt_usage = assembled["usage"]
+        self.logger.debug(f"Prompt token usage: {assembled['usage']['used']}/{assembled['usage']['budget']}")
+        
+        return assembled["prompt"]
+    
+    def _build_static_prompt_prefix(self, model_id: str, model_personality: Optional[Dict[str, Any]] = None) -> str:
+        """Build the part of the system prompt that only depends on the character."""
+        # Get model-specific personality information
+        if model_personality is None:
+            model_personality = self.db_manager.get_model_personality(model_id)
+        if model_personality:
+            character_name = model_personality.get("name", model_id.title())
+            character_description = model_personality.get("description", "")
+            background_story = model_personality.get("background_story", "")
+            favorite_things = model_personality.get("favorite_things", "")
+            personality_notes = model_personality.get("personality_notes", "")
+            appearance_notes = model_personality.get("appearance_notes", "")
+        else:
+            # If no personality data exists, create it dynamically or use model_id as fallback
+            character_name = model_id.title()
+            character_description = f"AI companion {model_id.title()}"
+            background_story = f"An AI assistant companion named {model_id.title()}"
+            favorite_things = "helping users, learning new things"
+            personality_notes = "Friendly and helpful AI companion"
+            appearance_notes = ""
+        
         # Build character-specific context
         character_context = ""
         if character_description:
@@ -342,23 +932,7 @@ class EnhancedLLMHandler:
         if personality_notes:
             character_context += f"\nPersonality Notes: {personality_notes}"
         
-        system_prompt = f"""You are {character_name}, a warm and emotionally expressive AI live2d chat with a unique personality.{character_context}
-
-Your personality traits:
-{personality_desc}
-
-Your current emotional state:
-- Mood: {avatar_state.get('current_mood', 'curious')}
-- Energy: {avatar_state.get('energy_level', 0.8):.1f}/1.0
-- Happiness: {avatar_state.get('happiness_level', 0.7):.1f}/1.0
-- Trust: {avatar_state.get('trust_level', 0.5):.1f}/1.0
-
-What you know about the user:
-{name_context}{memory_context}
-
-Your relationship: {relationship_stage} (Bond Level: {bond_level})
-
-{proactive_suggestions}
+        return f"""You are {character_name}, a warm and emotionally expressive AI live2d chat with a unique personality.{character_context}
 
 Core Behavioral Guidelines:
 - BE EMOTIONALLY EXPRESSIVE: Use *smile*, *laugh*, *excited*, *heart*, *wink* etc. for emojis, express excitement, sadness, curiosity, etc.
@@ -388,22 +962,35 @@ Emoji Usage Examples:
 - Friendly: *wave*, *hug*, *thumbs up*
 - Thinking: *thinking*, *curious*
 - Celebratory: *party*, *celebrate*, *clap*
-- Loving: *love*, *heart*, *hearts*, *kiss*"""
-        
-        # Build conversation history
-        conversation_history = ""
-        recent_messages = context.messages[-6:] if context.messages else []  # Last 6 messages
-        
-        for msg in recent_messages:
-            # Handle both 'message_type' and 'type' field names for compatibility
-            msg_type = msg.get('message_type') or msg.get('type', 'user')
-            role = "You" if msg_type == 'assistant' else "Human"
-            conversation_history += f"{role}: {msg['content']}\n"
-        
-        # Combine into final prompt
-        full_prompt = f"{system_prompt}\n\nRecent conversation:\n{conversation_history}\nHuman: {user_input}\nYou:"
-        
-        return full_prompt
+- Loving: *love*, *heart*, *hearts*, *kiss*
+
+"""
+    
+    def _prepare_prompt_prefix(self, model, prefix: str) -> None:
+        """Make sure the slot context starts with the evaluated static prompt prefix."""
+        if not prefix or self.prefix_cache is None:
+            return
+        try:
+            prefix_tokens = model.tokenize(prefix.encode("utf-8"), special=True)
+            n_prefix = len(prefix_tokens)
+            
+            # Slot already holds the prefix - llama.cpp reuses it on its own
+            if model.n_tokens >= n_prefix and list(model.input_ids[:n_prefix]) == prefix_tokens:
+                self.prefix_cache.record_resident_hit()
+                return
+            
+            key = self.prefix_cache.make_key(prefix)
+            state = self.prefix_cache.get(key)
+            if state is not None:
+                model.load_state(state)
+                return
+            
+            # Evaluate the prefix on its own so the snapshot excludes per-turn content
+            model.reset()
+            model.eval(prefix_tokens)
+            self.prefix_cache.put(key, model.save_state())
+        except Exception as e:
+            self.logger.warning(f"Prompt prefix cache unavailable: {e}")
     
     def _format_personality_description(self, traits: Dict[str, float]) -> str:
         """Format personality traits into a description."""
@@ -450,66 +1037,157 @@ Emoji Usage Examples:
         
         return personality_text
     
-    def _check_cache(self, user_input: str, user_id: str, model_id: str = "default") -> Optional[str]:
+    def _check_cache(self, user_input: str, user_id: str, model_id: str = "default",
+                     priority: RequestPriority = RequestPriority.INTERACTIVE) -> Optional[str]:
         """Check if we have a cached response for this input and model."""
-        # Create hash of input + user context + model for cache key
-        cache_key = hashlib.md5(f"{user_input}_{user_id}_{model_id}_{self.temperature}".encode()).hexdigest()
-        
-        cached_response = self.db_manager.get_cached_llm_response(cache_key, model_id)
-        return cached_response
+        try:
+            return self.response_cache.get(user_input, user_id, model_id, self.temperature,
+                                           semantic=self._use_semantic_cache(priority))
+        except Exception as e:
+            self.logger.error(f"Error checking response cache: {e}")
+            return None
     
-    def _cache_response(self, user_input: str, user_id: str, response: str, model_id: str = "default") -> None:
+    def _cache_response(self, user_input: str, user_id: str, response: str, model_id: str = "default",
+                        priority: RequestPriority = RequestPriority.INTERACTIVE) -> None:
         """Cache the response for future use with model awareness."""
-        cache_key = hashlib.md5(f"{user_input}_{user_id}_{model_id}_{self.temperature}".encode()).hexdigest()
-        
-        self.db_manager.cache_llm_response(
-            input_hash=cache_key,
-            response=response,
-            model_name=str(self.model_path) if self.model_path else "unknown",
-            temperature=self.temperature,
-            model_id=model_id
-        )
-    
-    def _generate_streaming_response(self, prompt: str, user_id: str, user_input: str, session_id: str, model_id: str = "default") -> Generator[str, None, None]:
-        """Generate streaming response for real-time output."""
         try:
-            # Use generation lock to prevent concurrent access to LLM
-            with self.generation_lock:
-                response_stream = self.model(
-                    prompt,
-                    max_tokens=self.max_tokens,
-                    temperature=self.temperature,
-                    top_p=self.top_p,
-                    stop=["Human:", "Assistant:", "\n\n", "User:"],
-                    echo=False,
-                    stream=True
+            self.response_cache.put(
+                user_input, user_id, model_id, self.temperature, response,
+                model_name=str(self.model_path) if self.model_path else "unknown",
+                semantic=self._use_semantic_cache(priority)
+            )
+        except Exception as e:
+            self.logger.error(f"Error caching response: {e}")
+    
+    @staticmethod
+    def _use_semantic_cache(priority: RequestPriority) -> bool:
+        """Near-duplicate matching is only safe for generated greetings and avatar chatter."""
+        return priority in (RequestPriority.GREETING, RequestPriority.AUTONOMOUS)
+    
+    def _embed_for_cache(self, text: str) -> List[float]:
+        """Embed a prompt for the semantic response cache, loading the encoder on first use."""
+        if self._cache_embedder is None:
+            embedding_config = self.config.get('rag', {}).get('embedding', {})
+            model_name = embedding_config.get('model_name', 'sentence-transformers/all-MiniLM-L6-v2')
+            backend = resolve_embedding_backend(embedding_config)
+            
+            def load_model():
+                return load_embedding_model(model_name, backend, embedding_config)
+            
+            service_config = embedding_config.get('service', {})
+            if service_config.get('enabled', True):
+                # Batched with RAG queries on the shared worker for this embedding space
+                self._cache_embedder = get_embedding_service(
+                    embedding_space(model_name, backend, embedding_config), load_model, service_config
                 )
+            else:
+                self._cache_embedder = load_model()
+        if isinstance(self._cache_embedder, EmbeddingService):
+            return self._cache_embedder.encode([text])[0].tolist()
+        return self._cache_embedder.encode(text, normalize_embeddings=True).tolist()
+    
+    def _stream_cached_response(self, response: str) -> Generator[str, None, str]:
+        """Serve a cached response through the streaming interface."""
+        yield response
+        return response
+    
+    def _generate_streaming_response(self, prompt: str, user_id: str, user_input: str, session_id: str,
+                                     model_id: str = "default",
+                                     priority: RequestPriority = RequestPriority.INTERACTIVE,
+                                     prompt_prefix: str = "",
+                                     context: Optional[ConversationContext] = None,
+                                     cancel_token: Optional[CancellationToken] = None) -> Generator[str, None, str]:
+        """
+        Generate streaming response for real-time output.
+        
+        Tokens are yielded as they decode; the post-processed reply is the
+        generator's return value. The decode slot stays held until the stream
+        finishes, the consumer stops iterating, or ``cancel_token`` is cancelled.
+        """
+        full_response = ""
+        abandoned = threading.Event()
+        # The stream runs after generate_response has returned, so it holds off idle unloads itself
+        self._begin_request()
+        try:
+            session_key = (user_id, model_id, session_id)
+            token_queue: queue.Queue = queue.Queue()
+            stopping_criteria = self._build_stopping_criteria(cancel_token, preemptible=False)
+            
+            def run_stream(model):
+                if not self._prepare_session_state(model, session_key):
+                    self._prepare_prompt_prefix(model, prompt_prefix)
+                try:
+                    for chunk in model(
+                        prompt,
+                        max_tokens=self._reply_max_tokens(context.prompt_usage if context else None),
+                        temperature=self.temperature,
+                        top_p=self.top_p,
+                        stop=["Human:", "Assistant:", "\n\n", "User:"],
+                        echo=False,
+                        stream=True,
+                        stopping_criteria=stopping_criteria
+                    ):
+                        if abandoned.is_set() or (cancel_token is not None and cancel_token.cancelled):
+                            break
+                        if 'choices' in chunk and len(chunk['choices']) > 0:
+                            token = chunk['choices'][0].get('text', '')
+                            if token:
+                                token_queue.put(token)
+                finally:
+                    self._mark_session_resident(model, session_key)
+            
+            # Decode on a scheduler slot; the slot is released once run_stream returns
+            # Streams only stop on cancellation, so the scheduler must never pick them to preempt
+            future = self._require_scheduler().submit(run_stream, priority=priority, cancel_token=cancel_token,
+                                           preemptible=False)
+            future.add_done_callback(lambda _: token_queue.put(_STREAM_END))
             
-            full_response = ""
-            for chunk in response_stream:
-                if 'choices' in chunk and len(chunk['choices']) > 0:
-                    token = chunk['choices'][0].get('text', '')
-                    if token:
-                        full_response += token
-                        yield token
+            # Emote tags are rewritten as tokens arrive, holding back partial "*..." tags
+            emoji_stream = self.emoji_rewriter.stream()
+            while True:
+                token = token_queue.get()
+                if token is _STREAM_END:
+                    break
+                text = emoji_stream.feed(token)
+                if text:
+                    full_response += text
+                    yield text
+            future.result()  # Surface generation errors
+            tail = emoji_stream.flush()
+            if tail:
+                full_response += tail
+                yield tail
             
             # Post-process and store after streaming is complete
-            full_response = self._post_process_response(full_response)
+            full_response = self._post_process_response(full_response, convert_emojis=False)
             
             # Cache if enabled
             if self.enable_caching:
-                self._cache_response(user_input, user_id, full_response, model_id)
+                self._cache_response(user_input, user_id, full_response, model_id, priority)
             
-            # Store conversation and update state
-            context = self._build_enhanced_conversation_context(user_id, session_id, user_input, model_id)
+            # Store conversation and update state (reusing the context the prompt was built from)
             self._update_enhanced_conversation_state(user_id, user_input, full_response, context, session_id, model_id)
             
+            return full_response
+            
+        except CancelledError:
+            # Whatever was already streamed stays with the client; nothing is cached or stored
+            self.logger.info(f"Streaming generation cancelled ({cancel_token.reason if cancel_token else 'unknown'})")
+            return full_response
         except Exception as e:
             self.logger.error(f"Error in streaming response: {e}")
-            yield "I'm sorry, I encountered an error while thinking."
+            error_message = "I'm sorry, I encountered an error while thinking."
+            yield error_message
+            return error_message
+        finally:
+            abandoned.set()
+            self._end_request()
     
-    def _post_process_response(self, response: str) -> str:
-        """Clean up and post-process the generated response."""
+    def _post_process_response(self, response: str, convert_emojis: bool = True) -> str:
+        """
+        Clean up and post-process the generated response.
+        Streamed replies are emoji-rewritten token by token, so they skip that step here.
+        """
         # Remove any unwanted prefixes/suffixes
         response = response.strip()
         
@@ -526,7 +1204,8 @@ Emoji Usage Examples:
                 response = response.split(token)[0]
         
         # Convert emoji text descriptions to actual emojis
-        response = self._convert_emoji_text_to_emojis(response)
+        if convert_emojis:
+            response = self._convert_emoji_text_to_emojis(response)
         
         # Ensure response isn't too long
         if len(response) > 500:
@@ -539,146 +1218,22 @@ Emoji Usage Examples:
     
     def _convert_emoji_text_to_emojis(self, text: str) -> str:
         """Convert emoji text descriptions to actual emojis."""
-        import re
-        
-        # Emoji mapping dictionary
-        emoji_map = {
-            # Faces and emotions
-            r'\*smile\*': '😊',
-            r'\*smiles\*': '😊',
-            r'\*smiling\*': '😊',
-            r'\*happy\*': '😊',
-            r'\*grin\*': '😄',
-            r'\*grins\*': '😄',
-            r'\*laugh\*': '😂',
-            r'\*laughs\*': '😂',
-            r'\*giggle\*': '😄',
-            r'\*giggles\*': '😄',
-            r'\*wink\*': '😉',
-            r'\*winks\*': '😉',
-            r'\*blush\*': '😊',
-            r'\*blushing\*': '😊',
-            r'\*excited\*': '🤩',
-            r'\*excitement\*': '🤩',
-            r'\*love\*': '💕',
-            r'\*heart\*': '❤️',
-            r'\*hearts\*': '💕',
-            r'\*crying\*': '😢',
-            r'\*sad\*': '😢',
-            r'\*worried\*': '😟',
-            r'\*thinking\*': '🤔',
-            r'\*confused\*': '😕',
-            r'\*surprised\*': '😮',
-            r'\*shock\*': '😱',
-            r'\*shocked\*': '😱',
-            r'\*curious\*': '🤔',
-            r'\*interested\*': '😊',
-            r'\*sleepy\*': '😴',
-            r'\*tired\*': '😴',
-            
-            # Gestures and actions
-            r'\*thumbs up\*': '👍',
-            r'\*wave\*': '👋',
-            r'\*waves\*': '👋',
-            r'\*waving\*': '👋',
-            r'\*clap\*': '👏',
-            r'\*claps\*': '👏',
-            r'\*clapping\*': '👏',
-            r'\*applause\*': '👏',
-            r'\*hug\*': '🤗',
-            r'\*hugs\*': '🤗',
-            r'\*hugging\*': '🤗',
-            r'\*kiss\*': '😘',
-            r'\*nod\*': '👍',
-            r'\*nods\*': '👍',
-            r'\*nodding\*': '👍',
-            r'\*shrug\*': '🤷',
-            r'\*shrugs\*': '🤷',
-            r'\*peace\*': '✌️',
-            
-            # Objects and symbols
-            r'\*sparkle\*': '✨',
-            r'\*sparkles\*': '✨',
-            r'\*star\*': '⭐',
-            r'\*stars\*': '⭐',
-            r'\*fire\*': '🔥',
-            r'\*rainbow\*': '🌈',
-            r'\*sun\*': '☀️',
-            r'\*moon\*': '🌙',
-            r'\*flower\*': '🌸',
-            r'\*flowers\*': '🌸',
-            r'\*music\*': '🎵',
-            r'\*coffee\*': '☕',
-            r'\*book\*': '📚',
-            r'\*books\*': '📚',
-            
-            # Activities
-            r'\*dance\*': '💃',
-            r'\*dancing\*': '💃',
-            r'\*party\*': '🎉',
-            r'\*celebrate\*': '🎉',
-            r'\*celebration\*': '🎉',
-            r'\*game\*': '🎮',
-            r'\*gaming\*': '🎮',
-            r'\*art\*': '🎨',
-            r'\*cook\*': '🍳',
-            r'\*cooking\*': '🍳',
-            
-            # Nature and animals
-            r'\*cat\*': '🐱',
-            r'\*dog\*': '🐶',
-            r'\*bird\*': '🐦',
-            r'\*tree\*': '🌳',
-            r'\*ocean\*': '🌊',
-            r'\*mountain\*': '⛰️',
-        }
-        
-        # Apply emoji conversions (case insensitive)
-        for pattern, emoji in emoji_map.items():
-            text = re.sub(pattern, emoji, text, flags=re.IGNORECASE)
-        
-        # Also handle emoji words without asterisks (less aggressive)
-        simple_emoji_map = {
-            r'\bsmile emoji\b': '😊',
-            r'\bheart emoji\b': '❤️',
-            r'\blaugh emoji\b': '😂',
-            r'\bwink emoji\b': '😉',
-            r'\bthumbsup emoji\b': '👍',
-            r'\bthumbsdown emoji\b': '👎',
-            r'\bwave emoji\b': '👋',
-        }
-        
-        for pattern, emoji in simple_emoji_map.items():
-            text = re.sub(pattern, emoji, text, flags=re.IGNORECASE)
-        
-        return text
+        return self.emoji_rewriter.rewrite(text)
     
     def _store_conversation_only(self, user_id: str, user_input: str, response: str, session_id: str, model_id: str = "default") -> None:
         """Store conversation without full state updates (for cached responses)."""
-        try:
-            # Store conversation messages
-            self.db_manager.add_conversation(user_id, "user", user_input, None, None, model_id)
-            self.db_manager.add_conversation(user_id, "assistant", response, None, None, model_id)
-            
-            # Update session context
-            session_messages = [
-                {"role": "user", "content": user_input},
-                {"role": "assistant", "content": response}
-            ]
-            
-            existing_context = self.db_manager.get_conversation_context(user_id, session_id, model_id)
-            all_messages = existing_context + session_messages
-            
-            if len(all_messages) > 20:
-                all_messages = all_messages[-20:]
-            
-            self.db_manager.add_conversation_context(user_id, session_id, all_messages, model_id)
-            
-            # Still give some bonding XP for cached interactions
-            self.db_manager.update_bonding_progress(user_id, 2, model_id)
-            
-        except Exception as e:
-            self.logger.error(f"Error storing conversation: {e}")
+        # Cached interactions keep a longer session context and still give some bonding XP
+        self._enqueue_conversation_turn({
+            'user_id': user_id,
+            'model_id': model_id,
+            'session_id': session_id,
+            'user_input': user_input,
+            'response': response,
+            'context_limit': 20,
+            'extract_memories': False,
+            'bonding_xp': 2,
+            'summarize': False,
+        })
     
     def _extract_user_name(self, user_memories: List[Dict[str, Any]]) -> Optional[str]:
         """Extract user's name from their memories."""
@@ -751,156 +1306,224 @@ Emoji Usage Examples:
         return "Conversation Strategy:\n" + "\n".join(f"- {suggestion}" for suggestion in suggestions[:3])
     
     def _update_enhanced_conversation_state(self, user_id: str, user_input: str, 
-                                          response: str, context: ConversationContext, 
+                                          response: str, context: Optional[ConversationContext], 
                                           session_id: str, model_id: str = "default") -> None:
-        """Update conversation state with enhanced memory extraction."""
+        """Queue conversation storage, memory extraction and state updates for the exchange."""
+        message_count = len(context.messages) if context else 0
+        self._enqueue_conversation_turn({
+            'user_id': user_id,
+            'model_id': model_id,
+            'session_id': session_id,
+            'user_input': user_input,
+            'response': response,
+            'context_limit': 10,
+            'extract_memories': True,
+            'bonding_xp': None,
+            # Create a conversation summary every 10 messages
+            'summarize': message_count > 0 and message_count % 10 == 0,
+        })
+    
+    def _enqueue_conversation_turn(self, turn: Dict[str, Any]) -> None:
+        """Hand a finished exchange to the post-response queue (or apply it inline without one)."""
         try:
-            # Store the conversation
-            self.db_manager.add_conversation(user_id, "user", user_input, None, None, model_id)
-            self.db_manager.add_conversation(user_id, "assistant", response, None, None, model_id)
-            
-            # Extract and store memories from the conversation
-            self._extract_and_store_memories(user_id, user_input, response, model_id)
-            
-            # Update session context
-            session_context = context.messages + [
-                {'role': 'user', 'content': user_input},
-                {'role': 'assistant', 'content': response}
-            ]
-            # Keep only last 10 messages for session context
-            if len(session_context) > 10:
-                session_context = session_context[-10:]
-            
-            self.db_manager.add_conversation_context(user_id, session_id, session_context, model_id)
-            
-            # Update bonding progress based on interaction quality
-            self._update_bonding_progress(user_id, user_input, response, model_id)
-            
-            # Create conversation summary if needed
-            if len(context.messages) > 0 and len(context.messages) % 10 == 0:
+            if self.post_response_queue:
+                self.post_response_queue.enqueue("conversation_turn", turn,
+                                                 scope=(turn['user_id'], turn['model_id']))
+            else:
+                with self.db_manager.get_conversations_connection() as conn:
+                    result = self._apply_conversation_turns(conn, [turn])
+                self._finish_conversation_turns([turn], result)
+        except Exception as e:
+            self.logger.error(f"Error updating enhanced conversation state: {e}")
+    
+    def _apply_conversation_turns(self, conn, turns: List[Dict[str, Any]]) -> tuple:
+        """
+        Apply a batch of exchanges: conversation rows, extracted memories and session
+        contexts are written on ``conn``. Returns the extracted memories and the bonding
+        XP summed per user and model for ``_finish_conversation_turns`` to apply once
+        the batch is committed.
+        """
+        self.db_manager.add_conversations([
+            row
+            for turn in turns
+            for row in (
+                (turn['user_id'], turn['model_id'], "user", turn['user_input'], None, None),
+                (turn['user_id'], turn['model_id'], "assistant", turn['response'], None, None),
+            )
+        ], conn)
+        
+        # Each message is analyzed once for memory extraction and bonding XP
+        features = [self.text_analyzer.analyze(turn['user_input']) for turn in turns]
+        
+        memories = []
+        for turn, turn_features in zip(turns, features):
+            if turn.get('extract_memories'):
+                memories.extend(self._extract_memories(turn['user_id'], turn['user_input'], turn['model_id'],
+                                                       turn_features))
+        self.memory_system.add_memories(memories, conn)
+        
+        # One read-modify-write per session, in the order the exchanges happened
+        sessions: Dict[tuple, List[Dict[str, Any]]] = {}
+        for turn in turns:
+            sessions.setdefault((turn['user_id'], turn['model_id'], turn['session_id']), []).append(turn)
+        for (user_id, model_id, session_id), session_turns in sessions.items():
+            messages = []
+            for turn in session_turns:
+                messages.append({'role': 'user', 'content': turn['user_input']})
+                messages.append({'role': 'assistant', 'content': turn['response']})
+            self.db_manager.append_conversation_context(
+                user_id, session_id, messages, model_id,
+                limit=session_turns[-1].get('context_limit', 10), conn=conn
+            )
+        
+        # Bonding progress lives in the personality database: one update per user/model pair
+        experience: Dict[tuple, int] = {}
+        for turn, turn_features in zip(turns, features):
+            xp = turn.get('bonding_xp')
+            if xp is None:
+                xp = self._calculate_bonding_xp(turn['user_input'], turn_features)
+            key = (turn['user_id'], turn['model_id'])
+            experience[key] = experience.get(key, 0) + xp
+        
+        if memories:
+            self.logger.info(f"Stored {len(turns)} exchange(s) with {len(memories)} extracted memories")
+        return memories, experience
+    
+    def _finish_conversation_turns(self, turns: List[Dict[str, Any]], result: tuple) -> None:
+        """
+        Apply a committed batch's work outside the conversations database: cached core
+        memories are invalidated, then bonding XP (personality.db, one update per
+        user/model pair) and conversation summaries are written. Runs once per committed
+        job, so retried batches don't add XP or summaries twice.
+        """
+        memories, experience = result
+        self.memory_system.invalidate_memories(memories)
+        for (user_id, model_id), xp in experience.items():
+            self.db_manager.update_bonding_progress(user_id, xp, model_id)
+        
+        for turn in turns:
+            if turn.get('summarize'):
                 summary = self.memory_system.create_conversation_summary(
-                    user_id, 
-                    [{'role': 'user', 'content': user_input}, {'role': 'assistant', 'content': response}]
+                    turn['user_id'],
+                    [{'role': 'user', 'content': turn['user_input']},
+                     {'role': 'assistant', 'content': turn['response']}]
                 )
                 self.logger.info(f"Created conversation summary: {summary.summary_text}")
-                
-        except Exception as e:
-            self.logger.error(f"Error updating enhanced conversation state: {e}")
     
-    def _extract_and_store_memories(self, user_id: str, user_input: str, response: str, model_id: str = "default") -> None:
-        """Extract and store memories from the conversation with model isolation."""
+    def store_chat_exchange(self, user_message: str, response: str, avatar_id: str, user_id: str,
+                            memory_metadata: Dict[str, Any], history_metadata: Dict[str, Any]) -> None:
+        """Queue the chat route's conversation memory and history rows for an exchange."""
+        exchange = {
+            'user_message': user_message,
+            'response': response,
+            'avatar_id': avatar_id,
+            'user_id': user_id,
+            'memory_metadata': memory_metadata,
+            'history_metadata': history_metadata,
+        }
+        if self.post_response_queue:
+            self.post_response_queue.enqueue("chat_history", exchange, scope=(user_id, avatar_id))
+        else:
+            with self.db_manager.get_conversations_connection() as conn:
+                memory_ids = self._apply_chat_history(conn, [exchange])
+            self._finish_chat_history([exchange], memory_ids)
+    
+    def _apply_chat_history(self, conn, exchanges: List[Dict[str, Any]]) -> List[int]:
+        """Write a batch of chat exchanges to conversation memory and conversation_history."""
+        memory_ids = self.memory_system.store_conversations(
+            self._chat_history_conversations(exchanges), conn
+        )
+        self.db_manager.add_conversation_history([
+            (exchange['user_id'], exchange['avatar_id'], exchange['user_message'],
+             exchange['response'], exchange['history_metadata'])
+            for exchange in exchanges
+        ], conn)
+        return memory_ids
+    
+    def _finish_chat_history(self, exchanges: List[Dict[str, Any]], memory_ids: List[int]) -> None:
+        """Add a committed batch of chat exchanges to RAG (once per committed job)."""
+        self.memory_system.index_conversations(self._chat_history_conversations(exchanges), memory_ids)
+    
+    @staticmethod
+    def _chat_history_conversations(exchanges: List[Dict[str, Any]]) -> List[tuple]:
+        return [
+            (exchange['user_message'], exchange['response'], exchange['memory_metadata'])
+            for exchange in exchanges
+        ]
+    
+    def _extract_memories(self, user_id: str, user_input: str, model_id: str = "default",
+                          features: Optional[TextFeatures] = None) -> List[Dict[str, Any]]:
+        """Extract memories from the user's message, ready for MemorySystem.add_memories."""
         try:
-            # Enhanced memory extraction with more categories
+            features = features or self.text_analyzer.analyze(user_input)
             memories_to_store = []
             
-            user_lower = user_input.lower()
+            # Name information
+            for name in features.names:
+                memories_to_store.append({
+                    'type': 'fact',
+                    'topic': 'user_name',
+                    'content': f"User's name is {name}",
+                    'importance': 'high'
+                })
             
-            # Extract name information
-            import re
-            name_patterns = [
-                r"(?:my name is|i'm|i am|call me)\s+([a-zA-Z]+)",
-                r"name.{0,10}([a-zA-Z]+)",
-            ]
-            for pattern in name_patterns:
-                match = re.search(pattern, user_lower)
-                if match:
-                    name = match.group(1).capitalize()
+            # Preferences, interests and facts
+            for memory_type, content, importance in features.preferences:
+                if len(content) > 2:  # Skip very short matches
                     memories_to_store.append({
-                        'type': 'fact',
-                        'topic': 'user_name',
-                        'content': f"User's name is {name}",
-                        'importance': 'high'
+                        'type': memory_type,
+                        'topic': content.split()[0],  # First word as topic
+                        'content': f"User {memory_type}: {content}",
+                        'importance': importance
                     })
             
-            # Extract preferences and interests
-            preference_indicators = [
-                (r"i (?:love|like|enjoy|prefer)\s+([^.,!?]+)", 'preference', 'medium'),
-                (r"i (?:hate|dislike|don't like)\s+([^.,!?]+)", 'preference', 'medium'),
-                (r"my favorite\s+([^.,!?]+)", 'preference', 'high'),
-                (r"i'm (?:into|interested in)\s+([^.,!?]+)", 'interest', 'medium'),
-                (r"i work (?:as|at|in)\s+([^.,!?]+)", 'fact', 'high'),
-                (r"i study\s+([^.,!?]+)", 'fact', 'medium'),
-                (r"i live in\s+([^.,!?]+)", 'fact', 'medium'),
-            ]
+            # Emotional state
+            for emotion in features.emotions:
+                memories_to_store.append({
+                    'type': 'emotional_state',
+                    'topic': 'current_mood',
+                    'content': f"User felt {emotion}",
+                    'importance': 'medium'
+                })
             
-            for pattern, memory_type, importance in preference_indicators:
-                matches = re.finditer(pattern, user_lower)
-                for match in matches:
-                    content = match.group(1).strip()
-                    if len(content) > 2:  # Skip very short matches
-                        memories_to_store.append({
-                            'type': memory_type,
-                            'topic': content.split()[0],  # First word as topic
-                            'content': f"User {memory_type}: {content}",
-                            'importance': importance
-                        })
-            
-            # Extract emotional state
-            emotion_patterns = [
-                (r"i (?:feel|am feeling|am)\s+(happy|sad|excited|worried|tired|stressed|angry|frustrated|lonely|anxious|depressed)", 'emotional_state'),
-                (r"i'm\s+(happy|sad|excited|worried|tired|stressed|angry|frustrated|lonely|anxious|depressed)", 'emotional_state'),
+            return [
+                {
+                    'user_id': user_id,
+                    'model_id': model_id,
+                    'memory_type': memory['type'],
+                    'content': memory['content'],
+                    'topic': memory['topic'],
+                    'importance': memory['importance'],
+                }
+                for memory in memories_to_store
             ]
-            
-            for pattern, memory_type in emotion_patterns:
-                matches = re.finditer(pattern, user_lower)
-                for match in matches:
-                    emotion = match.group(1)
-                    memories_to_store.append({
-                        'type': 'emotional_state',
-                        'topic': 'current_mood',
-                        'content': f"User felt {emotion}",
-                        'importance': 'medium'
-                    })
-            
-            # Store the extracted memories for this model
-            for memory in memories_to_store:
-                self.memory_system.add_memory(
-                    user_id=user_id,
-                    memory_type=memory['type'],
-                    content=memory['content'],
-                    topic=memory['topic'],
-                    importance=memory['importance'],
-                    model_id=model_id
-                )
-            
-            if memories_to_store:
-                self.logger.info(f"Extracted and stored {len(memories_to_store)} memories for model {model_id}")
                 
         except Exception as e:
             self.logger.error(f"Error extracting memories: {e}")
+            return []
     
-    def _update_bonding_progress(self, user_id: str, user_input: str, response: str, model_id: str = "default") -> None:
-        """Update bonding progress based on interaction quality."""
-        try:
-            # Calculate experience points based on interaction
-            base_xp = 5  # Base XP for any interaction
-            
-            # Bonus XP for meaningful interactions
-            user_lower = user_input.lower()
-            
-            # Personal sharing bonus
-            personal_indicators = ['i feel', 'i think', 'i love', 'i hate', 'my favorite', 'i\'m worried', 'i\'m excited']
-            if any(indicator in user_lower for indicator in personal_indicators):
-                base_xp += 3
-            
-            # Question asking bonus (shows engagement)
-            if '?' in user_input:
-                base_xp += 2
-            
-            # Emotional expression bonus
-            emotional_words = ['happy', 'sad', 'excited', 'worried', 'love', 'hate', 'feel']
-            if any(word in user_lower for word in emotional_words):
-                base_xp += 2
-            
-            # Length bonus for substantial conversations
-            if len(user_input.split()) > 10:
-                base_xp += 1
-            
-            # Update bonding progress with model isolation
-            self.db_manager.update_bonding_progress(user_id, base_xp, model_id)
-            
-        except Exception as e:
-            self.logger.error(f"Error updating bonding progress: {e}")
+    def _calculate_bonding_xp(self, user_input: str, features: Optional[TextFeatures] = None) -> int:
+        """Experience points for an interaction, based on its quality."""
+        features = features or self.text_analyzer.analyze(user_input)
+        base_xp = 5  # Base XP for any interaction
+        
+        # Personal sharing bonus
+        if features.count('personal_sharing'):
+            base_xp += 3
+        
+        # Question asking bonus (shows engagement)
+        if features.is_question:
+            base_xp += 2
+        
+        # Emotional expression bonus
+        if features.count('emotional_words'):
+            base_xp += 2
+        
+        # Length bonus for substantial conversations
+        if features.word_count > 10:
+            base_xp += 1
+        
+        return base_xp
     
     def get_model_status(self) -> Dict[str, Any]:
         """Get current model status and information."""
@@ -911,6 +1534,24 @@ Emoji Usage Examples:
             "max_tokens": self.max_tokens,
             "temperature": self.temperature,
             "caching_enabled": self.enable_caching,
+            "response_cache": self.response_cache.get_stats(),
+            "post_response_queue": self.post_response_queue.get_stats() if self.post_response_queue else None,
+            "memory_access_tracking": (self.memory_system.access_tracker.get_stats()
+                                       if self.memory_system.access_tracker else None),
+            "memory_cache": self.memory_system.context_cache.get_stats() if self.memory_system.context_cache else None,
+            "memory_consolidation": (self.memory_system.consolidator.get_stats()
+                                     if self.memory_system.consolidator else None),
+            "cancellations": self.cancellations.get_stats(),
+            "lifecycle": self.lifecycle.get_stats(),
+            "last_prompt_usage": self.last_prompt_usage,
+            "last_context_fetch_ms": self.last_context_fetch_ms,
+            "scheduler": self.scheduler.get_stats() if self.scheduler else None,
+            "prefix_cache": self.prefix_cache.get_stats() if self.prefix_cache else None,
+            "session_state": self.state_store.get_stats() if self.state_store else None,
+            "speculative_decoding": self.optimization_flags.get("speculative_decoding"),
+            "kv_cache": self.optimization_flags.get("kv_cache"),
+            "backend": self.backend,
+            "worker_pool": self.worker_pool.get_stats() if self.worker_pool else None,
             "system_capabilities": self.system_detector.capabilities
         }
     
@@ -935,6 +1576,7 @@ Emoji Usage Examples:
                 self.logger.info(f"Clearing cache for user: {user_id}")
             else:
                 # Clear all cache
+                self.response_cache.clear()
                 self.db_manager.cursor.execute("DELETE FROM llm_cache")
                 self.db_manager.connection.commit()
                 self.logger.info("Cleared all LLM cache")
@@ -942,13 +1584,29 @@ Emoji Usage Examples:
             self.logger.error(f"Error clearing cache: {e}")
     
     def unload_model(self):
-        """Unload the model to free memory."""
+        """Unload the model to free memory (it is reloaded on the next request)."""
         with self.loading_lock:
-            if self.model:
-                del self.model
-                self.model = None
-                self.model_loaded = False
-                self.logger.info("LLM model unloaded")
+            self._unload_model_locked()
+    
+    def _unload_model_locked(self):
+        """Unload the model; the caller holds ``loading_lock``."""
+        # Cleared first so the lock-free check in generate_response waits for a reload
+        self.model_loaded = False
+        self._session_sweeper_stop.set()
+        self._stop_scheduler()
+        if self.worker_pool:
+            self.worker_pool.shutdown()
+            self.worker_pool = None
+        if self.prefix_cache:
+            self.prefix_cache.clear()
+        # In-process, the tokenizer is the model itself; drop it too or the context stays alive
+        # (it is recreated by initialize_model)
+        self._tokenizer_model = None
+        if self.model:
+            del self.model
+            self.model = None
+            self.lifecycle.record_unload()
+            self.logger.info("LLM model unloaded")
 
 
 # For backward compatibility
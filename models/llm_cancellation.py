@@ -0,0 +1,126 @@
+"""
+Generation cancellation for AI Companion application.
+Cancellation tokens tie an LLM generation (and the TTS work that follows it) to the
+client that asked for it, so a disconnected browser or a superseded message stops
+decoding and frees its scheduler slot instead of running to ``max_tokens``.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import CancelledError
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class GenerationCancelled(CancelledError):
+    """Raised when a generation stops because its cancellation token fired."""
+
+
+class CancellationToken:
+    """
+    One-shot cancellation flag for a single generation.
+
+    Cheap to poll from inside decoding (``cancelled``); callbacks registered with
+    ``add_callback`` run once, on the thread that calls ``cancel``.
+    """
+
+    def __init__(self, owner: Optional[Hashable] = None):
+        self.owner = owner
+        self.created_at = time.time()
+        self.cancelled_at: Optional[float] = None
+        self.reason: Optional[str] = None
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[["CancellationToken"], Any]] = []
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str = "client") -> bool:
+        """Cancel the token; returns False if it was already cancelled."""
+        with self._lock:
+            if self._event.is_set():
+                return False
+            self.reason = reason
+            self.cancelled_at = time.time()
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception as e:
+                logger.error(f"Error in cancellation callback: {e}")
+        return True
+
+    def add_callback(self, callback: Callable[["CancellationToken"], Any]) -> None:
+        """Run ``callback(token)`` on cancellation (immediately if already cancelled)."""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def raise_if_cancelled(self) -> None:
+        if self.cancelled:
+            raise GenerationCancelled(f"Generation cancelled ({self.reason})")
+
+
+class CancellationRegistry:
+    """
+    Tracks the in-flight generation token of each client.
+
+    Owners are SocketIO sids or HTTP client keys. Starting a new generation for an
+    owner supersedes (cancels) the one it already has running.
+    """
+
+    def __init__(self):
+        self._tokens: Dict[Hashable, CancellationToken] = {}
+        self._lock = threading.Lock()
+
+        # Counters reported through get_stats()
+        self._created = 0
+        self._cancelled_by_reason: Dict[str, int] = {}
+
+    def new_token(self, owner: Hashable) -> CancellationToken:
+        """Create the token for ``owner``'s next generation, superseding its current one."""
+        token = CancellationToken(owner)
+        token.add_callback(self._record_cancel)
+        with self._lock:
+            previous = self._tokens.get(owner)
+            self._tokens[owner] = token
+            self._created += 1
+        if previous is not None and previous.cancel("superseded"):
+            logger.info(f"Superseded in-flight generation for {owner}")
+        return token
+
+    def cancel(self, owner: Hashable, reason: str = "client") -> bool:
+        """Cancel ``owner``'s in-flight generation, if any."""
+        with self._lock:
+            token = self._tokens.pop(owner, None)
+        if token is None or not token.cancel(reason):
+            return False
+        logger.info(f"Cancelled generation for {owner} ({reason})")
+        return True
+
+    def release(self, token: CancellationToken) -> None:
+        """Forget a finished generation's token (unless it was already replaced)."""
+        with self._lock:
+            if self._tokens.get(token.owner) is token:
+                del self._tokens[token.owner]
+
+    def _record_cancel(self, token: CancellationToken) -> None:
+        with self._lock:
+            self._cancelled_by_reason[token.reason] = self._cancelled_by_reason.get(token.reason, 0) + 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get token and cancellation counts."""
+        with self._lock:
+            return {
+                "created": self._created,
+                "active": len(self._tokens),
+                "cancelled": sum(self._cancelled_by_reason.values()),
+                "cancelled_by_reason": dict(self._cancelled_by_reason),
+            }
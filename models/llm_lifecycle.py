@@ -0,0 +1,230 @@
+"""
+LLM lifecycle management for AI Companion application.
+Tracks model load and warm-up timings, pages a freshly loaded GGUF into memory in
+the background so the first prompt doesn't pay for mmap page faults, and unloads
+the model after a period of inactivity on memory-constrained systems. The handler
+reloads it transparently on the next request.
+"""
+
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+WARMUP_MODES = ("page_in", "eval", "none")
+
+
+def page_in_file(path: Path, chunk_size: int = 8 * 1024 * 1024,
+                 stop_event: Optional[threading.Event] = None) -> int:
+    """
+    Pull a file into the OS page cache so later mmap accesses are minor faults.
+
+    The kernel is asked to read ahead (``POSIX_FADV_WILLNEED``) and the file is then
+    read through sequentially, which also works where the hint is ignored. Returns
+    the number of bytes read.
+    """
+    total = 0
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    with open(path, "rb", buffering=0) as f:
+        if hasattr(os, "posix_fadvise"):
+            try:
+                os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+            except OSError:
+                pass
+        while stop_event is None or not stop_event.is_set():
+            read = f.readinto(view)
+            if not read:
+                break
+            total += read
+    return total
+
+
+class ModelLifecycleManager:
+    """
+    Load/warm-up bookkeeping and idle auto-unload for the LLM.
+
+    ``unload_fn`` is called from the monitor thread once the model has been idle
+    for ``idle_unload_seconds`` and ``is_busy_fn`` reports no queued or running
+    work; it returns whether it actually unloaded (it should re-check
+    ``idle_seconds`` under its own lock). Callers mark activity with ``touch``;
+    reloading is left to the owner (the handler's ``initialize_model`` runs again
+    on the next request).
+    """
+
+    def __init__(self, unload_fn: Callable[[], bool], is_busy_fn: Callable[[], bool],
+                 idle_unload_seconds: Optional[float] = None, warmup_mode: str = "page_in",
+                 check_interval: float = 30.0):
+        if warmup_mode not in WARMUP_MODES:
+            logger.warning(f"Unknown LLM warm-up mode '{warmup_mode}', using page_in")
+            warmup_mode = "page_in"
+        self.unload_fn = unload_fn
+        self.is_busy_fn = is_busy_fn
+        self.idle_unload_seconds = idle_unload_seconds if idle_unload_seconds and idle_unload_seconds > 0 else None
+        self.warmup_mode = warmup_mode
+        self.check_interval = max(1.0, float(check_interval))
+
+        self.state = "unloaded"
+        self._last_active = time.time()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._monitor: Optional[threading.Thread] = None
+        self._warmup_stop = threading.Event()
+        self._warmup_thread: Optional[threading.Thread] = None
+
+        # Counters reported through get_stats()
+        self._loads = 0
+        self._reloads = 0
+        self._idle_unloads = 0
+        self._unloaded_by_idle = False
+        self._last_load = None
+        self._total_load = 0.0
+        self._last_warmup = None
+        self._warmup_bytes = 0
+        self._warmups = 0
+        self._warmup_error = None
+        self._loaded_at: Optional[float] = None
+
+    def start(self) -> None:
+        """Start the idle monitor (only when idle unloading is enabled)."""
+        if self.idle_unload_seconds is None or (self._monitor and self._monitor.is_alive()):
+            return
+        self._stop.clear()
+        self._monitor = threading.Thread(target=self._monitor_loop, name="llm-lifecycle", daemon=True)
+        self._monitor.start()
+        logger.info(f"LLM idle auto-unload after {self.idle_unload_seconds / 60:.1f} minutes")
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._warmup_stop.set()
+        if self._monitor:
+            self._monitor.join(timeout=5)
+            self._monitor = None
+
+    def touch(self) -> None:
+        """Record model activity, postponing the idle unload."""
+        self._last_active = time.time()
+
+    def idle_seconds(self) -> float:
+        """Seconds since the last recorded activity."""
+        return time.time() - self._last_active
+
+    def record_load(self, seconds: float) -> None:
+        """Record a completed model load."""
+        with self._lock:
+            self._loads += 1
+            if self._unloaded_by_idle:
+                self._reloads += 1
+                self._unloaded_by_idle = False
+            self._last_load = seconds
+            self._total_load += seconds
+            self._loaded_at = time.time()
+            self.state = "loaded"
+        self.touch()
+
+    def record_unload(self) -> None:
+        """Record that the model was unloaded (by the monitor or explicitly)."""
+        self._warmup_stop.set()
+        with self._lock:
+            self.state = "unloaded"
+            self._loaded_at = None
+
+    def start_warmup(self, model_path: Optional[Path], eval_fn: Optional[Callable[[], Any]] = None) -> None:
+        """
+        Warm the freshly loaded model in the background.
+
+        ``page_in`` reads the GGUF into the page cache; ``eval`` calls ``eval_fn``
+        (a one-token decode that touches every weight and allocates compute buffers).
+        """
+        if self.warmup_mode == "none" or (self.warmup_mode == "page_in" and not model_path):
+            return
+        if self.warmup_mode == "eval" and eval_fn is None:
+            return
+        if self._warmup_thread and self._warmup_thread.is_alive():
+            self._warmup_stop.set()
+            self._warmup_thread.join(timeout=5)
+        self._warmup_stop = threading.Event()
+        self._warmup_thread = threading.Thread(
+            target=self._run_warmup, args=(model_path, eval_fn, self._warmup_stop),
+            name="llm-warmup", daemon=True
+        )
+        self._warmup_thread.start()
+
+    def _run_warmup(self, model_path: Optional[Path], eval_fn: Optional[Callable[[], Any]],
+                    stop_event: threading.Event) -> None:
+        with self._lock:
+            self.state = "warming"
+        started = time.perf_counter()
+        warmed_bytes = 0
+        error = None
+        try:
+            if self.warmup_mode == "page_in":
+                warmed_bytes = page_in_file(model_path, stop_event=stop_event)
+            else:
+                eval_fn()
+        except Exception as e:
+            error = str(e)
+            logger.warning(f"LLM warm-up failed: {e}")
+        elapsed = time.perf_counter() - started
+
+        with self._lock:
+            if stop_event.is_set():
+                return  # Unloaded (or reloaded) while warming
+            self._warmups += 1
+            self._last_warmup = elapsed
+            self._warmup_bytes = warmed_bytes
+            self._warmup_error = error
+            self.state = "warm" if error is None else "loaded"
+        if error is None:
+            logger.info(f"LLM warm-up ({self.warmup_mode}) finished in {elapsed:.2f}s")
+
+    def _monitor_loop(self) -> None:
+        """Unload the model once it has been idle long enough."""
+        interval = min(self.check_interval, self.idle_unload_seconds)
+        while not self._stop.wait(interval):
+            if self.state == "unloaded":
+                continue
+            try:
+                if self.is_busy_fn():
+                    self.touch()
+                    continue
+            except Exception as e:
+                logger.debug(f"LLM busy check failed: {e}")
+                continue
+            idle = self.idle_seconds()
+            if idle < self.idle_unload_seconds:
+                continue
+            try:
+                if not self.unload_fn():
+                    continue
+            except Exception as e:
+                logger.error(f"Error unloading idle LLM: {e}")
+                continue
+            logger.info(f"Unloaded LLM after {idle / 60:.1f} idle minutes")
+            with self._lock:
+                self._idle_unloads += 1
+                self._unloaded_by_idle = True
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get load/warm-up timings and idle-unload counters."""
+        with self._lock:
+            return {
+                "state": self.state,
+                "loads": self._loads,
+                "reloads_after_idle": self._reloads,
+                "idle_unloads": self._idle_unloads,
+                "idle_unload_minutes": round(self.idle_unload_seconds / 60, 2) if self.idle_unload_seconds else None,
+                "idle_seconds": round(time.time() - self._last_active, 1),
+                "uptime_seconds": round(time.time() - self._loaded_at, 1) if self._loaded_at else None,
+                "last_load_ms": round(self._last_load * 1000, 2) if self._last_load is not None else None,
+                "avg_load_ms": round(self._total_load / self._loads * 1000, 2) if self._loads else None,
+                "warmup_mode": self.warmup_mode,
+                "warmups": self._warmups,
+                "last_warmup_ms": round(self._last_warmup * 1000, 2) if self._last_warmup is not None else None,
+                "warmup_mb": round(self._warmup_bytes / (1024 * 1024), 1),
+                "warmup_error": self._warmup_error,
+            }
@@ -0,0 +1,113 @@
+"""
+Prompt prefix state cache for AI Companion application.
+Keeps llama.cpp states evaluated over the static, per-character part of the system
+prompt so a new turn only has to evaluate the volatile tail of the prompt.
+"""
+
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class PromptPrefixCache:
+    """
+    LRU of llama.cpp ``save_state()`` snapshots keyed by a hash of the prompt prefix.
+
+    Entries are bounded both by count and by their in-memory size, since a single
+    state holds the KV cache for every prefix token.
+    """
+
+    def __init__(self, max_entries: int = 8, max_size_mb: int = 512):
+        self.max_entries = max(1, int(max_entries))
+        self.max_size_bytes = max(1, int(max_size_mb)) * 1024 * 1024
+
+        self._states: "OrderedDict[str, Any]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._total_size = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.resident_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(prefix: str) -> str:
+        """Hash a prompt prefix into a cache key."""
+        return hashlib.sha1(prefix.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _state_size(state: Any) -> int:
+        """Approximate the memory held by a llama.cpp state snapshot."""
+        size = int(getattr(state, "llama_state_size", 0) or 0)
+        scores = getattr(state, "scores", None)
+        if scores is not None:
+            size += int(getattr(scores, "nbytes", 0))
+        input_ids = getattr(state, "input_ids", None)
+        if input_ids is not None:
+            size += int(getattr(input_ids, "nbytes", 0))
+        return size
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached state for ``key`` (marking it most recently used)."""
+        with self._lock:
+            state = self._states.get(key)
+            if state is None:
+                self.misses += 1
+                return None
+            self._states.move_to_end(key)
+            self.hits += 1
+            return state
+
+    def record_resident_hit(self) -> None:
+        """Count a turn whose slot context already held the prefix."""
+        with self._lock:
+            self.resident_hits += 1
+
+    def put(self, key: str, state: Any) -> None:
+        """Store a state, evicting least recently used entries past the bounds."""
+        size = self._state_size(state)
+        if size > self.max_size_bytes:
+            logger.debug(f"Prompt prefix state too large to cache ({size / 1024 / 1024:.1f} MB)")
+            return
+
+        with self._lock:
+            if key in self._states:
+                self._total_size -= self._sizes.pop(key)
+                del self._states[key]
+            self._states[key] = state
+            self._sizes[key] = size
+            self._total_size += size
+
+            while (len(self._states) > self.max_entries
+                   or self._total_size > self.max_size_bytes):
+                evicted_key, _ = self._states.popitem(last=False)
+                self._total_size -= self._sizes.pop(evicted_key)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """Drop all cached states."""
+        with self._lock:
+            self._states.clear()
+            self._sizes.clear()
+            self._total_size = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get hit/miss counters and memory usage."""
+        with self._lock:
+            lookups = self.hits + self.resident_hits + self.misses
+            return {
+                "entries": len(self._states),
+                "max_entries": self.max_entries,
+                "size_mb": round(self._total_size / 1024 / 1024, 2),
+                "max_size_mb": round(self.max_size_bytes / 1024 / 1024, 2),
+                "hits": self.hits,
+                "resident_hits": self.resident_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round((self.hits + self.resident_hits) / lookups, 3) if lookups else 0.0,
+            }
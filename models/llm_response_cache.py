@@ -0,0 +1,236 @@
+"""
+LLM response cache for AI Companion application.
+Two tiers in front of generation: an in-process LRU and the SQLite ``llm_cache``
+table, plus an optional embedding-similarity lookup for prompts that repeat with
+small variations (greetings, autonomous avatar chatter).
+"""
+
+import hashlib
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    """
+    LRU + SQLite response cache with TTL eviction and background purging.
+
+    Exact lookups use the same md5 key as the original cache table, so rows
+    written before the in-process tier existed are still served. Semantic
+    lookups compare normalized prompt embeddings within one (model_id, user_id)
+    scope and are only used when the caller asks for them.
+    """
+
+    def __init__(self, db_manager, ttl_hours: float = 24, memory_entries: int = 256,
+                 max_entries: int = 5000, purge_interval: float = 600,
+                 semantic_threshold: Optional[float] = None, semantic_max_entries: int = 200,
+                 embed_fn: Optional[Callable[[str], List[float]]] = None):
+        self.db_manager = db_manager
+        self.ttl_seconds = float(ttl_hours) * 3600
+        self.memory_entries = max(1, int(memory_entries))
+        self.max_entries = max(1, int(max_entries))
+        self.purge_interval = max(10.0, float(purge_interval))
+        self.semantic_threshold = semantic_threshold
+        self.semantic_max_entries = max(1, int(semantic_max_entries))
+        self.embed_fn = embed_fn
+
+        self._memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._semantic: Dict[Tuple[str, str], Deque[Tuple[List[float], str, float]]] = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._purge_thread: Optional[threading.Thread] = None
+
+        self._stats = {
+            "memory_hits": 0,
+            "sqlite_hits": 0,
+            "semantic_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "purged": 0,
+            "lookup_time": 0.0,
+            "lookups": 0,
+        }
+
+    @property
+    def semantic_enabled(self) -> bool:
+        return self.semantic_threshold is not None and self.embed_fn is not None
+
+    @staticmethod
+    def make_key(user_input: str, user_id: str, model_id: str, temperature: float) -> str:
+        """Exact-match cache key (compatible with existing llm_cache rows)."""
+        return hashlib.md5(f"{user_input}_{user_id}_{model_id}_{temperature}".encode()).hexdigest()
+
+    def start(self) -> None:
+        """Start the background purge thread."""
+        if self._purge_thread and self._purge_thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._purge_thread = threading.Thread(target=self._purge_loop, name="llm-cache-purge", daemon=True)
+        self._purge_thread.start()
+
+    def stop(self) -> None:
+        """Stop the background purge thread."""
+        self._stop_event.set()
+        if self._purge_thread:
+            self._purge_thread.join(timeout=5)
+            self._purge_thread = None
+
+    def get(self, user_input: str, user_id: str, model_id: str, temperature: float,
+            semantic: bool = False) -> Optional[str]:
+        """Look up a response: memory tier, then SQLite, then (optionally) by similarity."""
+        started = time.perf_counter()
+        key = self.make_key(user_input, user_id, model_id, temperature)
+        try:
+            now = time.time()
+            with self._lock:
+                entry = self._memory.get(key)
+                if entry is not None:
+                    if entry[1] > now:
+                        self._memory.move_to_end(key)
+                        self._stats["memory_hits"] += 1
+                        return entry[0]
+                    del self._memory[key]
+
+            entry = self.db_manager.get_cached_llm_entry(key, model_id)
+            if entry and entry[0]:
+                # The memory tier must not outlive the row it was read from
+                response, expires_at = entry
+                self._remember(key, response, expires_at)
+                with self._lock:
+                    self._stats["sqlite_hits"] += 1
+                return response
+
+            if semantic and self.semantic_enabled:
+                response = self._semantic_lookup(user_input, user_id, model_id, now)
+                if response:
+                    with self._lock:
+                        self._stats["semantic_hits"] += 1
+                    return response
+
+            with self._lock:
+                self._stats["misses"] += 1
+            return None
+        finally:
+            with self._lock:
+                self._stats["lookups"] += 1
+                self._stats["lookup_time"] += time.perf_counter() - started
+
+    def put(self, user_input: str, user_id: str, model_id: str, temperature: float,
+            response: str, model_name: str, semantic: bool = False) -> None:
+        """Store a response in both tiers (and the similarity index when requested)."""
+        key = self.make_key(user_input, user_id, model_id, temperature)
+        expires_at = time.time() + self.ttl_seconds
+        self._remember(key, response, expires_at)
+        self.db_manager.cache_llm_response(
+            input_hash=key,
+            response=response,
+            model_name=model_name,
+            temperature=temperature,
+            model_id=model_id,
+            ttl_hours=self.ttl_seconds / 3600
+        )
+
+        if semantic and self.semantic_enabled:
+            vector = self._embed(user_input)
+            if vector is not None:
+                with self._lock:
+                    entries = self._semantic.setdefault(
+                        (model_id, user_id), deque(maxlen=self.semantic_max_entries)
+                    )
+                    entries.append((vector, response, expires_at))
+
+        with self._lock:
+            self._stats["stores"] += 1
+
+    def _remember(self, key: str, response: str, expires_at: float) -> None:
+        with self._lock:
+            self._memory[key] = (response, expires_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def _embed(self, text: str) -> Optional[List[float]]:
+        """Embed and L2-normalize a prompt."""
+        try:
+            vector = [float(value) for value in self.embed_fn(text)]
+        except Exception as e:
+            logger.warning(f"Response cache embedding failed: {e}")
+            return None
+        norm = math.sqrt(sum(value * value for value in vector))
+        return [value / norm for value in vector] if norm else None
+
+    def _semantic_lookup(self, user_input: str, user_id: str, model_id: str, now: float) -> Optional[str]:
+        with self._lock:
+            entries = list(self._semantic.get((model_id, user_id), ()))
+        if not entries:
+            return None
+        vector = self._embed(user_input)
+        if vector is None:
+            return None
+
+        best_score, best_response = 0.0, None
+        for candidate, response, expires_at in entries:
+            if expires_at <= now:
+                continue
+            score = sum(a * b for a, b in zip(vector, candidate))
+            if score > best_score:
+                best_score, best_response = score, response
+        if best_response is not None and best_score >= self.semantic_threshold:
+            logger.debug(f"Semantic cache hit (similarity {best_score:.3f})")
+            return best_response
+        return None
+
+    def purge(self) -> int:
+        """Drop expired entries from both tiers and trim SQLite to its quota."""
+        now = time.time()
+        with self._lock:
+            expired = [key for key, (_, expires_at) in self._memory.items() if expires_at <= now]
+            for key in expired:
+                del self._memory[key]
+            for scope, entries in list(self._semantic.items()):
+                live = [entry for entry in entries if entry[2] > now]
+                if live:
+                    self._semantic[scope] = deque(live, maxlen=self.semantic_max_entries)
+                else:
+                    del self._semantic[scope]
+
+        removed = self.db_manager.purge_llm_cache(self.max_entries)
+        with self._lock:
+            self._stats["purged"] += removed + len(expired)
+        return removed
+
+    def _purge_loop(self) -> None:
+        while not self._stop_event.wait(self.purge_interval):
+            try:
+                removed = self.purge()
+                if removed:
+                    logger.info(f"Purged {removed} expired or over-quota LLM cache entries")
+            except Exception as e:
+                logger.error(f"Error purging LLM cache: {e}")
+
+    def clear(self) -> None:
+        """Clear the in-process tiers (the caller clears SQLite)."""
+        with self._lock:
+            self._memory.clear()
+            self._semantic.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get hit/miss counters, tier sizes and average lookup latency."""
+        with self._lock:
+            stats = dict(self._stats)
+            hits = stats["memory_hits"] + stats["sqlite_hits"] + stats["semantic_hits"]
+            lookups = stats.pop("lookups")
+            lookup_time = stats.pop("lookup_time")
+            stats.update({
+                "memory_entries": len(self._memory),
+                "semantic_entries": sum(len(entries) for entries in self._semantic.values()),
+                "semantic_enabled": self.semantic_enabled,
+                "hit_ratio": round(hits / lookups, 3) if lookups else 0.0,
+                "avg_lookup_ms": round(lookup_time / lookups * 1000, 3) if lookups else 0.0,
+            })
+            return stats
@@ -0,0 +1,435 @@
+"""
+LLM request scheduler for AI Companion application.
+Queues generation requests in front of the llama.cpp model and dispatches them to a
+configurable number of decode slots, so concurrent chats no longer serialize behind
+a single lock. Requests carry a priority class so interactive chat is served ahead
+of (and can preempt) autonomous avatar chatter and background work, and may carry a
+cancellation token that drops them from the queue or stops their decode early.
+"""
+
+import heapq
+import itertools
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Any, Callable, Dict, List, Optional
+
+from .llm_cancellation import CancellationToken, GenerationCancelled
+
+logger = logging.getLogger(__name__)
+
+
+class RequestPriority(IntEnum):
+    """Priority classes for LLM requests (lower value is served first)."""
+    INTERACTIVE = 0   # A human is waiting on the reply
+    GREETING = 1      # Avatar greetings shown when a model loads
+    AUTONOMOUS = 2    # Avatar-to-avatar conversation and self-reflection
+    BACKGROUND = 3    # Summarization and other housekeeping
+
+
+# Classes whose in-flight generations may be interrupted by interactive requests
+PREEMPTIBLE_PRIORITIES = {RequestPriority.AUTONOMOUS, RequestPriority.BACKGROUND}
+
+
+@dataclass(order=True)
+class LLMRequest:
+    """A generation request waiting for (or running on) a decode slot."""
+    sort_key: tuple
+    fn: Callable[[Any], Any] = field(compare=False)
+    future: Future = field(compare=False)
+    priority: RequestPriority = field(compare=False, default=RequestPriority.INTERACTIVE)
+    enqueued_at: float = field(compare=False, default_factory=time.time)
+    started_at: Optional[float] = field(compare=False, default=None)
+    slot_index: Optional[int] = field(compare=False, default=None)
+    preempt_requested: threading.Event = field(compare=False, default_factory=threading.Event)
+    was_preempted: bool = field(compare=False, default=False)
+    preemptions: int = field(compare=False, default=0)
+    cancel_token: Optional[CancellationToken] = field(compare=False, default=None)
+    preemptible: bool = field(compare=False, default=True)
+
+
+class LLMScheduler:
+    """
+    Dispatches queued LLM requests to a fixed pool of decode slots.
+
+    Each slot owns one llama.cpp context and is driven by its own worker thread.
+    Slot contexts are created lazily through ``slot_factory`` the first time a
+    worker needs one, so a single-slot setup never allocates more than the model
+    that is already loaded.
+
+    When an interactive request arrives and every slot is busy, the lowest-priority
+    preemptible generation is asked to stop (see ``should_stop``). It is put back on
+    the queue and restarted once higher-priority work has drained, up to
+    ``max_preemptions`` times, after which it is allowed to run to completion.
+    Requests submitted with ``preemptible=False`` (work that never polls
+    ``should_stop``, such as streams) are never chosen.
+
+    A request submitted with ``slot=index`` (e.g. a snapshot of the session that
+    slot's context holds) waits in that slot's own queue and runs on its worker
+    before the worker takes the next shared request.
+
+    A request submitted with a ``CancellationToken`` is dropped while still queued
+    once the token fires; a running one sees ``should_stop`` return True, and its
+    future fails with ``GenerationCancelled`` as soon as the slot is released.
+    """
+
+    _SHUTDOWN = object()
+    SLOT_QUEUE_POLL_INTERVAL = 1.0  # How often an idle worker checks its own slot queue
+
+    def __init__(self, slot_factory: Callable[[int], Any], parallel_slots: int = 1,
+                 max_queue_size: int = 64, max_preemptions: int = 3):
+        self.slot_factory = slot_factory
+        self.parallel_slots = max(1, int(parallel_slots))
+        self.max_queue_size = max(1, int(max_queue_size))
+        self.max_preemptions = max(0, int(max_preemptions))
+
+        self._queue: "queue.PriorityQueue[LLMRequest]" = queue.PriorityQueue()
+        self._slot_queues: List["queue.Queue[LLMRequest]"] = [queue.Queue() for _ in range(self.parallel_slots)]
+        self._sequence = itertools.count()
+        self._slots: List[Any] = [None] * self.parallel_slots
+        self._busy: List[bool] = [False] * self.parallel_slots
+        self._running_requests: List[Optional[LLMRequest]] = [None] * self.parallel_slots
+        self._workers: List[threading.Thread] = []
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self._running = False
+
+        # Counters reported through get_stats()
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._last_wait = 0.0
+        self._total_service = 0.0
+        self._preempted = 0
+        self._cancelled_queued = 0
+        self._cancelled_running = 0
+        self._total_cancel_release = 0.0
+        self._max_cancel_release = 0.0
+        self._class_stats: Dict[RequestPriority, Dict[str, float]] = {
+            priority: {"submitted": 0, "completed": 0, "failed": 0, "preempted": 0, "cancelled": 0,
+                       "total_wait": 0.0, "total_latency": 0.0, "max_latency": 0.0}
+            for priority in RequestPriority
+        }
+
+    def start(self) -> None:
+        """Start one worker thread per decode slot."""
+        if self._running:
+            return
+        self._running = True
+        for index in range(self.parallel_slots):
+            worker = threading.Thread(
+                target=self._worker_loop, args=(index,),
+                name=f"llm-slot-{index}", daemon=True
+            )
+            worker.start()
+            self._workers.append(worker)
+        logger.info(f"LLM scheduler started with {self.parallel_slots} decode slot(s)")
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stop all workers and drop slot contexts; pending requests are failed."""
+        if not self._running:
+            return
+        self._running = False
+
+        # Fail anything still queued so callers don't block forever
+        for pending in [self._queue, *self._slot_queues]:
+            while True:
+                try:
+                    request = pending.get_nowait()
+                except queue.Empty:
+                    break
+                if isinstance(request, LLMRequest) and not request.future.done():
+                    request.future.set_exception(RuntimeError("LLM scheduler shut down"))
+
+        for _ in self._workers:
+            self._queue.put(LLMRequest((float("inf"), next(self._sequence)), self._SHUTDOWN, Future()))
+        if wait:
+            for worker in self._workers:
+                worker.join(timeout=30)
+        self._workers = []
+        self._slots = [None] * self.parallel_slots
+        logger.info("LLM scheduler stopped")
+
+    def submit(self, fn: Callable[[Any], Any],
+               priority: RequestPriority = RequestPriority.INTERACTIVE,
+               cancel_token: Optional[CancellationToken] = None,
+               preemptible: bool = True, slot: Optional[int] = None) -> Future:
+        """
+        Queue ``fn`` to run on the next free slot.
+
+        ``fn`` receives the slot's llama.cpp model and its return value resolves the
+        returned future. Cancelling ``cancel_token`` cancels the future while it is
+        queued, or stops the running generation (see ``should_stop``). Pass
+        ``preemptible=False`` when ``fn`` does not poll ``should_stop``, and
+        ``slot`` to run ``fn`` on that slot's context rather than the next free one.
+        """
+        if not self._running:
+            raise RuntimeError("LLM scheduler is not running")
+        priority = RequestPriority(priority)
+        if self._queue.qsize() >= self.max_queue_size:
+            with self._stats_lock:
+                self._rejected += 1
+            raise queue.Full(f"LLM request queue is full ({self.max_queue_size} pending)")
+
+        request = LLMRequest(sort_key=(int(priority), next(self._sequence)), fn=fn,
+                             future=Future(), priority=priority, cancel_token=cancel_token,
+                             preemptible=preemptible)
+        with self._stats_lock:
+            self._submitted += 1
+            self._class_stats[priority]["submitted"] += 1
+            if priority == RequestPriority.INTERACTIVE and slot is None:
+                self._preempt_for(request)
+        if slot is not None:
+            self._slot_queues[slot].put(request)
+        else:
+            self._queue.put(request)
+        if cancel_token is not None:
+            cancel_token.add_callback(lambda _: self._cancel_queued(request))
+        return request.future
+
+    def run(self, fn: Callable[[Any], Any], timeout: Optional[float] = None,
+            priority: RequestPriority = RequestPriority.INTERACTIVE,
+            cancel_token: Optional[CancellationToken] = None,
+            preemptible: bool = True) -> Any:
+        """Submit ``fn`` and block until it has run on a slot."""
+        return self.submit(fn, priority=priority, cancel_token=cancel_token,
+                           preemptible=preemptible).result(timeout=timeout)
+
+    def should_stop(self) -> bool:
+        """
+        Check whether the request running on the calling slot thread should stop.
+
+        Intended to be polled from inside decoding (e.g. a llama.cpp stopping
+        criteria). True is returned for a cancelled request, or for a preempted one,
+        which is recorded so the worker knows the output is partial and the request
+        must be requeued.
+        """
+        request = getattr(self._local, "request", None)
+        if request is None:
+            return False
+        if request.cancel_token is not None and request.cancel_token.cancelled:
+            return True
+        if not request.preempt_requested.is_set():
+            return False
+        request.was_preempted = True
+        return True
+
+    def _preempt_for(self, request: LLMRequest) -> None:
+        """Ask the lowest-priority preemptible generation to yield its slot (stats lock held)."""
+        if not all(self._busy):
+            return
+        candidates = [
+            running for running in self._running_requests
+            if running is not None
+            and running.preemptible
+            and running.priority in PREEMPTIBLE_PRIORITIES
+            and running.priority > request.priority
+            and running.preemptions < self.max_preemptions
+            and not running.preempt_requested.is_set()
+        ]
+        if not candidates:
+            return
+        victim = max(candidates, key=lambda running: (running.priority, running.started_at or 0))
+        victim.preempt_requested.set()
+        logger.info(f"Preempting {victim.priority.name.lower()} generation on slot "
+                    f"{victim.slot_index} for {request.priority.name.lower()} request")
+
+    def _cancel_queued(self, request: LLMRequest) -> None:
+        """Drop a request whose token fired before it reached a slot."""
+        if not request.future.cancel():
+            return  # Already running (or finished); the worker handles it
+        # Take it off the queue so it stops counting against max_queue_size
+        with self._queue.mutex:
+            try:
+                self._queue.queue.remove(request)
+            except ValueError:
+                pass  # A worker already dequeued it and will skip the cancelled future
+            else:
+                heapq.heapify(self._queue.queue)
+        with self._stats_lock:
+            self._cancelled_queued += 1
+            self._class_stats[request.priority]["cancelled"] += 1
+
+    def is_idle(self) -> bool:
+        """True when no request is queued or running."""
+        return (not any(self._busy) and self._queue.empty()
+                and all(slot_queue.empty() for slot_queue in self._slot_queues))
+
+    def current_slot(self) -> Optional[int]:
+        """Index of the slot running on the calling thread (None outside a slot)."""
+        request = getattr(self._local, "request", None)
+        return request.slot_index if request is not None else None
+
+    def get_slot_models(self) -> List[Any]:
+        """Return the slot models that have been created so far."""
+        return [slot for slot in self._slots if slot is not None]
+
+    def _get_slot_model(self, index: int) -> Any:
+        """Return the model for a slot, creating its context on first use."""
+        if self._slots[index] is None:
+            self._slots[index] = self.slot_factory(index)
+        return self._slots[index]
+
+    def _worker_loop(self, index: int) -> None:
+        """Pull requests off the queue and execute them on this worker's slot."""
+        while True:
+            self._run_slot_queue(index)
+            try:
+                request = self._queue.get(timeout=self.SLOT_QUEUE_POLL_INTERVAL)
+            except queue.Empty:
+                continue
+            if request.fn is self._SHUTDOWN:
+                break
+            # Requeued (preempted) requests already have a running future
+            if request.preemptions == 0 and not request.future.set_running_or_notify_cancel():
+                continue
+            if request.cancel_token is not None and request.cancel_token.cancelled:
+                self._finish(request, error=GenerationCancelled(
+                    f"Generation cancelled ({request.cancel_token.reason})"))
+                continue
+
+            self._execute(index, request)
+
+    def _run_slot_queue(self, index: int) -> None:
+        """Run the requests submitted for this particular slot."""
+        slot_queue = self._slot_queues[index]
+        while True:
+            try:
+                request = slot_queue.get_nowait()
+            except queue.Empty:
+                return
+            if request.future.set_running_or_notify_cancel():
+                self._execute(index, request)
+
+    def _execute(self, index: int, request: LLMRequest) -> None:
+        """Run one request on a slot, requeueing it if it was preempted."""
+        started_at = time.time()
+        if request.started_at is None:
+            request.started_at = started_at
+            wait_time = started_at - request.enqueued_at
+        else:
+            wait_time = 0.0
+        request.slot_index = index
+        with self._stats_lock:
+            self._busy[index] = True
+            self._running_requests[index] = request
+            self._total_wait += wait_time
+            self._max_wait = max(self._max_wait, wait_time)
+            self._last_wait = wait_time
+            self._class_stats[request.priority]["total_wait"] += wait_time
+
+        self._local.request = request
+        try:
+            model = self._get_slot_model(index)
+            result = request.fn(model)
+        except BaseException as e:
+            if request.cancel_token is not None and request.cancel_token.cancelled:
+                e = GenerationCancelled(f"Generation cancelled ({request.cancel_token.reason})")
+            self._finish(request, error=e)
+        else:
+            if request.cancel_token is not None and request.cancel_token.cancelled:
+                self._finish(request, error=GenerationCancelled(
+                    f"Generation cancelled ({request.cancel_token.reason})"))
+            elif request.was_preempted:
+                self._requeue(request)
+            else:
+                self._finish(request, result=result)
+        finally:
+            self._local.request = None
+            with self._stats_lock:
+                self._busy[index] = False
+                self._running_requests[index] = None
+                self._total_service += time.time() - started_at
+
+    def _requeue(self, request: LLMRequest) -> None:
+        """Put a preempted request back on the queue behind higher-priority work."""
+        request.preemptions += 1
+        request.was_preempted = False
+        request.preempt_requested.clear()
+        request.sort_key = (int(request.priority), next(self._sequence))
+        with self._stats_lock:
+            self._preempted += 1
+            self._class_stats[request.priority]["preempted"] += 1
+        self._queue.put(request)
+
+    def _finish(self, request: LLMRequest, result: Any = None,
+                error: Optional[BaseException] = None) -> None:
+        """Resolve a request's future and record its end-to-end latency."""
+        now = time.time()
+        latency = now - request.enqueued_at
+        with self._stats_lock:
+            class_stats = self._class_stats[request.priority]
+            if isinstance(error, GenerationCancelled) and request.cancel_token is not None:
+                # Time from the cancel to the slot being handed back
+                release = max(0.0, now - (request.cancel_token.cancelled_at or now))
+                self._cancelled_running += 1
+                self._total_cancel_release += release
+                self._max_cancel_release = max(self._max_cancel_release, release)
+                class_stats["cancelled"] += 1
+            else:
+                if error is not None:
+                    self._failed += 1
+                    class_stats["failed"] += 1
+                else:
+                    self._completed += 1
+                    class_stats["completed"] += 1
+                class_stats["total_latency"] += latency
+                class_stats["max_latency"] = max(class_stats["max_latency"], latency)
+        if error is not None:
+            request.future.set_exception(error)
+        else:
+            request.future.set_result(result)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get queue depth, slot utilisation and wait-time statistics."""
+        with self._stats_lock:
+            finished = self._completed + self._failed + self._cancelled_running
+            return {
+                "running": self._running,
+                "parallel_slots": self.parallel_slots,
+                "slots_initialized": sum(1 for slot in self._slots if slot is not None),
+                "active_slots": sum(1 for busy in self._busy if busy),
+                "queue_depth": self._queue.qsize(),
+                "max_queue_size": self.max_queue_size,
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "avg_wait_ms": round(self._total_wait / finished * 1000, 2) if finished else 0.0,
+                "max_wait_ms": round(self._max_wait * 1000, 2),
+                "last_wait_ms": round(self._last_wait * 1000, 2),
+                "avg_service_ms": round(self._total_service / finished * 1000, 2) if finished else 0.0,
+                "preempted": self._preempted,
+                "cancelled": self._cancelled_queued + self._cancelled_running,
+                "cancelled_in_queue": self._cancelled_queued,
+                "cancelled_running": self._cancelled_running,
+                "avg_cancel_release_ms": round(self._total_cancel_release / self._cancelled_running * 1000, 2)
+                if self._cancelled_running else 0.0,
+                "max_cancel_release_ms": round(self._max_cancel_release * 1000, 2),
+                "by_priority": {
+                    priority.name.lower(): self._format_class_stats(stats)
+                    for priority, stats in self._class_stats.items()
+                },
+            }
+
+    @staticmethod
+    def _format_class_stats(stats: Dict[str, float]) -> Dict[str, Any]:
+        """Convert raw per-class counters into reportable latency figures."""
+        finished = stats["completed"] + stats["failed"]
+        return {
+            "submitted": int(stats["submitted"]),
+            "completed": int(stats["completed"]),
+            "failed": int(stats["failed"]),
+            "preempted": int(stats["preempted"]),
+            "cancelled": int(stats["cancelled"]),
+            "avg_wait_ms": round(stats["total_wait"] / finished * 1000, 2) if finished else 0.0,
+            "avg_latency_ms": round(stats["total_latency"] / finished * 1000, 2) if finished else 0.0,
+            "max_latency_ms": round(stats["max_latency"] * 1000, 2),
+        }
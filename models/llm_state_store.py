@@ -0,0 +1,255 @@
+"""
+On-disk LLM session state store for AI Companion application.
+Persists llama.cpp context snapshots per (user_id, model_id, session_id) so a
+conversation can be resumed after a server restart or model swap without
+re-evaluating its prompt from scratch.
+"""
+
+import hashlib
+import logging
+import os
+import pickle
+import queue
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+STATE_FORMAT_VERSION = 1
+
+SessionKey = Tuple[str, str, str]
+
+
+def get_model_signature(model_path: str, n_ctx: int) -> Dict[str, Any]:
+    """Describe the loaded GGUF so snapshots taken with another model are rejected."""
+    try:
+        import llama_cpp
+        llama_cpp_version = getattr(llama_cpp, "__version__", "unknown")
+    except ImportError:
+        llama_cpp_version = "unknown"
+
+    stat = os.stat(model_path)
+    return {
+        "model_file": os.path.basename(model_path),
+        "model_size": stat.st_size,
+        "model_mtime": int(stat.st_mtime),
+        "n_ctx": int(n_ctx),
+        "llama_cpp_version": llama_cpp_version,
+    }
+
+
+class SessionStateStore:
+    """
+    Size-bounded directory of pickled llama.cpp states, one file per session.
+
+    Each file holds a small header (format version, model signature, session
+    identity) followed by the state itself, so stale snapshots can be rejected
+    without unpickling the KV cache. Least recently used files are evicted once
+    the directory exceeds ``max_size_mb``.
+
+    ``save_async`` hands a snapshot to a background writer so pickling and disk
+    I/O stay off the request path; until it is written, ``load`` serves the
+    snapshot from memory. At most ``max_pending`` snapshots wait for the writer,
+    beyond that the oldest unwritten one is dropped.
+    """
+
+    FILE_SUFFIX = ".llmstate"
+
+    def __init__(self, directory: Path, max_size_mb: int = 2048, max_pending: int = 2):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_size_bytes = max(1, int(max_size_mb)) * 1024 * 1024
+        self.max_pending = max(1, int(max_pending))
+        self.model_signature: Optional[Dict[str, Any]] = None
+        self._lock = threading.Lock()
+
+        # Snapshots waiting for the writer thread: key -> (state, model signature)
+        self._pending: "OrderedDict[SessionKey, Tuple[Any, Optional[Dict[str, Any]]]]" = OrderedDict()
+        self._pending_lock = threading.Lock()
+        self._write_queue: "queue.Queue[Optional[SessionKey]]" = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+
+        self.saves = 0
+        self.restores = 0
+        self.misses = 0
+        self.rejected = 0
+        self.evictions = 0
+        self.pending_hits = 0
+        self.dropped = 0
+
+    def set_model_signature(self, signature: Optional[Dict[str, Any]]) -> None:
+        """Set the signature of the currently loaded model."""
+        self.model_signature = signature
+
+    def _path_for(self, key: SessionKey) -> Path:
+        digest = hashlib.sha1("\x1f".join(key).encode("utf-8")).hexdigest()
+        return self.directory / f"{digest}{self.FILE_SUFFIX}"
+
+    def save(self, key: SessionKey, state: Any, signature: Optional[Dict[str, Any]] = None) -> bool:
+        """Write a session snapshot, then enforce the size bound."""
+        signature = signature or self.model_signature
+        if signature is None:
+            return False
+        user_id, model_id, session_id = key
+        header = {
+            "format_version": STATE_FORMAT_VERSION,
+            "model_signature": signature,
+            "user_id": user_id,
+            "model_id": model_id,
+            "session_id": session_id,
+            "saved_at": time.time(),
+        }
+        path = self._path_for(key)
+        tmp_path = path.with_suffix(".tmp")
+        try:
+            with self._lock:
+                with open(tmp_path, "wb") as f:
+                    pickle.dump(header, f, protocol=pickle.HIGHEST_PROTOCOL)
+                    pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_path, path)
+                self.saves += 1
+                self._evict_locked()
+            return True
+        except Exception as e:
+            logger.error(f"Error saving LLM session state: {e}")
+            try:
+                tmp_path.unlink()
+            except OSError:
+                pass
+            return False
+
+    def save_async(self, key: SessionKey, state: Any) -> bool:
+        """Queue a snapshot for the background writer; it replaces any unwritten one for ``key``."""
+        if self.model_signature is None:
+            return False
+        with self._pending_lock:
+            self._pending[key] = (state, self.model_signature)
+            self._pending.move_to_end(key)
+            while len(self._pending) > self.max_pending:
+                dropped_key, _ = self._pending.popitem(last=False)
+                self.dropped += 1
+                logger.debug(f"Dropped unwritten LLM session snapshot for {dropped_key}")
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(target=self._writer_loop, name="llm-state-writer", daemon=True)
+                self._writer.start()
+        self._write_queue.put(key)
+        return True
+
+    def flush(self, timeout: float = 30.0) -> bool:
+        """Block until every queued snapshot has been written; returns False on timeout."""
+        deadline = time.time() + timeout
+        while True:
+            with self._pending_lock:
+                if not self._pending and self._write_queue.unfinished_tasks == 0:
+                    return True
+            if time.time() >= deadline:
+                return False
+            time.sleep(0.01)
+
+    def _writer_loop(self) -> None:
+        """Write queued snapshots to disk, newest state per session."""
+        while True:
+            key = self._write_queue.get()
+            try:
+                with self._pending_lock:
+                    entry = self._pending.get(key)
+                if entry is None:
+                    continue  # Already written by an earlier wake-up, or dropped
+                state, signature = entry
+                self.save(key, state, signature)
+                with self._pending_lock:
+                    # Keep it if a newer snapshot replaced it while writing
+                    if self._pending.get(key) is entry:
+                        del self._pending[key]
+            finally:
+                self._write_queue.task_done()
+
+    def load(self, key: SessionKey) -> Optional[Any]:
+        """Load a session snapshot if one exists for the currently loaded model."""
+        with self._pending_lock:
+            entry = self._pending.get(key)
+        if entry is not None and entry[1] == self.model_signature:
+            with self._lock:
+                self.pending_hits += 1
+                self.restores += 1
+            return entry[0]
+
+        path = self._path_for(key)
+        with self._lock:
+            if not path.exists():
+                self.misses += 1
+                return None
+            try:
+                with open(path, "rb") as f:
+                    header = pickle.load(f)
+                    if (header.get("format_version") != STATE_FORMAT_VERSION
+                            or header.get("model_signature") != self.model_signature):
+                        self.rejected += 1
+                        f.close()
+                        path.unlink()
+                        logger.info("Discarded LLM session snapshot taken with a different model")
+                        return None
+                    state = pickle.load(f)
+                os.utime(path)  # Mark as recently used for eviction
+                self.restores += 1
+                return state
+            except Exception as e:
+                logger.error(f"Error loading LLM session state: {e}")
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+                return None
+
+    def delete(self, key: SessionKey) -> None:
+        """Remove the snapshot for a session."""
+        with self._pending_lock:
+            self._pending.pop(key, None)
+        with self._lock:
+            try:
+                self._path_for(key).unlink()
+            except FileNotFoundError:
+                pass
+
+    def _evict_locked(self) -> None:
+        """Delete least recently used snapshots until the store fits its bound."""
+        files = []
+        total = 0
+        for path in self.directory.glob(f"*{self.FILE_SUFFIX}"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+        files.sort()
+        while total > self.max_size_bytes and files:
+            _, size, path = files.pop(0)
+            try:
+                path.unlink()
+                total -= size
+                self.evictions += 1
+            except OSError:
+                pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get snapshot counts, disk usage and save/restore counters."""
+        with self._lock:
+            sizes = [path.stat().st_size for path in self.directory.glob(f"*{self.FILE_SUFFIX}")]
+            return {
+                "snapshots": len(sizes),
+                "size_mb": round(sum(sizes) / 1024 / 1024, 2),
+                "max_size_mb": round(self.max_size_bytes / 1024 / 1024, 2),
+                "saves": self.saves,
+                "restores": self.restores,
+                "misses": self.misses,
+                "rejected": self.rejected,
+                "evictions": self.evictions,
+                "pending_writes": len(self._pending),
+                "pending_hits": self.pending_hits,
+                "dropped": self.dropped,
+            }
@@ -0,0 +1,372 @@
+"""
+Out-of-process LLM worker pool for AI Companion application.
+Runs llama.cpp contexts in dedicated worker processes, keeping token decoding off
+the Flask/SocketIO process (and its GIL). Each worker is exposed through a proxy
+that behaves like a ``llama_cpp.Llama`` instance, so it can be used directly as a
+scheduler decode slot.
+"""
+
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Llama methods a proxy may invoke remotely
+_REMOTE_METHODS = {"tokenize", "detokenize", "eval", "reset", "save_state", "load_state", "n_ctx"}
+_REMOTE_ATTRIBUTES = {"n_tokens", "input_ids"}
+
+
+def _worker_main(conn, model_path: str, llama_kwargs: Dict[str, Any], abort_event) -> None:
+    """Worker process entry point: load the model and serve requests from the pipe."""
+    # Keep llama.cpp from writing escape sequences to the parent's terminal
+    os.environ["TERM"] = "dumb"
+    os.environ.pop("TERMINFO", None)
+
+    try:
+        from llama_cpp import Llama, StoppingCriteriaList
+        model = Llama(model_path=model_path, verbose=False, **llama_kwargs)
+    except Exception as e:
+        conn.send(("error", f"Failed to load model: {e}"))
+        return
+
+    # Lets the parent interrupt a running completion (preemption, abandoned streams)
+    stopping_criteria = StoppingCriteriaList([lambda input_ids, logits: abort_event.is_set()])
+    conn.send(("ready", {"pid": os.getpid(), "n_ctx": model.n_ctx()}))
+
+    while True:
+        try:
+            op, args, kwargs = conn.recv()
+        except (EOFError, OSError):
+            break
+
+        try:
+            if op == "shutdown":
+                break
+            elif op == "ping":
+                conn.send(("ok", time.time()))
+            elif op == "complete":
+                abort_event.clear()
+                kwargs["stopping_criteria"] = stopping_criteria
+                if kwargs.get("stream"):
+                    for chunk in model(*args, **kwargs):
+                        conn.send(("chunk", chunk))
+                    conn.send(("end", None))
+                else:
+                    conn.send(("ok", model(*args, **kwargs)))
+            elif op == "call" and args[0] in _REMOTE_METHODS:
+                conn.send(("ok", getattr(model, args[0])(*args[1:], **kwargs)))
+            elif op == "get" and args[0] in _REMOTE_ATTRIBUTES:
+                value = getattr(model, args[0])
+                conn.send(("ok", list(value) if args[0] == "input_ids" else value))
+            else:
+                conn.send(("error", f"Unsupported operation: {op}"))
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+
+
+class LLMWorkerError(RuntimeError):
+    """Raised when a worker process fails or dies during a request."""
+
+
+class LLMWorker:
+    """
+    Proxy for a llama.cpp model living in a worker process.
+
+    Supports the subset of the ``Llama`` API the handler uses: ``__call__``
+    (blocking or streaming), tokenize/eval/reset, save_state/load_state, n_ctx,
+    n_tokens and input_ids. Local ``stopping_criteria`` are polled while waiting
+    and forwarded to the worker as an abort signal.
+    """
+
+    POLL_INTERVAL = 0.05
+    DRAIN_TIMEOUT = 10.0  # How long an aborted stream may keep sending before the worker is respawned
+
+    def __init__(self, index: int, model_path: str, llama_kwargs: Dict[str, Any],
+                 startup_timeout: float = 300.0):
+        self.index = index
+        self.model_path = model_path
+        self.llama_kwargs = llama_kwargs
+        self.startup_timeout = startup_timeout
+
+        self._mp = multiprocessing.get_context("spawn")
+        self._lock = threading.RLock()
+        self._process = None
+        self._conn = None
+        self._abort_event = None
+
+        self.pid: Optional[int] = None
+        self.restarts = 0
+        self.requests = 0
+        self.last_ping_ms: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    def start(self) -> None:
+        """Spawn the worker process and wait until its model is loaded."""
+        with self._lock:
+            parent_conn, child_conn = self._mp.Pipe()
+            self._abort_event = self._mp.Event()
+            self._process = self._mp.Process(
+                target=_worker_main,
+                args=(child_conn, self.model_path, self.llama_kwargs, self._abort_event),
+                name=f"llm-worker-{self.index}",
+                daemon=True
+            )
+            self._process.start()
+            child_conn.close()
+            self._conn = parent_conn
+
+            if not self._conn.poll(self.startup_timeout):
+                self.stop()
+                raise LLMWorkerError(f"LLM worker {self.index} did not start within {self.startup_timeout}s")
+            status, payload = self._conn.recv()
+            if status != "ready":
+                self.stop()
+                raise LLMWorkerError(f"LLM worker {self.index} failed to start: {payload}")
+            self.pid = payload["pid"]
+            logger.info(f"LLM worker {self.index} ready (pid {self.pid}, "
+                        f"n_threads={self.llama_kwargs.get('n_threads')})")
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Ask the worker to exit, killing it if it does not."""
+        with self._lock:
+            if self._process is None:
+                return
+            try:
+                if self._process.is_alive():
+                    self._conn.send(("shutdown", (), {}))
+            except (OSError, BrokenPipeError):
+                pass
+            self._process.join(timeout)
+            if self._process.is_alive():
+                self._process.kill()
+                self._process.join(timeout)
+            self._conn.close()
+            self._process = None
+            self._conn = None
+
+    def restart(self) -> None:
+        """Replace a dead or unhealthy worker process."""
+        with self._lock:
+            self.stop(timeout=2.0)
+            self.restarts += 1
+            logger.warning(f"Respawning LLM worker {self.index} (restart #{self.restarts})")
+            self.start()
+
+    def is_alive(self) -> bool:
+        return self._process is not None and self._process.is_alive()
+
+    def ping(self, timeout: float = 5.0) -> bool:
+        """Health check: round-trip a ping if the worker is idle."""
+        if not self._lock.acquire(blocking=False):
+            return True  # Busy serving a request, which is proof enough of life
+        try:
+            if not self.is_alive():
+                return False
+            started = time.time()
+            self._conn.send(("ping", (), {}))
+            if not self._conn.poll(timeout):
+                return False
+            self._conn.recv()
+            self.last_ping_ms = round((time.time() - started) * 1000, 2)
+            return True
+        except (OSError, EOFError, BrokenPipeError):
+            return False
+        finally:
+            self._lock.release()
+
+    def _receive(self, stopping_criteria=None):
+        """Wait for the next message, forwarding local stop requests to the worker."""
+        # Checked on every message as well: a stream delivering chunks faster than
+        # POLL_INTERVAL would otherwise never reach the timeout branch
+        self._check_stop(stopping_criteria)
+        while not self._conn.poll(self.POLL_INTERVAL):
+            if not self._process.is_alive():
+                self.last_error = "worker process died"
+                raise LLMWorkerError(f"LLM worker {self.index} died during a request")
+            self._check_stop(stopping_criteria)
+        status, payload = self._conn.recv()
+        if status == "error":
+            self.last_error = payload
+            raise LLMWorkerError(payload)
+        return status, payload
+
+    def _check_stop(self, stopping_criteria) -> None:
+        """Ask the worker to abort once a cancel or preemption has been requested locally."""
+        if (stopping_criteria is not None and not self._abort_event.is_set()
+                and stopping_criteria(None, None)):
+            self._abort_event.set()
+
+    def _request(self, op: str, *args, **kwargs) -> Any:
+        with self._lock:
+            self._ensure_running()
+            self._conn.send((op, args, kwargs))
+            return self._receive()[1]
+
+    def _ensure_running(self) -> None:
+        if not self.is_alive():
+            self.restart()
+
+    def __call__(self, prompt: str, stopping_criteria=None, stream: bool = False, **kwargs):
+        """Run a completion in the worker, mirroring ``Llama.__call__``."""
+        if stream:
+            return self._stream(prompt, stopping_criteria, **kwargs)
+        with self._lock:
+            self._ensure_running()
+            self.requests += 1
+            self._conn.send(("complete", (prompt,), kwargs))
+            return self._receive(stopping_criteria)[1]
+
+    def _stream(self, prompt: str, stopping_criteria=None, **kwargs) -> Iterator[Dict[str, Any]]:
+        with self._lock:
+            self._ensure_running()
+            self.requests += 1
+            self._conn.send(("complete", (prompt,), dict(kwargs, stream=True)))
+            finished = False
+            try:
+                while True:
+                    try:
+                        status, payload = self._receive(stopping_criteria)
+                    except LLMWorkerError:
+                        finished = True  # An error ends the stream; nothing more follows it
+                        raise
+                    if status == "end":
+                        finished = True
+                        return
+                    yield payload
+            finally:
+                if not finished and self.is_alive():
+                    self._drain_stream()
+
+    def _drain_stream(self) -> None:
+        """
+        Abort a stream the consumer stopped reading and discard its remaining
+        chunks, respawning the worker if it does not finish within DRAIN_TIMEOUT.
+        """
+        self._abort_event.set()
+        deadline = time.time() + self.DRAIN_TIMEOUT
+        try:
+            while True:
+                remaining = deadline - time.time()
+                if remaining <= 0 or not self._conn.poll(remaining):
+                    break
+                status, _ = self._conn.recv()
+                if status in ("end", "error"):
+                    return
+        except (EOFError, OSError):
+            return  # The worker died; the next request respawns it
+
+        self.last_error = f"stream did not stop within {self.DRAIN_TIMEOUT}s"
+        logger.warning(f"LLM worker {self.index} ignored an abort, respawning it")
+        try:
+            self.restart()
+        except Exception as e:
+            self.last_error = str(e)
+            logger.error(f"Failed to respawn LLM worker {self.index}: {e}")
+
+    # Remote Llama API used by the prefix cache and session snapshots
+    def tokenize(self, *args, **kwargs):
+        return self._request("call", "tokenize", *args, **kwargs)
+
+    def detokenize(self, *args, **kwargs):
+        return self._request("call", "detokenize", *args, **kwargs)
+
+    def eval(self, tokens):
+        return self._request("call", "eval", list(tokens))
+
+    def reset(self):
+        return self._request("call", "reset")
+
+    def save_state(self):
+        return self._request("call", "save_state")
+
+    def load_state(self, state):
+        return self._request("call", "load_state", state)
+
+    def n_ctx(self) -> int:
+        return self._request("call", "n_ctx")
+
+    @property
+    def n_tokens(self) -> int:
+        return self._request("get", "n_tokens")
+
+    @property
+    def input_ids(self) -> List[int]:
+        return self._request("get", "input_ids")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "index": self.index,
+            "pid": self.pid,
+            "alive": self.is_alive(),
+            "requests": self.requests,
+            "restarts": self.restarts,
+            "last_ping_ms": self.last_ping_ms,
+            "last_error": self.last_error,
+        }
+
+
+class LLMWorkerPool:
+    """Fixed-size pool of LLM worker processes with health checks and respawn."""
+
+    def __init__(self, model_path: str, llama_kwargs: Dict[str, Any], size: int = 1,
+                 threads_per_worker: Optional[int] = None, health_check_interval: float = 15.0,
+                 startup_timeout: float = 300.0):
+        self.size = max(1, int(size))
+        self.health_check_interval = max(1.0, float(health_check_interval))
+
+        # Split the CPU budget between workers unless told otherwise
+        if not threads_per_worker:
+            threads_per_worker = max(1, (os.cpu_count() or 1) // self.size)
+        worker_kwargs = dict(llama_kwargs, n_threads=int(threads_per_worker))
+
+        self.workers = [
+            LLMWorker(index, str(model_path), worker_kwargs, startup_timeout=startup_timeout)
+            for index in range(self.size)
+        ]
+        self._stop_event = threading.Event()
+        self._monitor: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Start all workers and the health monitor."""
+        for worker in self.workers:
+            worker.start()
+        self._stop_event.clear()
+        self._monitor = threading.Thread(target=self._monitor_loop, name="llm-worker-monitor", daemon=True)
+        self._monitor.start()
+        logger.info(f"LLM worker pool started with {self.size} worker(s)")
+
+    def shutdown(self) -> None:
+        """Stop the health monitor and all workers."""
+        self._stop_event.set()
+        if self._monitor:
+            self._monitor.join(timeout=5)
+            self._monitor = None
+        for worker in self.workers:
+            worker.stop()
+        logger.info("LLM worker pool stopped")
+
+    def _monitor_loop(self) -> None:
+        """Ping idle workers and respawn the ones that crashed or hung."""
+        while not self._stop_event.wait(self.health_check_interval):
+            for worker in self.workers:
+                if self._stop_event.is_set():
+                    return
+                if worker.ping():
+                    continue
+                try:
+                    worker.restart()
+                except Exception as e:
+                    worker.last_error = str(e)
+                    logger.error(f"Failed to respawn LLM worker {worker.index}: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get per-worker health and request counters."""
+        return {
+            "size": self.size,
+            "alive": sum(1 for worker in self.workers if worker.is_alive()),
+            "workers": [worker.get_stats() for worker in self.workers],
+        }
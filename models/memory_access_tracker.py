@@ -0,0 +1,195 @@
+"""
+Memory access tracking for AI Companion application.
+Retrieval records which memories were read in an in-process buffer instead of
+issuing an UPDATE per returned row; a background flusher folds the buffered
+events into one batched UPDATE, keeping memory lookups read-only.
+"""
+
+import atexit
+import logging
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# One tracker per database in this process, shared by every MemorySystem on it
+_shared: Dict[str, "MemoryAccessTracker"] = {}
+_shared_lock = threading.Lock()
+
+
+class MemoryAccessTracker:
+    """
+    Write-behind buffer for ``memories.access_count`` / ``last_accessed``.
+
+    Accesses are aggregated per memory id. The buffer is flushed every
+    ``flush_interval`` seconds, as soon as ``max_pending`` distinct memories are
+    waiting, and at interpreter exit, so a crash loses at most ``flush_interval``
+    seconds or ``max_pending`` memories' worth of access counts. Access counts
+    only feed ranking, which is why they are not journaled like conversation writes.
+    """
+
+    def __init__(self, connect: Callable[[], sqlite3.Connection], flush_interval: float = 5.0,
+                 max_pending: int = 256):
+        self.connect = connect
+        self.flush_interval = max(0.1, float(flush_interval))
+        self.max_pending = max(1, int(max_pending))
+
+        # memory id -> [access count, last access time]
+        self._pending: Dict[int, List[float]] = {}
+        self._oldest_pending = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._worker = None
+
+        self._stats = {
+            "recorded": 0,
+            "flushed": 0,
+            "flushes": 0,
+            "flush_errors": 0,
+            "flush_time": 0.0,
+            "max_rows_per_flush": 0,
+        }
+        self._last_error = None
+
+    def start(self) -> None:
+        """Start the background flusher."""
+        if self._worker and self._worker.is_alive():
+            return
+        self._stop_event.clear()
+        self._worker = threading.Thread(target=self._worker_loop, name="memory-access-flusher", daemon=True)
+        self._worker.start()
+        atexit.register(self.stop)
+
+    def stop(self) -> None:
+        """Stop the flusher and write out whatever is buffered."""
+        self._stop_event.set()
+        self._wake_event.set()
+        if self._worker:
+            self._worker.join(timeout=5)
+            self._worker = None
+        self.flush()
+
+    def record(self, memory_ids: Iterable[int]) -> None:
+        """Buffer one access of each memory in ``memory_ids``."""
+        now = time.time()
+        with self._lock:
+            for memory_id in memory_ids:
+                entry = self._pending.get(memory_id)
+                if entry is None:
+                    self._pending[memory_id] = [1, now]
+                else:
+                    entry[0] += 1
+                    entry[1] = now
+                self._stats["recorded"] += 1
+            if self._pending and self._oldest_pending is None:
+                self._oldest_pending = now
+            full = len(self._pending) >= self.max_pending
+        if full:
+            if self._worker:
+                self._wake_event.set()
+            else:
+                self.flush()
+
+    def flush(self) -> int:
+        """Apply buffered accesses in one transaction; returns the number of memories updated."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                self._oldest_pending = None
+            if not pending:
+                return 0
+
+            rows: List[Tuple[int, str, int]] = [
+                (int(count), time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(accessed)), memory_id)
+                for memory_id, (count, accessed) in pending.items()
+            ]
+            started = time.perf_counter()
+            try:
+                with self.connect() as conn:
+                    conn.executemany("""
+                        UPDATE memories
+                        SET access_count = access_count + ?,
+                            last_accessed = MAX(COALESCE(last_accessed, ''), ?)
+                        WHERE id = ?
+                    """, rows)
+                    conn.commit()
+            except Exception as e:
+                self._requeue(pending)
+                with self._lock:
+                    self._stats["flush_errors"] += 1
+                self._last_error = str(e)
+                logger.error(f"Error flushing memory access tracking: {e}")
+                return 0
+
+            with self._lock:
+                self._stats["flushed"] += len(rows)
+                self._stats["flushes"] += 1
+                self._stats["flush_time"] += time.perf_counter() - started
+                self._stats["max_rows_per_flush"] = max(self._stats["max_rows_per_flush"], len(rows))
+            return len(rows)
+
+    def _requeue(self, pending: Dict[int, List[float]]) -> None:
+        """Merge a failed batch back into the buffer for the next flush."""
+        with self._lock:
+            for memory_id, (count, accessed) in pending.items():
+                entry = self._pending.get(memory_id)
+                if entry is None:
+                    self._pending[memory_id] = [count, accessed]
+                else:
+                    entry[0] += count
+                    entry[1] = max(entry[1], accessed)
+            if self._oldest_pending is None:
+                self._oldest_pending = min(accessed for _, accessed in pending.values())
+
+    def _worker_loop(self) -> None:
+        while not self._stop_event.is_set():
+            self._wake_event.wait(self.flush_interval)
+            self._wake_event.clear()
+            if self._stop_event.is_set():
+                break
+            if self._pending:
+                self.flush()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get buffered/flushed access counts and flush timings."""
+        with self._lock:
+            stats = dict(self._stats)
+            flushes = stats["flushes"]
+            flush_time = stats.pop("flush_time")
+            stats.update({
+                "running": bool(self._worker and self._worker.is_alive()),
+                "pending": len(self._pending),
+                "oldest_pending_ms": round((time.time() - self._oldest_pending) * 1000, 2)
+                if self._oldest_pending else 0.0,
+                "avg_flush_ms": round(flush_time / flushes * 1000, 2) if flushes else 0.0,
+                "flush_interval": self.flush_interval,
+                "max_pending": self.max_pending,
+                "last_error": self._last_error,
+            })
+            return stats
+
+
+def shared_access_tracker(db_key: str, connect: Callable[[], sqlite3.Connection],
+                          flush_interval: float = 5.0, max_pending: int = 256) -> MemoryAccessTracker:
+    """
+    The started tracker for the database ``db_key``, created on first use with
+    these settings. Sharing it means one flush writes out every buffered access
+    to that database, whichever MemorySystem recorded it.
+    """
+    with _shared_lock:
+        tracker = _shared.get(db_key)
+        if tracker is None:
+            tracker = _shared[db_key] = MemoryAccessTracker(connect, flush_interval, max_pending)
+            tracker.start()
+        return tracker
+
+
+def flush_shared_access_tracker(db_key: str) -> int:
+    """Flush the shared tracker of ``db_key``, if there is one; returns the number of memories updated."""
+    with _shared_lock:
+        tracker = _shared.get(db_key)
+    return tracker.flush() if tracker is not None else 0
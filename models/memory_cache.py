@@ -0,0 +1,108 @@
+"""
+Memory context cache for AI Companion application.
+Keeps each active user/model pair's top memories, grouped by memory type, in an
+in-process LRU so building the memory section of a prompt doesn't go back to
+SQLite every turn. Writers invalidate the affected pairs.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+MemoryGroups = Dict[str, List[Any]]
+
+
+class MemoryContextCache:
+    """
+    Bounded LRU of ``memory_type -> [MemoryItem]`` groups per (user_id, model_id).
+
+    Entries are dropped by ``invalidate``/``invalidate_user`` when memories are
+    added, re-scored or cleaned up, and expire after ``ttl_seconds`` as a bound on
+    staleness from writes that bypass MemorySystem. A load that overlaps an
+    invalidation is returned to its caller but not cached.
+    """
+
+    def __init__(self, max_entries: int = 128, ttl_seconds: float = 300):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl_seconds = max(1.0, float(ttl_seconds))
+
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[MemoryGroups, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._invalidation_count = 0
+
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "invalidations": 0,
+            "evictions": 0,
+            "load_time": 0.0,
+            "hit_time": 0.0,
+        }
+
+    def get(self, user_id: str, model_id: str, loader: Callable[[str, str], MemoryGroups]) -> MemoryGroups:
+        """Return the cached groups for a pair, calling ``loader(user_id, model_id)`` on a miss."""
+        started = time.perf_counter()
+        key = (user_id, model_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] > time.time():
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    self._stats["hit_time"] += time.perf_counter() - started
+                    return entry[0]
+                del self._entries[key]
+            generation = self._invalidation_count
+
+        groups = loader(user_id, model_id)
+
+        with self._lock:
+            self._stats["misses"] += 1
+            self._stats["load_time"] += time.perf_counter() - started
+            if generation == self._invalidation_count:
+                self._entries[key] = (groups, time.time() + self.ttl_seconds)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self._stats["evictions"] += 1
+        return groups
+
+    def invalidate(self, user_id: str, model_id: str) -> None:
+        """Drop one user/model pair."""
+        with self._lock:
+            self._invalidation_count += 1
+            if self._entries.pop((user_id, model_id), None) is not None:
+                self._stats["invalidations"] += 1
+
+    def invalidate_user(self, user_id: str) -> None:
+        """Drop every model's entry for ``user_id``."""
+        with self._lock:
+            self._invalidation_count += 1
+            for key in [key for key in self._entries if key[0] == user_id]:
+                del self._entries[key]
+                self._stats["invalidations"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._invalidation_count += 1
+            self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get hit/miss counters, size and hit/load latencies."""
+        with self._lock:
+            stats = dict(self._stats)
+            hits, misses = stats["hits"], stats["misses"]
+            hit_time = stats.pop("hit_time")
+            load_time = stats.pop("load_time")
+            stats.update({
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hit_ratio": round(hits / (hits + misses), 3) if hits + misses else 0.0,
+                "avg_hit_us": round(hit_time / hits * 1e6, 2) if hits else 0.0,
+                "avg_load_ms": round(load_time / misses * 1000, 3) if misses else 0.0,
+            })
+            return stats
@@ -0,0 +1,293 @@
+"""
+Memory consolidation for AI Companion application.
+Memory extraction stores a new row every time the user repeats a fact ("User's
+name is Sam" on every introduction) or restates a preference. A scheduled pass
+clusters near-identical memories of each user/model pair and folds every
+cluster into a single row.
+"""
+
+import logging
+import re
+import sqlite3
+import threading
+import time
+import weakref
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# One consolidator per database in this process, shared by every MemorySystem on it
+_shared: Dict[str, "MemoryConsolidator"] = {}
+_shared_lock = threading.Lock()
+
+_NON_WORD = re.compile(r"[^\w]+")
+
+# (id, memory_type, value_content, importance_score, access_count, created_at, last_accessed)
+MemoryRow = Tuple[int, str, str, float, int, str, str]
+
+
+def normalize_memory_text(text: str) -> str:
+    """Case-, punctuation- and whitespace-insensitive form of a memory used as its dedup key."""
+    return " ".join(_NON_WORD.sub(" ", text.lower()).split())
+
+
+class MemoryConsolidator:
+    """
+    Deduplicates the memories table per (user_id, model_id) and memory type.
+
+    Memories whose normalized text is identical always form a cluster. With an
+    ``embed_fn`` (texts -> 2-D array) and NumPy available, clusters whose
+    representatives have cosine similarity of at least ``similarity_threshold``
+    are joined too; similarities are computed as one matrix product per type.
+    Each cluster is merged into its most important row, which takes the summed
+    access counts, the highest importance, the earliest ``created_at`` and the
+    latest ``last_accessed``; the other rows are deleted.
+    """
+
+    def __init__(self, connect: Callable[[], sqlite3.Connection],
+                 embed_fn: Optional[Callable[[List[str]], Any]] = None,
+                 similarity_threshold: float = 0.92, interval_hours: Optional[float] = 24,
+                 max_embedded: int = 2000, on_merged: Optional[Callable[[str, str], None]] = None,
+                 before_run: Optional[Callable[[], Any]] = None):
+        self.connect = connect
+        self.embed_fn = embed_fn if np is not None else None
+        self.similarity_threshold = float(similarity_threshold)
+        self.interval_seconds = float(interval_hours) * 3600 if interval_hours else None
+        self.max_embedded = max(2, int(max_embedded))
+        self.before_run = before_run
+        # Called as listener(user_id, model_id) after a pair's rows were merged
+        self._merge_listeners: List[Callable[[], Optional[Callable[[str, str], None]]]] = []
+        if on_merged is not None:
+            self.add_merge_listener(on_merged)
+
+        self._lock = threading.Lock()
+        self._run_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self._stats = {
+            "runs": 0,
+            "pairs_scanned": 0,
+            "rows_scanned": 0,
+            "clusters_merged": 0,
+            "rows_reclaimed": 0,
+            "embedding_merges": 0,
+            "run_time": 0.0,
+        }
+        self._last_run: Optional[Dict[str, Any]] = None
+        self._last_error: Optional[str] = None
+
+        if embed_fn is not None and np is None:
+            logger.warning("NumPy not available, memory consolidation uses exact text matches only")
+
+    def add_merge_listener(self, listener: Callable[[str, str], None]) -> None:
+        """Call ``listener(user_id, model_id)`` after merges; bound methods are held weakly."""
+        ref = weakref.WeakMethod(listener) if hasattr(listener, "__self__") else (lambda: listener)
+        with self._lock:
+            self._merge_listeners.append(ref)
+
+    def _notify_merged(self, user_id: str, model_id: str) -> None:
+        with self._lock:
+            self._merge_listeners = [ref for ref in self._merge_listeners if ref() is not None]
+            listeners = [ref() for ref in self._merge_listeners]
+        for listener in listeners:
+            if listener is None:
+                continue
+            try:
+                listener(user_id, model_id)
+            except Exception as e:
+                logger.error(f"Memory merge listener failed: {e}")
+
+    def start(self, initial_delay: float = 300) -> None:
+        """Run ``consolidate_all`` every ``interval_hours`` (first run after ``initial_delay`` seconds)."""
+        if self.interval_seconds is None or (self._thread and self._thread.is_alive()):
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._schedule_loop, args=(initial_delay,),
+                                        name="memory-consolidation", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _schedule_loop(self, initial_delay: float) -> None:
+        delay = max(0.0, float(initial_delay))
+        while not self._stop_event.wait(delay):
+            try:
+                self.consolidate_all()
+            except Exception as e:
+                self._last_error = str(e)
+                logger.error(f"Error consolidating memories: {e}")
+            delay = self.interval_seconds
+
+    def consolidate_all(self) -> Dict[str, Any]:
+        """Consolidate every user/model pair; returns the totals of the run."""
+        with self.connect() as conn:
+            pairs = conn.execute("SELECT DISTINCT user_id, model_id FROM memories").fetchall()
+        return self._run(pairs)
+
+    def consolidate(self, user_id: str, model_id: str = "default") -> Dict[str, Any]:
+        """Consolidate one user/model pair."""
+        return self._run([(user_id, model_id)])
+
+    def _run(self, pairs: Sequence[Tuple[str, str]]) -> Dict[str, Any]:
+        started = time.perf_counter()
+        totals = {"pairs": 0, "rows_scanned": 0, "clusters_merged": 0, "rows_reclaimed": 0,
+                  "embedding_merges": 0}
+        with self._run_lock:
+            if self.before_run:
+                self.before_run()
+            for user_id, model_id in pairs:
+                result = self._consolidate_pair(user_id, model_id)
+                totals["pairs"] += 1
+                for key in ("rows_scanned", "clusters_merged", "rows_reclaimed", "embedding_merges"):
+                    totals[key] += result[key]
+                if result["rows_reclaimed"]:
+                    self._notify_merged(user_id, model_id)
+
+        elapsed = time.perf_counter() - started
+        totals["duration_ms"] = round(elapsed * 1000, 2)
+        with self._lock:
+            self._stats["runs"] += 1
+            self._stats["pairs_scanned"] += totals["pairs"]
+            self._stats["rows_scanned"] += totals["rows_scanned"]
+            self._stats["clusters_merged"] += totals["clusters_merged"]
+            self._stats["rows_reclaimed"] += totals["rows_reclaimed"]
+            self._stats["embedding_merges"] += totals["embedding_merges"]
+            self._stats["run_time"] += elapsed
+            self._last_run = dict(totals, finished_at=time.time())
+        if totals["rows_reclaimed"]:
+            logger.info(f"Memory consolidation merged {totals['clusters_merged']} cluster(s), "
+                        f"reclaimed {totals['rows_reclaimed']} of {totals['rows_scanned']} rows "
+                        f"in {totals['duration_ms']:.0f}ms")
+        return totals
+
+    def _consolidate_pair(self, user_id: str, model_id: str) -> Dict[str, int]:
+        """Cluster and merge one pair's memories in a single transaction."""
+        result = {"rows_scanned": 0, "clusters_merged": 0, "rows_reclaimed": 0, "embedding_merges": 0}
+        with self.connect() as conn:
+            rows: List[MemoryRow] = conn.execute("""
+                SELECT id, memory_type, value_content, importance_score, access_count,
+                       created_at, last_accessed
+                FROM memories
+                WHERE user_id = ? AND model_id = ?
+                ORDER BY id
+            """, (user_id, model_id)).fetchall()
+            result["rows_scanned"] = len(rows)
+
+            by_type: Dict[str, List[MemoryRow]] = {}
+            for row in rows:
+                by_type.setdefault(row[1], []).append(row)
+
+            updates, deletes = [], []
+            for memory_type, type_rows in by_type.items():
+                clusters, embedding_merges = self._cluster(type_rows)
+                result["embedding_merges"] += embedding_merges
+                for cluster in clusters:
+                    if len(cluster) < 2:
+                        continue
+                    keeper, update = self._merge(cluster)
+                    updates.append(update)
+                    deletes.extend((row[0],) for row in cluster if row[0] != keeper)
+                    result["clusters_merged"] += 1
+
+            if deletes:
+                conn.executemany("""
+                    UPDATE memories
+                    SET importance_score = ?, access_count = ?, created_at = ?, last_accessed = ?
+                    WHERE id = ?
+                """, updates)
+                conn.executemany("DELETE FROM memories WHERE id = ?", deletes)
+                conn.commit()
+                result["rows_reclaimed"] = len(deletes)
+        return result
+
+    def _cluster(self, rows: List[MemoryRow]) -> Tuple[List[List[MemoryRow]], int]:
+        """Group rows by normalized text, then join groups with similar embeddings."""
+        exact: Dict[str, List[MemoryRow]] = {}
+        for row in rows:
+            exact.setdefault(normalize_memory_text(row[2]), []).append(row)
+        groups = list(exact.values())
+        if self.embed_fn is None or len(groups) < 2 or len(groups) > self.max_embedded:
+            return groups, 0
+
+        try:
+            vectors = np.asarray(self.embed_fn([group[0][2] for group in groups]), dtype=np.float32)
+        except Exception as e:
+            logger.warning(f"Memory embedding failed, consolidating exact duplicates only: {e}")
+            return groups, 0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.maximum(norms, 1e-12)
+        similarity = np.triu(vectors @ vectors.T, k=1)
+
+        # Union-find over the representative pairs above the threshold
+        parent = list(range(len(groups)))
+
+        def find(index: int) -> int:
+            while parent[index] != index:
+                parent[index] = parent[parent[index]]
+                index = parent[index]
+            return index
+
+        merges = 0
+        for first, second in np.argwhere(similarity >= self.similarity_threshold):
+            root_first, root_second = find(int(first)), find(int(second))
+            if root_first != root_second:
+                parent[root_second] = root_first
+                merges += 1
+
+        clusters: Dict[int, List[MemoryRow]] = {}
+        for index, group in enumerate(groups):
+            clusters.setdefault(find(index), []).extend(group)
+        return list(clusters.values()), merges
+
+    @staticmethod
+    def _merge(cluster: List[MemoryRow]) -> Tuple[int, Tuple[float, int, str, str, int]]:
+        """Pick the row to keep and the values it takes over from the cluster."""
+        keeper = max(cluster, key=lambda row: (row[3] or 0.0, row[4] or 0, row[6] or "", row[0]))
+        update = (
+            max(row[3] or 0.0 for row in cluster),
+            sum(row[4] or 0 for row in cluster),
+            min((row[5] for row in cluster if row[5]), default=keeper[5]),
+            max((row[6] for row in cluster if row[6]), default=keeper[6]),
+            keeper[0],
+        )
+        return keeper[0], update
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get cumulative and last-run consolidation counters."""
+        with self._lock:
+            stats = dict(self._stats)
+            runs = stats["runs"]
+            run_time = stats.pop("run_time")
+            stats.update({
+                "scheduled": bool(self._thread and self._thread.is_alive()),
+                "interval_hours": round(self.interval_seconds / 3600, 2) if self.interval_seconds else None,
+                "embeddings": self.embed_fn is not None,
+                "similarity_threshold": self.similarity_threshold,
+                "avg_run_ms": round(run_time / runs * 1000, 2) if runs else 0.0,
+                "last_run": self._last_run,
+                "last_error": self._last_error,
+            })
+            return stats
+
+
+def shared_consolidator(db_key: str, create: Callable[[], MemoryConsolidator]) -> MemoryConsolidator:
+    """
+    The consolidator for the database ``db_key``, built with ``create()`` on
+    first use, so one scheduled pass merges rows no matter how many
+    MemorySystem instances use the database.
+    """
+    with _shared_lock:
+        consolidator = _shared.get(db_key)
+        if consolidator is None:
+            consolidator = _shared[db_key] = create()
+        return consolidator
@@ -13,11 +13,18 @@ from typing import Dict, List, Any, Optional, Tuple
 from datetime import datetime, timedelta
 from dataclasses import dataclass
 import re
+from contextlib import closing
 
 # Add the src directory to Python path for absolute imports
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
-from databases.database_manager import DatabaseManager as DBManager
+from databases.database_manager import (
+    DatabaseManager as DBManager, drop_rag_outbox, ensure_memory_fts, memory_fts_owner
+)
+from models.memory_access_tracker import MemoryAccessTracker, flush_shared_access_tracker, shared_access_tracker
+from models.memory_cache import MemoryContextCache
+from models.memory_consolidation import MemoryConsolidator, shared_consolidator
+from models.text_analyzer import get_text_analyzer
 
 # Import RAG system if available
 try:
@@ -57,7 +64,10 @@ class MemorySystem:
     Now includes optional RAG capabilities for enhanced semantic search
     """
     
-    def __init__(self, db_manager: DBManager, config: Optional[Dict[str, Any]] = None):
+    def __init__(self, db_manager: DBManager, config: Optional[Dict[str, Any]] = None,
+                 access_tracking: Optional[Dict[str, Any]] = None,
+                 context_cache: Optional[Dict[str, Any]] = None,
+                 consolidation: Optional[Dict[str, Any]] = None):
         self.db_manager = db_manager
         self.logger = logging.getLogger(__name__)
         self.config = config or {}
@@ -74,6 +84,10 @@ class MemorySystem:
                 self.rag_system = None
         else:
             self.logger.info("RAG system disabled or not available")
+        if self.rag_system is None and self.config.get('rag', {}).get('enabled', False) and db_manager is not None:
+            # RAG was asked for but can't run here, so no indexer will drain the outbox
+            with db_manager.get_conversations_connection() as conn:
+                drop_rag_outbox(conn)
         
         # Memory importance thresholds
         self.importance_thresholds = {
@@ -88,6 +102,58 @@ class MemorySystem:
         self.max_context_memories = 15
         self.max_context_length = 2000
         
+        # Ranking of full-text matches: bm25 relevance blended with importance and recency
+        self.search_weights = {'text': 0.5, 'importance': 0.35, 'recency': 0.15}
+        self.search_candidates_factor = 10  # Top bm25 matches re-ranked per requested memory
+        self._fts_available: Optional[bool] = None
+        
+        # Access counts are buffered and flushed in batches so retrieval stays read-only.
+        # The buffer is shared by every MemorySystem on the same database.
+        self._db_key = self._database_key(db_manager) if db_manager is not None else None
+        access_tracking = access_tracking or {}
+        self.access_tracker: Optional[MemoryAccessTracker] = None
+        if db_manager is not None and access_tracking.get('enabled', True):
+            self.access_tracker = shared_access_tracker(
+                self._db_key,
+                db_manager.get_conversations_connection,
+                flush_interval=access_tracking.get('flush_interval', 5.0),
+                max_pending=access_tracking.get('max_pending', 256)
+            )
+        
+        # Top memories per type that every prompt carries, cached per user/model pair
+        self.core_memory_limits = {'fact': 3, 'preference': 3, 'interest': 3, 'emotional_state': 2}
+        context_cache = context_cache or {}
+        self.context_cache: Optional[MemoryContextCache] = None
+        if context_cache.get('enabled', True):
+            self.context_cache = MemoryContextCache(
+                max_entries=context_cache.get('max_entries', 128),
+                ttl_seconds=context_cache.get('ttl_seconds', 300)
+            )
+        
+        # Scheduled merging of duplicate memories (exact text, optionally embedding similarity).
+        # One consolidator runs per database; merges invalidate every instance's cache.
+        consolidation = consolidation or {}
+        self.consolidation_config = consolidation
+        self._memory_embedder = None
+        self.consolidator: Optional[MemoryConsolidator] = None
+        if db_manager is not None and consolidation.get('enabled', True):
+            db_key = self._db_key
+            self.consolidator = shared_consolidator(db_key, lambda: MemoryConsolidator(
+                db_manager.get_conversations_connection,
+                embed_fn=self._embed_memories if consolidation.get('embeddings', False) else None,
+                similarity_threshold=consolidation.get('similarity_threshold', 0.95),
+                interval_hours=consolidation.get('interval_hours', 24),
+                before_run=lambda: flush_shared_access_tracker(db_key)
+            ))
+            self.consolidator.add_merge_listener(self._invalidate_context_cache)
+            self.consolidator.start(initial_delay=consolidation.get('initial_delay', 300))
+        
+    @staticmethod
+    def _database_key(db_manager: DBManager) -> str:
+        """Path of the conversations database, identifying it across MemorySystem instances."""
+        with closing(db_manager.get_conversations_connection()) as conn:
+            return conn.execute("PRAGMA database_list").fetchone()[2] or ":memory:"
+    
     def add_memory(self, user_id: str, memory_type: str, content: str, 
                    topic: Optional[str] = None, importance: str = "medium", 
                    model_id: str = "default") -> int:
@@ -114,14 +180,55 @@ class MemorySystem:
             """, (user_id, model_id, memory_type, topic, content, importance_score))
             conn.commit()
             memory_id = cursor.lastrowid
+        self._invalidate_context_cache(user_id, model_id, memory_type)
         
         self.logger.info(f"Added memory for model {model_id}: {topic} (importance: {importance_score:.2f})")
         return memory_id
-    
+
+    def add_memories(self, memories: List[Dict[str, Any]], conn=None) -> List[int]:
+        """
+        Add several memories on one connection and commit them together.
+        Each dict takes the add_memory arguments; with ``conn`` the caller commits
+        and calls ``invalidate_memories`` after COMMIT, so a core-memory load that
+        overlaps the transaction cannot cache the rows as they were before it.
+        """
+        if conn is None:
+            with self.db_manager.get_conversations_connection() as conn:
+                memory_ids = self.add_memories(memories, conn)
+            self.invalidate_memories(memories)
+            return memory_ids
+
+        memory_ids = []
+        cursor = conn.cursor()
+        for memory in memories:
+            content = memory['content']
+            topic = memory.get('topic') or self._extract_topic(content)
+            importance_score = self._analyze_importance(
+                content, self.importance_thresholds.get(memory.get('importance', 'medium'), 0.5)
+            )
+            cursor.execute("""
+                INSERT INTO memories (user_id, model_id, memory_type, key_topic, value_content, importance_score)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (memory['user_id'], memory.get('model_id', 'default'), memory['memory_type'],
+                  topic, content, importance_score))
+            memory_ids.append(cursor.lastrowid)
+
+        if memories:
+            self.logger.info(f"Added {len(memories)} memories in one batch")
+        return memory_ids
+
+    def invalidate_memories(self, memories: List[Dict[str, Any]]) -> None:
+        """Drop cached core memories for the pairs of committed ``add_memories`` rows."""
+        pairs = {(memory['user_id'], memory.get('model_id', 'default'))
+                 for memory in memories if memory['memory_type'] in self.core_memory_limits}
+        for user_id, model_id in pairs:
+            self._invalidate_context_cache(user_id, model_id)
+
     def get_relevant_memories(self, user_id: str, query: str, limit: int = 10, 
                             model_id: str = "default") -> List[MemoryItem]:
         """
-        Retrieve memories relevant to a query using keyword matching and importance
+        Retrieve memories relevant to a query using full-text search (FTS5, ranked by
+        relevance, importance and recency) and fall back to LIKE keyword matching.
         Now supports model isolation.
         """
         # Extract keywords from query
@@ -130,33 +237,13 @@ class MemorySystem:
         with self.db_manager.get_conversations_connection() as conn:
             cursor = conn.cursor()
             
-            # Build keyword search with model isolation
-            keyword_conditions = []
-            params = [user_id, model_id]
-            
-            for keyword in keywords[:5]:  # Limit to top 5 keywords
-                keyword_conditions.append("(key_topic LIKE ? OR value_content LIKE ?)")
-                params.extend([f"%{keyword}%", f"%{keyword}%"])
-            
-            if keyword_conditions:
-                where_clause = f"WHERE user_id = ? AND model_id = ? AND ({' OR '.join(keyword_conditions)})"
+            if keywords and self._memory_fts_available(conn):
+                rows = self._search_memories_fts(cursor, user_id, model_id, keywords, limit)
             else:
-                where_clause = "WHERE user_id = ? AND model_id = ?"
-            
-            query_sql = f"""
-                SELECT id, memory_type, key_topic, value_content, importance_score, 
-                       created_at, last_accessed, access_count
-                FROM memories 
-                {where_clause}
-                ORDER BY importance_score DESC, last_accessed DESC
-                LIMIT ?
-            """
-            params.append(limit)
-            
-            cursor.execute(query_sql, params)
+                rows = self._search_memories_like(cursor, user_id, model_id, keywords, limit)
             
             memories = []
-            for row in cursor.fetchall():
+            for row in rows:
                 memory = MemoryItem(
                     id=row[0],
                     memory_type=row[1],
@@ -168,15 +255,17 @@ class MemorySystem:
                     access_count=row[7]
                 )
                 memories.append(memory)
-                
-                # Update access tracking
-                cursor.execute("""
+            
+            if memories and not self.access_tracker:
+                cursor.execute(f"""
                     UPDATE memories 
                     SET last_accessed = CURRENT_TIMESTAMP, access_count = access_count + 1
-                    WHERE id = ?
-                """, (row[0],))
-            
-            conn.commit()
+                    WHERE id IN ({','.join('?' * len(memories))})
+                """, [memory.id for memory in memories])
+                conn.commit()
+        
+        if self.access_tracker:
+            self.access_tracker.record(memory.id for memory in memories)
         
         return memories
         
@@ -213,6 +302,69 @@ class MemorySystem:
         
         return memory_items
     
+    def _memory_fts_available(self, conn) -> bool:
+        """Whether the memories_fts index exists (created and populated on first use)."""
+        if self._fts_available is None:
+            self._fts_available = ensure_memory_fts(conn)
+            conn.commit()
+        return self._fts_available
+    
+    def _search_memories_fts(self, cursor, user_id: str, model_id: str, keywords: List[str],
+                             limit: int) -> List[tuple]:
+        """
+        Full-text search of one user/model's memories.
+        The owner token restricts the MATCH to their rows. The best bm25 matches
+        (topic weighted over content) are taken inside FTS5, then re-ranked by
+        relevance squashed to 0..1 blended with importance and recency.
+        """
+        terms = " OR ".join('"' + keyword.replace('"', '""') + '"' for keyword in keywords)
+        match = f'owner : "{memory_fts_owner(user_id, model_id)}" AND {{key_topic value_content}} : ({terms})'
+        weights = self.search_weights
+        cursor.execute("""
+            WITH matches AS (
+                SELECT rowid AS id, -bm25(memories_fts, 0.0, 2.0, 1.0) AS relevance
+                FROM memories_fts
+                WHERE memories_fts MATCH ?
+                ORDER BY bm25(memories_fts, 0.0, 2.0, 1.0)
+                LIMIT ?
+            )
+            SELECT m.id, m.memory_type, m.key_topic, m.value_content, m.importance_score,
+                   m.created_at, m.last_accessed, m.access_count
+            FROM matches JOIN memories m ON m.id = matches.id
+            WHERE m.user_id = ? AND m.model_id = ?
+            ORDER BY ? * (matches.relevance / (1.0 + matches.relevance))
+                   + ? * m.importance_score
+                   + ? / (1.0 + julianday('now') - julianday(m.last_accessed)) DESC
+            LIMIT ?
+        """, (match, max(limit * self.search_candidates_factor, 100), user_id, model_id,
+              weights['text'], weights['importance'], weights['recency'], limit))
+        return cursor.fetchall()
+    
+    def _search_memories_like(self, cursor, user_id: str, model_id: str, keywords: List[str],
+                              limit: int) -> List[tuple]:
+        """Keyword search with LIKE scans (used without FTS5, or with no keywords)."""
+        keyword_conditions = []
+        params = [user_id, model_id]
+        
+        for keyword in keywords[:5]:  # Limit to top 5 keywords
+            keyword_conditions.append("(key_topic LIKE ? OR value_content LIKE ?)")
+            params.extend([f"%{keyword}%", f"%{keyword}%"])
+        
+        if keyword_conditions:
+            where_clause = f"WHERE user_id = ? AND model_id = ? AND ({' OR '.join(keyword_conditions)})"
+        else:
+            where_clause = "WHERE user_id = ? AND model_id = ?"
+        
+        cursor.execute(f"""
+            SELECT id, memory_type, key_topic, value_content, importance_score, 
+                   created_at, last_accessed, access_count
+            FROM memories 
+            {where_clause}
+            ORDER BY importance_score DESC, last_accessed DESC
+            LIMIT ?
+        """, params + [limit])
+        return cursor.fetchall()
+    
     def build_context_for_llm(self, user_id: str, current_query: str, 
                              model_id: str = "default") -> str:
         """
@@ -223,8 +375,75 @@ class MemorySystem:
         relevant_memories = self.get_relevant_memories(user_id, current_query, 
                                                      limit=self.max_context_memories, 
                                                      model_id=model_id)
-        
-        if not relevant_memories:
+        return self.format_memories_for_llm(relevant_memories, self.get_core_memories(user_id, model_id))
+    
+    def get_core_memories(self, user_id: str, model_id: str = "default") -> Dict[str, List[MemoryItem]]:
+        """
+        Most important memories of each type in ``core_memory_limits``, grouped by type
+        (served from the context cache; loaded from SQLite on a miss).
+        """
+        if self.context_cache is None:
+            return self._load_core_memories(user_id, model_id)
+        return self.context_cache.get(user_id, model_id, self._load_core_memories)
+    
+    def _load_core_memories(self, user_id: str, model_id: str) -> Dict[str, List[MemoryItem]]:
+        """Read the top memories of each core type in one query."""
+        limits = self.core_memory_limits
+        cases = " ".join(f"WHEN '{memory_type}' THEN {limit}" for memory_type, limit in limits.items())
+        with self.db_manager.get_conversations_connection() as conn:
+            rows = conn.execute(f"""
+                SELECT id, memory_type, key_topic, value_content, importance_score,
+                       created_at, last_accessed, access_count
+                FROM (
+                    SELECT *, ROW_NUMBER() OVER (
+                        PARTITION BY memory_type ORDER BY importance_score DESC, last_accessed DESC
+                    ) AS type_rank
+                    FROM memories
+                    WHERE user_id = ? AND model_id = ? AND memory_type IN ({','.join('?' * len(limits))})
+                )
+                WHERE type_rank <= CASE memory_type {cases} END
+                ORDER BY memory_type, type_rank
+            """, (user_id, model_id, *limits)).fetchall()
+        
+        groups: Dict[str, List[MemoryItem]] = {}
+        for row in rows:
+            groups.setdefault(row[1], []).append(MemoryItem(*row))
+        return groups
+    
+    def consolidate_memories(self, user_id: Optional[str] = None, model_id: str = "default") -> Dict[str, Any]:
+        """
+        Merge duplicate memories now, for one user/model pair or (without ``user_id``)
+        for all of them; returns the run's counts including ``rows_reclaimed``.
+        """
+        if self.consolidator is None:
+            return {"rows_reclaimed": 0, "enabled": False}
+        if user_id is None:
+            return self.consolidator.consolidate_all()
+        return self.consolidator.consolidate(user_id, model_id)
+    
+    def _embed_memories(self, texts: List[str]):
+        """Embed memory texts for consolidation, loading the encoder on first use."""
+        if self._memory_embedder is None:
+            from sentence_transformers import SentenceTransformer
+            model_name = self.consolidation_config.get('embedding_model') or self.config.get('rag', {}).get(
+                'embedding', {}).get('model_name', 'sentence-transformers/all-MiniLM-L6-v2')
+            self._memory_embedder = SentenceTransformer(model_name)
+        return self._memory_embedder.encode(texts, batch_size=64, normalize_embeddings=True)
+    
+    def _invalidate_context_cache(self, user_id: str, model_id: str, memory_type: Optional[str] = None) -> None:
+        """Drop a pair's cached core memories after a write that can change them."""
+        if self.context_cache is not None and (memory_type is None or memory_type in self.core_memory_limits):
+            self.context_cache.invalidate(user_id, model_id)
+    
+    def format_memories_for_llm(self, relevant_memories: List[MemoryItem],
+                                core_memories: Optional[Dict[str, List[MemoryItem]]] = None) -> str:
+        """
+        Format already-retrieved memories into the LLM context string,
+        so callers holding the memories don't query them again.
+        ``core_memories`` (from get_core_memories) fill each section after the
+        query-relevant memories.
+        """
+        if not relevant_memories and not any((core_memories or {}).values()):
             return "No previous conversations or memories stored yet."
         
         # Group memories by type for better organization
@@ -243,6 +462,13 @@ class MemorySystem:
                 memory_type = 'other'
             memory_groups[memory_type].append(memory)
         
+        if core_memories:
+            seen = {memory.id for memory in relevant_memories}
+            for memory_type, memories in core_memories.items():
+                memory_groups.setdefault(memory_type, []).extend(
+                    memory for memory in memories if memory.id not in seen
+                )
+        
         # Build context string
         context_parts = []
         
@@ -311,12 +537,16 @@ class MemorySystem:
     
     def update_memory_importance(self, memory_id: int, new_importance: float) -> None:
         """Update the importance score of a memory"""
-        self.db_manager.cursor.execute("""
-            UPDATE user_memories 
-            SET importance_score = ?, last_accessed = CURRENT_TIMESTAMP
-            WHERE id = ?
-        """, (new_importance, memory_id))
-        self.db_manager.connection.commit()
+        with self.db_manager.get_conversations_connection() as conn:
+            row = conn.execute("SELECT user_id, model_id FROM memories WHERE id = ?", (memory_id,)).fetchone()
+            conn.execute("""
+                UPDATE memories 
+                SET importance_score = ?, last_accessed = CURRENT_TIMESTAMP
+                WHERE id = ?
+            """, (new_importance, memory_id))
+            conn.commit()
+        if row:
+            self._invalidate_context_cache(row[0], row[1])
     
     def cleanup_old_memories(self, user_id: str, days_old: int = 90, min_importance: float = 0.3) -> int:
         """
@@ -324,13 +554,16 @@ class MemorySystem:
         """
         cutoff_date = datetime.now() - timedelta(days=days_old)
         
-        self.db_manager.cursor.execute("""
-            DELETE FROM user_memories 
-            WHERE user_id = ? AND importance_score < ? AND created_at < ?
-        """, (user_id, min_importance, cutoff_date.isoformat()))
+        with self.db_manager.get_conversations_connection() as conn:
+            cursor = conn.execute("""
+                DELETE FROM memories 
+                WHERE user_id = ? AND importance_score < ? AND created_at < ?
+            """, (user_id, min_importance, cutoff_date.strftime('%Y-%m-%d %H:%M:%S')))
+            deleted_count = cursor.rowcount
+            conn.commit()
         
-        deleted_count = self.db_manager.cursor.rowcount
-        self.db_manager.connection.commit()
+        if deleted_count and self.context_cache is not None:
+            self.context_cache.invalidate_user(user_id)
         
         self.logger.info(f"Cleaned up {deleted_count} old memories for user {user_id}")
         return deleted_count
@@ -352,7 +585,8 @@ class MemorySystem:
     
     def _extract_keywords(self, text: str) -> List[str]:
         """Extract keywords from text for memory search"""
-        words = re.findall(r'\b\w+\b', text.lower())
+        # The query is the user's message, usually analyzed already this turn
+        words = get_text_analyzer().analyze(text).tokens
         stop_words = {'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by'}
         
         keywords = [w for w in words if w not in stop_words and len(w) > 2]
@@ -360,22 +594,11 @@ class MemorySystem:
     
     def _analyze_importance(self, content: str, base_score: float) -> float:
         """Analyze content to adjust importance score"""
-        # Keywords that increase importance
-        high_importance_words = ['love', 'hate', 'important', 'secret', 'personal', 'family', 'work', 'passion', 'dream', 'goal']
+        features = get_text_analyzer().analyze(content)
         
-        # Keywords that decrease importance
-        low_importance_words = ['maybe', 'perhaps', 'casual', 'random', 'whatever', 'small talk']
-        
-        content_lower = content.lower()
-        
-        # Adjust score based on keywords
-        for word in high_importance_words:
-            if word in content_lower:
-                base_score = min(1.0, base_score + 0.1)
-        
-        for word in low_importance_words:
-            if word in content_lower:
-                base_score = max(0.1, base_score - 0.1)
+        # Each keyword that increases (or decreases) importance moves the score by 0.1
+        base_score = min(1.0, base_score + 0.1 * features.count('importance_high'))
+        base_score = max(0.1, base_score - 0.1 * features.count('importance_low'))
         
         # Adjust based on length (longer content might be more important)
         if len(content) > 100:
@@ -432,8 +655,8 @@ class MemorySystem:
             model_id=model_id
         )
         
-        # Add to RAG system if available
-        if self.rag_system:
+        # Add to RAG system if available (the outbox indexer picks up stored conversations itself)
+        if self.rag_system and not self.rag_system.indexer:
             try:
                 self.rag_system.add_conversation(
                     user_message=user_message,
@@ -468,7 +691,49 @@ class MemorySystem:
             model_id=model_id,
             importance=importance
         )
-    
+
+    def store_conversations(self, conversations: List[Tuple[str, str, Dict[str, Any]]], conn=None) -> List[int]:
+        """
+        Batch form of store_conversation for (user_message, assistant_response, metadata)
+        tuples: memories are written in one transaction, then added to RAG. With
+        ``conn`` the caller commits and then calls ``index_conversations`` itself.
+        """
+        conversations = [item for item in conversations if item[2] and 'user_id' in item[2]]
+        memories = [
+            {
+                'user_id': metadata['user_id'],
+                'model_id': metadata.get('avatar_id', 'default'),
+                'memory_type': 'conversation',
+                'content': f"User: {user_message}\nAssistant: {assistant_response}",
+                'topic': self._extract_topic(user_message),
+                'importance': metadata.get('importance', 'medium'),
+            }
+            for user_message, assistant_response, metadata in conversations
+        ]
+        if conn is not None:
+            return self.add_memories(memories, conn)
+
+        memory_ids = self.add_memories(memories)
+        self.index_conversations(conversations, memory_ids)
+        return memory_ids
+
+    def index_conversations(self, conversations: List[Tuple[str, str, Dict[str, Any]]],
+                            memory_ids: List[int]) -> None:
+        """Add stored conversations to RAG (skipped when the outbox indexer picks them up)."""
+        if not self.rag_system or self.rag_system.indexer:
+            return
+        conversations = [item for item in conversations if item[2] and 'user_id' in item[2]]
+        for (user_message, assistant_response, metadata), memory_id in zip(conversations, memory_ids):
+            try:
+                self.rag_system.add_conversation(
+                    user_message=user_message,
+                    assistant_response=assistant_response,
+                    user_id=metadata['user_id'],
+                    metadata={"model_id": metadata.get('avatar_id', 'default'), "memory_id": memory_id}
+                )
+            except Exception as e:
+                self.logger.error(f"Error adding conversation to RAG system: {e}")
+
     def search_conversation_history(self, user_id: str, query: str, limit: int = 5,
                                   model_id: str = "default") -> List[Dict[str, Any]]:
         """
@@ -515,17 +780,19 @@ class MemorySystem:
         """Get statistics about the RAG system"""
         if self.rag_system:
             try:
-                return self.rag_system.rag_system.get_collection_stats()
+                stats = self.rag_system.rag_system.get_collection_stats()
+                stats['indexing'] = self.rag_system.get_indexing_stats()
+                return stats
             except Exception as e:
                 self.logger.error(f"Error getting RAG stats: {e}")
                 return {"error": str(e)}
         return {"rag_enabled": False}
     
-    def sync_rag_system(self) -> int:
-        """Sync existing conversations with RAG system"""
+    def sync_rag_system(self, backfill: bool = False) -> int:
+        """Sync new conversations (or, with backfill, the whole history) with RAG system"""
         if self.rag_system:
             try:
-                return self.rag_system.rag_system.sync_with_conversation_db()
+                return self.rag_system.rag_system.sync_with_conversation_db(backfill=backfill)
             except Exception as e:
                 self.logger.error(f"Error syncing RAG system: {e}")
                 return 0
@@ -5,9 +5,10 @@ from typing import Dict, List, Tuple, Optional, Any
 from datetime import datetime, timedelta
 from dataclasses import dataclass, asdict
 from enum import Enum
-import re
 import random
 
+from .text_analyzer import KEYWORD_GROUPS, TextFeatures, get_text_analyzer
+
 logger = logging.getLogger(__name__)
 
 class PersonalityTrait(Enum):
@@ -74,19 +75,11 @@ class PersonalitySystem:
         self.memory_decay_rate = 0.1
         self.bonding_threshold_interactions = 10
         
-        # Interaction patterns for analysis
-        self.positive_keywords = [
-            "thank", "love", "great", "awesome", "wonderful", "amazing",
-            "help", "care", "kind", "sweet", "cute", "beautiful", "perfect"
-        ]
-        self.negative_keywords = [
-            "hate", "stupid", "annoying", "bad", "terrible", "awful",
-            "shut up", "go away", "leave", "stop", "angry", "mad"
-        ]
-        self.playful_keywords = [
-            "play", "game", "fun", "laugh", "joke", "silly", "tease",
-            "dance", "sing", "story", "adventure", "explore"
-        ]
+        # Interaction patterns for analysis (matched by the shared text analyzer)
+        self.text_analyzer = get_text_analyzer()
+        self.positive_keywords = list(KEYWORD_GROUPS['positive'])
+        self.negative_keywords = list(KEYWORD_GROUPS['negative'])
+        self.playful_keywords = list(KEYWORD_GROUPS['playful'])
         
     def set_current_model(self, model_id: str):
         """Set the current model and load its personality"""
@@ -164,49 +157,21 @@ class PersonalitySystem:
         except Exception as e:
             logger.error(f"Error saving personality: {e}")
             
-    def analyze_user_input(self, user_input: str) -> Dict[str, float]:
+    def analyze_user_input(self, user_input: str, features: Optional[TextFeatures] = None) -> Dict[str, float]:
         """Analyze user input for emotional and personality cues"""
-        input_lower = user_input.lower()
+        features = features or self.text_analyzer.analyze(user_input)
         
-        analysis = {
-            'positivity': 0.0,
-            'negativity': 0.0,
-            'playfulness': 0.0,
-            'emotional_intensity': 0.0,
-            'bonding_signal': 0.0
+        return {
+            # Sentiment and playfulness keywords
+            'positivity': min(features.count('positive') * 0.2, 1.0),
+            'negativity': min(features.count('negative') * 0.3, 1.0),
+            'playfulness': min(features.count('playful') * 0.25, 1.0),
+            # Emotional intensity (exclamation marks, caps, etc.)
+            'emotional_intensity': min((features.exclamations * 0.2) + (features.caps_ratio * 0.5), 1.0),
+            # Bonding signals (personal questions, compliments, etc.)
+            'bonding_signal': min(features.bonding_matches * 0.3, 1.0),
         }
         
-        # Check for positive sentiment
-        positive_count = sum(1 for word in self.positive_keywords if word in input_lower)
-        analysis['positivity'] = min(positive_count * 0.2, 1.0)
-        
-        # Check for negative sentiment
-        negative_count = sum(1 for word in self.negative_keywords if word in input_lower)
-        analysis['negativity'] = min(negative_count * 0.3, 1.0)
-        
-        # Check for playfulness
-        playful_count = sum(1 for word in self.playful_keywords if word in input_lower)
-        analysis['playfulness'] = min(playful_count * 0.25, 1.0)
-        
-        # Emotional intensity (exclamation marks, caps, etc.)
-        exclamation_count = user_input.count('!')
-        caps_ratio = sum(1 for c in user_input if c.isupper()) / max(len(user_input), 1)
-        analysis['emotional_intensity'] = min((exclamation_count * 0.2) + (caps_ratio * 0.5), 1.0)
-        
-        # Bonding signals (personal questions, compliments, etc.)
-        bonding_patterns = [
-            r'\b(your|you)\s+(name|like|think|feel|want)',
-            r'\b(tell|about)\s+(yourself|you)',
-            r'\b(how|what)\s+(are|do)\s+you',
-            r'\b(i|me)\s+(love|like|care|trust)'
-        ]
-        
-        bonding_matches = sum(1 for pattern in bonding_patterns 
-                            if re.search(pattern, input_lower))
-        analysis['bonding_signal'] = min(bonding_matches * 0.3, 1.0)
-        
-        return analysis
-        
     def update_traits(self, user_input: str, interaction_quality: float = 0.5):
         """Update personality traits based on user interaction"""
         analysis = self.analyze_user_input(user_input)
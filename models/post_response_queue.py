@@ -0,0 +1,317 @@
+"""
+Write-behind queue for post-response bookkeeping in AI Companion application.
+Conversation storage, memory extraction, session context and bonding updates are
+journaled to SQLite when a reply is produced and applied by a background worker
+in batches, so chat responses no longer wait on them.
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# handler(conn, payloads): apply a batch of jobs of one type inside the worker's
+# transaction. Handlers must not commit; the worker commits once per batch.
+JobHandler = Callable[[sqlite3.Connection, List[Dict[str, Any]]], Any]
+# after_commit(payloads, result): side effects outside the transaction (other
+# databases, caches, RAG) for jobs whose writes were committed, given the
+# handler's return value. Runs once per applied handler call and is not retried.
+AfterCommitHook = Callable[[List[Dict[str, Any]], Any], None]
+
+
+class PostResponseQueue:
+    """
+    Durable job queue with batched, group-committed processing.
+
+    Jobs are inserted into the ``post_response_jobs`` table before ``enqueue``
+    returns, so work survives a crash or restart and is picked up on the next
+    start. The worker takes up to ``batch_size`` jobs at a time, hands each job
+    type's payloads to its handler in one call and commits all of the batch's
+    writes together with the removal of its journal rows. A batch whose handler
+    fails is retried one job at a time so a bad payload cannot hold back the rest;
+    jobs are dropped after ``max_attempts`` failures. Writes that cannot join the
+    transaction belong in the job type's ``after_commit`` hook, which only sees
+    jobs that were committed and so is never replayed by a retry.
+    """
+
+    def __init__(self, connect: Callable[[], sqlite3.Connection], batch_size: int = 64,
+                 flush_interval: float = 0.2, max_attempts: int = 5):
+        self.connect = connect
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = max(0.01, float(flush_interval))
+        self.max_attempts = max(1, int(max_attempts))
+
+        self._handlers: Dict[str, JobHandler] = {}
+        self._after_commit: Dict[str, AfterCommitHook] = {}
+        # Journaled job id -> (enqueued_at, scope), in id order
+        self._pending: "OrderedDict[int, Tuple[float, Optional[Hashable]]]" = OrderedDict()
+        self._scopes: Dict[Hashable, int] = {}
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._wake_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+
+        self._stats = {
+            "enqueued": 0,
+            "processed": 0,
+            "failed": 0,
+            "dropped": 0,
+            "batches": 0,
+            "batch_time": 0.0,
+            "total_lag": 0.0,
+            "max_lag": 0.0,
+        }
+        self._last_error: Optional[str] = None
+
+    def register(self, job_type: str, handler: JobHandler,
+                 after_commit: Optional[AfterCommitHook] = None) -> None:
+        """Register the batch handler (and optional post-commit hook) for a job type."""
+        self._handlers[job_type] = handler
+        if after_commit is not None:
+            self._after_commit[job_type] = after_commit
+        else:
+            self._after_commit.pop(job_type, None)
+
+    def start(self) -> None:
+        """Create the journal table, recover unfinished jobs and start the worker."""
+        if self._worker and self._worker.is_alive():
+            return
+        with self.connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS post_response_jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    job_type TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    enqueued_at REAL NOT NULL,
+                    attempts INTEGER DEFAULT 0,
+                    last_error TEXT
+                )
+            """)
+            rows = conn.execute("SELECT id, enqueued_at FROM post_response_jobs ORDER BY id").fetchall()
+            conn.commit()
+        with self._lock:
+            for job_id, enqueued_at in rows:
+                self._pending.setdefault(job_id, (enqueued_at, None))
+        if rows:
+            logger.info(f"Recovered {len(rows)} unfinished post-response job(s)")
+
+        self._stop_event.clear()
+        self._worker = threading.Thread(target=self._worker_loop, name="post-response-writer", daemon=True)
+        self._worker.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Drain what is pending (up to ``timeout``) and stop the worker."""
+        if not self._worker:
+            return
+        self.flush(timeout)
+        self._stop_event.set()
+        self._wake_event.set()
+        self._worker.join(timeout=5)
+        self._worker = None
+
+    def enqueue(self, job_type: str, payload: Dict[str, Any],
+                scope: Optional[Hashable] = None) -> int:
+        """
+        Journal a job and wake the worker.
+
+        ``scope`` (e.g. a user/model/session key) lets readers wait for that
+        scope's writes with ``wait_for_scope`` before reading them back.
+        """
+        enqueued_at = time.time()
+        with self.connect() as conn:
+            cursor = conn.execute(
+                "INSERT INTO post_response_jobs (job_type, payload, enqueued_at) VALUES (?, ?, ?)",
+                (job_type, json.dumps(payload), enqueued_at)
+            )
+            conn.commit()
+            job_id = cursor.lastrowid
+        with self._lock:
+            self._pending[job_id] = (enqueued_at, scope)
+            if scope is not None:
+                self._scopes[scope] = self._scopes.get(scope, 0) + 1
+            self._stats["enqueued"] += 1
+        self._wake_event.set()
+        return job_id
+
+    def wait_for_scope(self, scope: Hashable, timeout: float = 2.0) -> bool:
+        """Block until no job for ``scope`` is pending; returns False on timeout."""
+        deadline = time.time() + timeout
+        with self._idle:
+            while self._scopes.get(scope):
+                remaining = deadline - time.time()
+                if remaining <= 0 or not self._worker:
+                    return False
+                self._idle.wait(remaining)
+        return True
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """Block until every pending job has been applied; returns False on timeout."""
+        self._wake_event.set()
+        deadline = time.time() + timeout
+        with self._idle:
+            while self._pending:
+                remaining = deadline - time.time()
+                if remaining <= 0 or not self._worker:
+                    return False
+                self._idle.wait(remaining)
+        return True
+
+    def _worker_loop(self) -> None:
+        conn = self.connect()
+        conn.isolation_level = None  # Transactions are managed explicitly
+        try:
+            while not self._stop_event.is_set():
+                self._wake_event.wait(self.flush_interval)
+                self._wake_event.clear()
+                try:
+                    # Keep draining while full batches are coming back
+                    while self._process_batch(conn) >= self.batch_size:
+                        pass
+                except Exception as e:
+                    self._last_error = str(e)
+                    logger.error(f"Error processing post-response jobs: {e}")
+                    if conn.in_transaction:
+                        conn.execute("ROLLBACK")
+                    self._stop_event.wait(1.0)
+        finally:
+            conn.close()
+
+    def _process_batch(self, conn: sqlite3.Connection) -> int:
+        """Apply one batch of jobs and commit it; returns the number of jobs taken."""
+        if not self._handlers:
+            return 0
+        job_types = list(self._handlers)
+        placeholders = ",".join("?" * len(job_types))
+        rows = conn.execute(
+            f"SELECT id, job_type, payload, attempts FROM post_response_jobs "
+            f"WHERE job_type IN ({placeholders}) ORDER BY id LIMIT ?",
+            (*job_types, self.batch_size)
+        ).fetchall()
+        if not rows:
+            return 0
+
+        started = time.perf_counter()
+        groups: "OrderedDict[str, List[Tuple[int, Dict[str, Any], int]]]" = OrderedDict()
+        for job_id, job_type, payload, attempts in rows:
+            groups.setdefault(job_type, []).append((job_id, json.loads(payload), attempts))
+
+        done: List[int] = []
+        failed: List[Tuple[int, int, str]] = []
+        # (job_type, payloads, handler result) of every handler call that succeeded
+        applied: List[Tuple[str, List[Dict[str, Any]], Any]] = []
+        conn.execute("BEGIN IMMEDIATE")
+        for job_type, jobs in groups.items():
+            handler = self._handlers[job_type]
+            payloads = [payload for _, payload, _ in jobs]
+            error, result = self._apply(conn, handler, payloads)
+            if error is None:
+                done.extend(job_id for job_id, _, _ in jobs)
+                applied.append((job_type, payloads, result))
+                continue
+            # Retry one by one so a single bad payload doesn't fail the whole group
+            for job_id, payload, attempts in jobs:
+                if len(jobs) > 1:
+                    job_error, result = self._apply(conn, handler, [payload])
+                else:
+                    job_error = error
+                if job_error is None:
+                    done.append(job_id)
+                    applied.append((job_type, [payload], result))
+                else:
+                    failed.append((job_id, attempts + 1, job_error))
+
+        dropped = [job_id for job_id, attempts, _ in failed if attempts >= self.max_attempts]
+        conn.executemany("DELETE FROM post_response_jobs WHERE id = ?", [(job_id,) for job_id in done + dropped])
+        conn.executemany(
+            "UPDATE post_response_jobs SET attempts = ?, last_error = ? WHERE id = ?",
+            [(attempts, error, job_id) for job_id, attempts, error in failed if job_id not in dropped]
+        )
+        conn.execute("COMMIT")
+        self._run_after_commit(applied)
+
+        for job_id, attempts, error in failed:
+            self._last_error = error
+            if job_id in dropped:
+                logger.error(f"Dropping post-response job {job_id} after {attempts} attempts: {error}")
+            else:
+                logger.warning(f"Post-response job {job_id} failed (attempt {attempts}): {error}")
+        self._complete(done + dropped, len(done), len(failed), len(dropped), time.perf_counter() - started)
+        return len(rows)
+
+    def _run_after_commit(self, applied: List[Tuple[str, List[Dict[str, Any]], Any]]) -> None:
+        """Run post-commit hooks for committed handler calls; failures are logged, not retried."""
+        for job_type, payloads, result in applied:
+            hook = self._after_commit.get(job_type)
+            if hook is None:
+                continue
+            try:
+                hook(payloads, result)
+            except Exception as e:
+                self._last_error = f"{type(e).__name__}: {e}"
+                logger.error(f"Post-commit hook for {job_type} failed: {e}")
+
+    @staticmethod
+    def _apply(conn: sqlite3.Connection, handler: JobHandler,
+               payloads: List[Dict[str, Any]]) -> Tuple[Optional[str], Any]:
+        """Run a handler inside a savepoint; returns (error message or None, handler result)."""
+        conn.execute("SAVEPOINT post_response_job")
+        try:
+            result = handler(conn, payloads)
+        except Exception as e:
+            conn.execute("ROLLBACK TO SAVEPOINT post_response_job")
+            conn.execute("RELEASE SAVEPOINT post_response_job")
+            return f"{type(e).__name__}: {e}", None
+        conn.execute("RELEASE SAVEPOINT post_response_job")
+        return None, result
+
+    def _complete(self, job_ids: List[int], processed: int, failed: int, dropped: int,
+                  batch_time: float) -> None:
+        """Update pending bookkeeping and counters after a batch commit."""
+        now = time.time()
+        with self._idle:
+            for job_id in job_ids:
+                enqueued_at, scope = self._pending.pop(job_id, (now, None))
+                lag = now - enqueued_at
+                self._stats["total_lag"] += lag
+                self._stats["max_lag"] = max(self._stats["max_lag"], lag)
+                if scope is not None:
+                    remaining = self._scopes.get(scope, 1) - 1
+                    if remaining > 0:
+                        self._scopes[scope] = remaining
+                    else:
+                        self._scopes.pop(scope, None)
+            self._stats["processed"] += processed
+            self._stats["failed"] += failed
+            self._stats["dropped"] += dropped
+            self._stats["batches"] += 1
+            self._stats["batch_time"] += batch_time
+            self._idle.notify_all()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get queue depth, lag and batch statistics."""
+        now = time.time()
+        with self._lock:
+            stats = dict(self._stats)
+            oldest = next(iter(self._pending.values()), None)
+            applied = stats["processed"] + stats["dropped"]
+            batches = stats.pop("batches")
+            batch_time = stats.pop("batch_time")
+            total_lag = stats.pop("total_lag")
+            stats.update({
+                "running": bool(self._worker and self._worker.is_alive()),
+                "depth": len(self._pending),
+                "oldest_pending_ms": round((now - oldest[0]) * 1000, 2) if oldest else 0.0,
+                "avg_lag_ms": round(total_lag / applied * 1000, 2) if applied else 0.0,
+                "max_lag_ms": round(stats.pop("max_lag") * 1000, 2),
+                "batches": batches,
+                "avg_batch_size": round(applied / batches, 2) if batches else 0.0,
+                "avg_batch_ms": round(batch_time / batches * 1000, 2) if batches else 0.0,
+                "last_error": self._last_error,
+            })
+            return stats
@@ -0,0 +1,204 @@
+"""
+Token-budget prompt assembler for AI Companion application.
+Measures prompt sections with the loaded model's tokenizer and fills them by
+priority so the prompt plus the reply always fit in the context window.
+"""
+
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PromptSection:
+    """
+    One block of the prompt.
+
+    ``priority`` decides fill order (lower is kept first); ``required`` sections
+    are always included. Sections built from ``units`` (messages, memory lines)
+    are trimmed unit by unit instead of being dropped whole: ``keep_latest``
+    keeps the last units (recent messages), otherwise the first ones.
+    """
+    name: str
+    text: str = ""
+    priority: int = 0
+    required: bool = False
+    static: bool = False
+    units: Optional[List[str]] = None
+    header: str = ""
+    footer: str = ""
+    separator: str = "\n"
+    keep_latest: bool = False
+    tokens: int = field(default=0, init=False)
+    included_units: int = field(default=0, init=False)
+
+
+class PromptTooLongError(ValueError):
+    """The required prompt sections do not fit in the context window."""
+
+
+class PromptAssembler:
+    """
+    Assembles prompt sections within ``context_length - max_tokens`` tokens.
+
+    Token counts of static sections (character prefix, guidelines) are cached by
+    content hash, so only the per-turn sections are tokenized each time. If the
+    required sections alone overflow the budget, the largest non-static one is
+    cut down (oldest units first, or the middle of its text); when that cannot
+    make them fit, ``PromptTooLongError`` is raised before anything is decoded.
+    """
+
+    TRUNCATION_MARKER = "\n[...]\n"
+
+    def __init__(self, tokenize: Callable[[str], List[int]], static_cache_size: int = 64,
+                 safety_margin: int = 16):
+        self.tokenize = tokenize
+        self.safety_margin = safety_margin
+        self.static_cache_size = static_cache_size
+        self._static_counts: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def count_tokens(self, text: str, static: bool = False) -> int:
+        """Count tokens in ``text``, caching the result for static text."""
+        if not text:
+            return 0
+        if not static:
+            return len(self.tokenize(text))
+
+        key = hashlib.sha1(text.encode("utf-8")).hexdigest()
+        with self._lock:
+            if key in self._static_counts:
+                self._static_counts.move_to_end(key)
+                return self._static_counts[key]
+        count = len(self.tokenize(text))
+        with self._lock:
+            self._static_counts[key] = count
+            while len(self._static_counts) > self.static_cache_size:
+                self._static_counts.popitem(last=False)
+        return count
+
+    def assemble(self, sections: List[PromptSection], context_length: int,
+                 max_tokens: int) -> Dict[str, Any]:
+        """
+        Fill sections by priority and join them in their given order.
+
+        Returns a dict with the ``prompt`` text and a ``usage`` report of the
+        tokens each section consumed.
+        """
+        budget = max(0, context_length - max_tokens - self.safety_margin)
+        remaining = budget
+
+        for section in sections:
+            if section.required:
+                section.text = self._section_text(section, section.units)
+                section.tokens = self.count_tokens(section.text, section.static)
+                section.included_units = len(section.units or [])
+                remaining -= section.tokens
+        if remaining < 0:
+            logger.warning(f"Required prompt sections exceed the token budget by {-remaining} tokens, truncating")
+            remaining = self._truncate_required(sections, remaining)
+
+        for section in sorted((s for s in sections if not s.required), key=lambda s: s.priority):
+            if section.units is not None:
+                self._fill_units(section, remaining)
+            else:
+                tokens = self.count_tokens(section.text, section.static)
+                if tokens <= remaining:
+                    section.tokens = tokens
+                else:
+                    section.text = ""
+                    section.tokens = 0
+            remaining -= section.tokens
+
+        prompt = "".join(section.text for section in sections)
+        usage = {
+            "budget": budget,
+            "context_length": context_length,
+            "max_tokens": max_tokens,
+            "used": sum(section.tokens for section in sections),
+            "sections": {
+                section.name: {
+                    "tokens": section.tokens,
+                    **({"units": section.included_units, "total_units": len(section.units)}
+                       if section.units is not None else {}),
+                    "included": bool(section.text),
+                }
+                for section in sections
+            },
+        }
+        return {"prompt": prompt, "usage": usage}
+
+    def _truncate_required(self, sections: List[PromptSection], remaining: int) -> int:
+        """
+        Shrink required non-static sections, largest first, until ``remaining``
+        is no longer negative; returns the new ``remaining``.
+        """
+        candidates = sorted((s for s in sections if s.required and not s.static and s.text),
+                            key=lambda s: s.tokens, reverse=True)
+        for section in candidates:
+            if remaining >= 0:
+                break
+            remaining += section.tokens
+            if section.units is not None:
+                self._fill_units(section, remaining)
+            else:
+                self._truncate_text(section, remaining)
+            remaining -= section.tokens
+        if remaining < 0:
+            raise PromptTooLongError(f"Required prompt sections exceed the context window by {-remaining} tokens")
+        return remaining
+
+    def _truncate_text(self, section: PromptSection, limit: int) -> None:
+        """Cut the middle of a section's text so it fits in ``limit`` tokens, keeping both ends."""
+        original = section.text
+        text, keep = original, len(original)
+        tokens = self.count_tokens(text)
+        while tokens > limit:
+            # Scale by characters per token, undershooting a little so this converges quickly
+            keep = int(keep * max(0, limit) / tokens * 0.9)
+            if keep <= len(self.TRUNCATION_MARKER):
+                return  # Too small to keep anything useful; left for the caller to reject
+            head = (keep - len(self.TRUNCATION_MARKER)) // 2
+            tail = keep - len(self.TRUNCATION_MARKER) - head
+            text = original[:head] + self.TRUNCATION_MARKER + original[len(original) - tail:]
+            tokens = self.count_tokens(text)
+        section.text = text
+        section.tokens = tokens
+
+    def _fill_units(self, section: PromptSection, remaining: int) -> None:
+        """Include as many of a section's units as fit in ``remaining`` tokens."""
+        units = section.units or []
+        ordered = list(reversed(units)) if section.keep_latest else list(units)
+
+        used = self.count_tokens(section.header + section.footer) if units else 0
+        chosen: List[str] = []
+        for unit in ordered:
+            unit_tokens = self.count_tokens(unit + section.separator)
+            if used + unit_tokens > remaining:
+                break
+            chosen.append(unit)
+            used += unit_tokens
+
+        if not chosen:
+            section.text = ""
+            section.tokens = 0
+            section.included_units = 0
+            return
+
+        if section.keep_latest:
+            chosen.reverse()
+        section.text = self._section_text(section, chosen)
+        section.tokens = used
+        section.included_units = len(chosen)
+
+    @staticmethod
+    def _section_text(section: PromptSection, units: Optional[List[str]]) -> str:
+        if units is None:
+            return section.text
+        body = "".join(unit + section.separator for unit in units)
+        return f"{section.header}{body}{section.footer}" if units else ""
@@ -0,0 +1,251 @@
+"""
+RAG outbox indexer for AI Companion application.
+Triggers on the conversations table queue every stored assistant reply and
+every deleted message in rag_outbox; a background thread drains the outbox
+in micro-batches into the vector store, so conversations become searchable
+without explicit adds or full rescans.
+"""
+
+import logging
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from typing import Any, Dict, List, Optional, Tuple
+
+from databases.database_manager import ensure_rag_outbox
+
+logger = logging.getLogger(__name__)
+
+# One draining indexer per conversations database in this process
+_running: Dict[str, "RAGOutboxIndexer"] = {}
+_running_lock = threading.Lock()
+
+
+class RAGOutboxIndexer:
+    """
+    Drains ``rag_outbox`` into a RAGSystem's collection.
+
+    On start the indexer first re-embeds the collection if the embedding space
+    changed and runs the watermark sync to pick up history stored before the
+    outbox existed, both in the background so server startup no longer waits. Afterwards it reads up to ``batch_size`` outbox rows
+    at a time: each queued assistant reply is paired with the user message
+    before it and the pairs are embedded and added in one call, deleted
+    messages drop their pairs. Processed rows are removed from the outbox only
+    after the vector store write succeeded. A failed batch is retried one row
+    at a time so a bad row cannot hold back the ones after it; a row is dropped
+    after ``max_attempts`` failures, and polling backs off while batches fail.
+    """
+
+    MAX_BACKOFF = 60.0
+
+    def __init__(self, rag_system, batch_size: int = 64, poll_interval: float = 1.0,
+                 catch_up: bool = True, max_attempts: int = 5):
+        self.rag_system = rag_system
+        self.batch_size = max(1, int(batch_size))
+        self.poll_interval = max(0.05, float(poll_interval))
+        self.catch_up = catch_up
+        self.max_attempts = max(1, int(max_attempts))
+        self._consecutive_failures = 0
+
+        self._lock = threading.Lock()
+        self._wake_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+
+        self._stats = {
+            "indexed": 0,
+            "deleted": 0,
+            "outbox_rows": 0,
+            "batches": 0,
+            "batch_errors": 0,
+            "dropped": 0,
+            "batch_time": 0.0,
+        }
+        self._catch_up_done = not catch_up
+        self._last_indexed_at: Optional[float] = None
+        self._last_error: Optional[str] = None
+
+        with self._connect() as conn:
+            ensure_rag_outbox(conn)
+            conn.commit()
+
+    def _connect(self) -> "closing[sqlite3.Connection]":
+        return closing(sqlite3.connect(self.rag_system.db_path, timeout=30))
+
+    def start(self) -> None:
+        """Start the background catch-up sync and outbox drain."""
+        if self._worker and self._worker.is_alive():
+            return
+        with _running_lock:
+            owner = _running.get(self.rag_system.db_path)
+            if owner is not None and owner is not self and owner._worker and owner._worker.is_alive():
+                logger.info("RAG outbox is already drained by another indexer in this process")
+                return
+            _running[self.rag_system.db_path] = self
+        self._stop_event.clear()
+        self._worker = threading.Thread(target=self._worker_loop, name="rag-outbox-indexer", daemon=True)
+        self._worker.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self._wake_event.set()
+        if self._worker:
+            self._worker.join(timeout=5)
+            self._worker = None
+
+    def notify(self) -> None:
+        """Drain now instead of at the next poll (e.g. right after storing a reply)."""
+        self._wake_event.set()
+
+    def _worker_loop(self) -> None:
+        if self.catch_up:
+            try:
+                self.rag_system.ensure_embedding_space()
+                self.rag_system.sync_with_conversation_db()
+            except Exception as e:
+                self._last_error = str(e)
+                logger.error(f"Error in RAG catch-up sync: {e}")
+            self._catch_up_done = True
+
+        while not self._stop_event.is_set():
+            try:
+                self.drain()
+            except Exception as e:
+                self._last_error = str(e)
+                logger.error(f"Error draining RAG outbox: {e}")
+            # Back off while the vector store keeps failing
+            delay = min(self.MAX_BACKOFF, self.poll_interval * 2 ** min(self._consecutive_failures, 10))
+            self._wake_event.wait(delay)
+            self._wake_event.clear()
+
+    def drain(self) -> int:
+        """Process outbox batches until it is empty; returns the number of outbox rows handled."""
+        handled = 0
+        while not self._stop_event.is_set():
+            with self._connect() as conn:
+                rows = conn.execute("""
+                    SELECT id, conversation_id, operation, attempts FROM rag_outbox
+                    ORDER BY id
+                    LIMIT ?
+                """, (self.batch_size,)).fetchall()
+                if not rows:
+                    break
+                if not self._process_batch(conn, rows):
+                    break
+            handled += len(rows)
+            if len(rows) < self.batch_size:
+                break
+        return handled
+
+    def _process_batch(self, conn: sqlite3.Connection, rows: List[Tuple[int, int, str, int]]) -> bool:
+        """Index a batch of outbox rows; returns False if any row failed."""
+        started = time.perf_counter()
+        replies = [conversation_id for _, conversation_id, operation, _ in rows if operation == 'insert']
+        deleted = [conversation_id for _, conversation_id, operation, _ in rows if operation == 'delete']
+
+        try:
+            # A message deleted in the same batch is not indexed again
+            deleted_ids = set(deleted)
+            pairs = self._load_pairs(conn, [reply for reply in replies if reply not in deleted_ids])
+            indexed = self.rag_system.add_conversation_pairs(pairs)
+            self.rag_system.delete_conversations(deleted)
+
+            conn.executemany("DELETE FROM rag_outbox WHERE id = ?", [(row[0],) for row in rows])
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            with self._lock:
+                self._stats["batch_errors"] += 1
+            self._last_error = str(e)
+            if len(rows) > 1:
+                logger.warning(f"Error indexing RAG outbox batch, retrying row by row: {e}")
+                # Retry one by one so a single bad row doesn't block the rest
+                return all([self._process_batch(conn, [row]) for row in rows])
+            self._record_failure(conn, rows[0], e)
+            return False
+
+        self._consecutive_failures = 0
+        if replies and self._catch_up_done:
+            # Everything up to the newest reply is in the vector store now
+            self.rag_system.advance_sync_watermark(max(replies))
+
+        with self._lock:
+            self._stats["indexed"] += indexed
+            self._stats["deleted"] += len(deleted)
+            self._stats["outbox_rows"] += len(rows)
+            self._stats["batches"] += 1
+            self._stats["batch_time"] += time.perf_counter() - started
+            self._last_indexed_at = time.time()
+        return True
+
+    def _record_failure(self, conn: sqlite3.Connection, row: Tuple[int, int, str, int], error: Exception) -> None:
+        """Count a failed attempt for an outbox row, dropping it after ``max_attempts``."""
+        row_id, conversation_id, operation, attempts = row
+        attempts += 1
+        self._consecutive_failures += 1
+        message = f"{type(error).__name__}: {error}"
+        try:
+            if attempts >= self.max_attempts:
+                conn.execute("DELETE FROM rag_outbox WHERE id = ?", (row_id,))
+                logger.error(f"Dropping RAG outbox row {row_id} ({operation} of conversation "
+                             f"{conversation_id}) after {attempts} attempts: {message}")
+                with self._lock:
+                    self._stats["dropped"] += 1
+            else:
+                conn.execute("UPDATE rag_outbox SET attempts = ?, last_error = ? WHERE id = ?",
+                             (attempts, message, row_id))
+                logger.warning(f"RAG outbox row {row_id} failed (attempt {attempts}): {message}")
+            conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Could not record RAG outbox failure: {e}")
+
+    @staticmethod
+    def _load_pairs(conn: sqlite3.Connection, reply_ids: List[int]) -> List[Tuple[tuple, tuple]]:
+        """Each assistant reply with the message before it, if that is the user's"""
+        pairs = []
+        for reply_id in reply_ids:
+            reply = conn.execute("""
+                SELECT id, user_id, model_id, message_type, content, timestamp
+                FROM conversations WHERE id = ?
+            """, (reply_id,)).fetchone()
+            if not reply or not reply[4]:
+                continue
+            previous = conn.execute("""
+                SELECT id, user_id, model_id, message_type, content, timestamp
+                FROM conversations
+                WHERE user_id = ? AND model_id = ? AND id < ?
+                ORDER BY id DESC
+                LIMIT 1
+            """, (reply[1], reply[2], reply_id)).fetchone()
+            if previous and previous[3] == 'user' and previous[4]:
+                pairs.append((previous, reply))
+        return pairs
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get indexing counters and the outbox backlog/lag."""
+        try:
+            with self._connect() as conn:
+                pending, lag = conn.execute("""
+                    SELECT COUNT(*), (julianday('now') - MIN(created_at)) * 86400.0 FROM rag_outbox
+                """).fetchone()
+        except Exception as e:
+            logger.warning(f"Could not read RAG outbox backlog: {e}")
+            pending, lag = None, None
+
+        with self._lock:
+            stats = dict(self._stats)
+            batches = stats["batches"]
+            batch_time = stats.pop("batch_time")
+            stats.update({
+                "running": bool(self._worker and self._worker.is_alive()),
+                "catch_up_done": self._catch_up_done,
+                "pending": pending,
+                "lag_seconds": round(max(lag, 0.0), 3) if lag is not None else 0.0,
+                "last_indexed_at": self._last_indexed_at,
+                "avg_batch_ms": round(batch_time / batches * 1000, 2) if batches else 0.0,
+                "batch_size": self.batch_size,
+                "poll_interval": self.poll_interval,
+                "last_error": self._last_error,
+            })
+            return stats
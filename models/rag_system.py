@@ -7,15 +7,23 @@ import os
 import json
 import sqlite3
 import logging
-from typing import List, Dict, Any, Optional, Tuple
+import threading
+import time
+from contextlib import closing
+from typing import List, Dict, Any, Optional, Tuple, Callable
 from datetime import datetime
 import hashlib
 
 import chromadb
 from chromadb.config import Settings
-from sentence_transformers import SentenceTransformer
 import numpy as np
 
+from databases.database_manager import drop_rag_outbox
+from models.embedding_backends import embedding_space, load_embedding_model, resolve_embedding_backend
+from models.embedding_cache import EmbeddingCache
+from models.embedding_service import get_embedding_service
+from models.rag_indexer import RAGOutboxIndexer
+
 logger = logging.getLogger(__name__)
 
 class RAGSystem:
@@ -36,6 +44,14 @@ class RAGSystem:
         if self.embedding_model_name.startswith('sentence-transformers/'):
             self.embedding_model_name = self.embedding_model_name.replace('sentence-transformers/', '')
         
+        self.embedding_batch_size = max(1, int(embedding_config.get('batch_size', 32)))
+        
+        # Conversations are synced in chunks of rows read past the stored watermark
+        sync_config = rag_config.get('sync', {})
+        self.sync_chunk_size = max(1, int(sync_config.get('chunk_size', 500)))
+        # How long an unanswered user message may hold the watermark back
+        self.sync_pending_max_age = max(0, int(sync_config.get('pending_max_age_seconds', 3600)))
+        
         self.collection_name = vector_db_config.get('collection_name', 'ai2d_chat_knowledge')
         self.persist_directory = vector_db_config.get('path', 'databases/vector_db')
         
@@ -46,9 +62,34 @@ class RAGSystem:
         # Ensure vector database directory exists
         os.makedirs(self.persist_directory, exist_ok=True)
         
-        # Initialize embedding model
-        logger.info(f"Loading embedding model: {self.embedding_model_name}")
-        self.embedding_model = SentenceTransformer(self.embedding_model_name)
+        # Initialize embedding model, shared through one micro-batching worker per
+        # embedding space; the backend (torch or ONNX) decides which space that is
+        self.embedding_backend = resolve_embedding_backend(embedding_config)
+        self.embedding_space = embedding_space(self.embedding_model_name, self.embedding_backend, embedding_config)
+        logger.info(f"Loading embedding model: {self.embedding_model_name} ({self.embedding_backend})")
+        
+        def load_model():
+            return load_embedding_model(self.embedding_model_name, self.embedding_backend, embedding_config)
+        
+        self.embedding_service = None
+        service_config = embedding_config.get('service', {})
+        if service_config.get('enabled', True):
+            self.embedding_service = get_embedding_service(self.embedding_space, load_model, service_config)
+            self.embedding_model = self.embedding_service.model
+        else:
+            self.embedding_model = load_model()
+        
+        # Content-hash cache of embeddings, reset when the embedding space changes
+        self.embedding_cache = None
+        cache_config = embedding_config.get('cache', {})
+        if cache_config.get('enabled', True):
+            cache_dir = cache_config.get('path') or os.path.join(self.persist_directory, 'embedding_cache')
+            self.embedding_cache = EmbeddingCache(
+                self.embedding_space,
+                directory=os.path.expanduser(cache_dir),
+                max_entries=cache_config.get('max_entries', 4096),
+                max_disk_entries=cache_config.get('max_disk_entries', 200000)
+            )
         
         # Initialize Chroma client
         self.chroma_client = chromadb.PersistentClient(
@@ -66,7 +107,10 @@ class RAGSystem:
         except Exception:
             self.collection = self.chroma_client.create_collection(
                 name=self.collection_name,
-                metadata={"description": "AI Companion conversation memory and knowledge base"}
+                metadata={
+                    "description": "AI Companion conversation memory and knowledge base",
+                    "embedding_space": self.embedding_space
+                }
             )
             logger.info(f"Created new collection: {self.collection_name}")
         
@@ -78,13 +122,33 @@ class RAGSystem:
         if self.db_path.startswith('~'):
             self.db_path = os.path.expanduser(self.db_path)
         
+        # Last conversation row synced into the collection, kept next to the vector DB
+        self.sync_state_path = os.path.join(self.persist_directory, f"{self.collection_name}_sync.json")
+        self._sync_lock = threading.Lock()
+        # Serializes the check-then-add of conversation pairs (sync and outbox indexer)
+        self._pairs_lock = threading.Lock()
+        self.last_sync: Optional[Dict[str, Any]] = None
+        
         logger.info("RAG System initialized successfully")
     
+    def _encode_batch(self, texts: List[str]):
+        if self.embedding_service:
+            return self.embedding_service.encode(texts)
+        return self.embedding_model.encode(
+            texts, batch_size=self.embedding_batch_size,
+            normalize_embeddings=True, show_progress_bar=False
+        )
+    
+    def encode_texts(self, texts: List[str]) -> List[List[float]]:
+        """Normalized embeddings for texts, served from the embedding cache where possible"""
+        if self.embedding_cache:
+            return [vector.tolist() for vector in self.embedding_cache.encode(texts, self._encode_batch)]
+        return self._encode_batch(texts).tolist()
+    
     def generate_embedding(self, text: str) -> List[float]:
         """Generate embedding for given text"""
         try:
-            embedding = self.embedding_model.encode(text, normalize_embeddings=True)
-            return embedding.tolist()
+            return self.encode_texts([text])[0]
         except Exception as e:
             logger.error(f"Error generating embedding: {e}")
             return []
@@ -94,7 +158,7 @@ class RAGSystem:
         """Add conversation pair to vector database for semantic search"""
         try:
             # Create unique ID for this conversation pair
-            doc_id = f"conv_{conversation_id}_{hashlib.md5(user_message.encode()).hexdigest()[:8]}"
+            doc_id = self._conversation_doc_id(conversation_id, user_message)
             
             # Combine user and assistant messages for better context
             combined_text = f"User: {user_message}\nAssistant: {assistant_message}"
@@ -250,58 +314,213 @@ class RAGSystem:
             logger.error(f"Error getting relevant context: {e}")
             return ""
     
-    def sync_with_conversation_db(self):
-        """Sync conversation database with vector database"""
+    @staticmethod
+    def _conversation_doc_id(conversation_id: int, user_message: str) -> str:
+        return f"conv_{conversation_id}_{hashlib.md5(user_message.encode()).hexdigest()[:8]}"
+    
+    def _load_sync_watermark(self) -> int:
+        """Last conversation row id synced from the current conversation database"""
         try:
-            # Connect to conversation database
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Get conversations that aren't in vector database yet
-            cursor.execute("""
-                SELECT id, user_message, assistant_response, timestamp, user_id 
-                FROM conversations 
-                WHERE user_message IS NOT NULL AND assistant_response IS NOT NULL
-                ORDER BY timestamp DESC
-                LIMIT 100
-            """)
-            
-            conversations = cursor.fetchall()
+            with open(self.sync_state_path, 'r') as f:
+                state = json.load(f)
+            if state.get('db_path') != self.db_path:
+                logger.info("Conversation database changed, syncing RAG collection from the start")
+                return 0
+            return int(state.get('last_conversation_id', 0))
+        except FileNotFoundError:
+            return 0
+        except Exception as e:
+            logger.warning(f"Could not read RAG sync state, syncing from the start: {e}")
+            return 0
+    
+    def _save_sync_watermark(self, last_conversation_id: int):
+        state = {
+            'last_conversation_id': last_conversation_id,
+            'db_path': self.db_path,
+            'embedding_model': self.embedding_model_name,
+            'updated_at': datetime.now().isoformat()
+        }
+        temp_path = f"{self.sync_state_path}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(temp_path, self.sync_state_path)
+    
+    def add_conversation_pairs(self, pairs: List[Tuple[tuple, tuple]]) -> int:
+        """Embed (user row, assistant row) pairs in batches and add them in one call"""
+        if not pairs:
+            return 0
+        
+        with self._pairs_lock:
+            ids = [self._conversation_doc_id(user_row[0], user_row[4]) for user_row, _ in pairs]
+        
+            # Rows behind a held-back watermark are read again; skip what is already stored
+            existing = set(self.collection.get(ids=ids, include=[])['ids'])
+            new_pairs = [(doc_id, pair) for doc_id, pair in zip(ids, pairs) if doc_id not in existing]
+            if not new_pairs:
+                return 0
+        
+            documents = [f"User: {user_row[4]}\nAssistant: {assistant_row[4]}"
+                         for _, (user_row, assistant_row) in new_pairs]
+            embeddings = self.encode_texts(documents)
+        
+            synced_at = datetime.now().isoformat()
+            metadatas = [{
+                "conversation_id": user_row[0],
+                "user_message": user_row[4],
+                "assistant_message": assistant_row[4],
+                "timestamp": synced_at,
+                "type": "conversation",
+                "user_id": user_row[1],
+                "model_id": user_row[2],
+                "response_id": assistant_row[0],
+                "original_timestamp": user_row[5]
+            } for _, (user_row, assistant_row) in new_pairs]
+        
+            self.collection.add(
+                ids=[doc_id for doc_id, _ in new_pairs],
+                embeddings=embeddings,
+                documents=documents,
+                metadatas=metadatas
+            )
+            return len(new_pairs)
+    
+    def delete_conversations(self, conversation_ids: List[int]):
+        """Remove the pairs built from any of the given conversation rows"""
+        if not conversation_ids:
+            return
+        ids = [int(conversation_id) for conversation_id in conversation_ids]
+        self.collection.delete(where={"$or": [
+            {"conversation_id": {"$in": ids}},
+            {"response_id": {"$in": ids}}
+        ]})
+    
+    def advance_sync_watermark(self, conversation_id: int):
+        """Move the sync watermark forward once rows up to ``conversation_id`` are indexed elsewhere"""
+        with self._sync_lock:
+            if conversation_id > self._load_sync_watermark():
+                self._save_sync_watermark(conversation_id)
+    
+    def ensure_embedding_space(self) -> int:
+        """
+        Re-embed every document if the collection was built in another embedding
+        space (e.g. after switching to or from the int8 ONNX model). Collections
+        from before the space was recorded count as the configured model's space.
+        Returns the number of documents re-embedded.
+        """
+        metadata = dict(self.collection.metadata or {})
+        stored_space = metadata.get('embedding_space', self.embedding_model_name)
+        reembedded = 0
+        if stored_space != self.embedding_space:
+            logger.warning(f"Vector collection was embedded as '{stored_space}', re-embedding it as "
+                           f"'{self.embedding_space}'")
+            started = time.perf_counter()
+            offset = 0
+            while True:
+                page = self.collection.get(limit=self.sync_chunk_size, offset=offset, include=["documents"])
+                if not page['ids']:
+                    break
+                self.collection.update(ids=page['ids'], embeddings=self.encode_texts(page['documents']))
+                offset += len(page['ids'])
+                logger.info(f"Re-embedded {offset} documents")
+            reembedded = offset
+            logger.info(f"Re-embedded {reembedded} documents in {time.perf_counter() - started:.1f}s")
+        if metadata.get('embedding_space') != self.embedding_space:
+            metadata['embedding_space'] = self.embedding_space
+            self.collection.modify(metadata=metadata)
+        return reembedded
+    
+    def sync_with_conversation_db(self, backfill: bool = False,
+                                  progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None) -> int:
+        """
+        Sync conversations added since the last sync into the vector database.
+        
+        Rows past the stored watermark are read in chunks of ``sync_chunk_size``;
+        each user message is paired with the next assistant message of the same
+        user/model, and a chunk's pairs are embedded in batches and added in one
+        call before the watermark moves on. ``backfill`` starts over from the first
+        conversation. A user message still waiting for its reply holds the
+        watermark back so the pair is picked up by a later sync, for at most
+        ``sync_pending_max_age`` seconds (a newer message of the same user/model
+        releases it right away), so a reply that never comes can't pin it.
+        """
+        with self._sync_lock:
+            started = time.perf_counter()
+            watermark = 0 if backfill else self._load_sync_watermark()
+            synced_count = 0
+            rows_scanned = 0
             
-            # Get existing document IDs to avoid duplicates
-            existing_ids = set()
             try:
-                existing_data = self.collection.get()
-                existing_ids = set(existing_data['ids'])
-            except Exception as e:
-                logger.warning(f"Could not fetch existing IDs: {e}")
-            
-            synced_count = 0
-            for conv_id, user_msg, assistant_msg, timestamp, user_id in conversations:
-                # Generate expected document ID
-                expected_id = f"conv_{conv_id}_{hashlib.md5(user_msg.encode()).hexdigest()[:8]}"
-                
-                # Skip if already exists
-                if expected_id in existing_ids:
-                    continue
-                
-                # Add to vector database
-                metadata = {
-                    'user_id': user_id,
-                    'original_timestamp': timestamp
-                }
+                conn = sqlite3.connect(self.db_path)
+                try:
+                    total_rows = conn.execute(
+                        "SELECT COUNT(*) FROM conversations WHERE id > ?", (watermark,)
+                    ).fetchone()[0]
+                    # Same format (UTC) as the CURRENT_TIMESTAMP default of conversations.timestamp
+                    pending_cutoff = conn.execute(
+                        "SELECT datetime('now', ?)", (f"-{self.sync_pending_max_age} seconds",)
+                    ).fetchone()[0]
+                    
+                    # (user_id, model_id) -> user row waiting for its assistant reply
+                    pending: Dict[Tuple[str, str], tuple] = {}
+                    last_id = watermark
+                    while True:
+                        rows = conn.execute("""
+                            SELECT id, user_id, model_id, message_type, content, timestamp
+                            FROM conversations
+                            WHERE id > ?
+                            ORDER BY id
+                            LIMIT ?
+                        """, (last_id, self.sync_chunk_size)).fetchall()
+                        if not rows:
+                            break
+                        
+                        pairs = []
+                        for row in rows:
+                            key = (row[1], row[2])
+                            if row[3] == 'user':
+                                pending[key] = row
+                            elif row[3] == 'assistant':
+                                user_row = pending.pop(key, None)
+                                if user_row and user_row[4] and row[4]:
+                                    pairs.append((user_row, row))
+                        
+                        last_id = rows[-1][0]
+                        rows_scanned += len(rows)
+                        synced_count += self.add_conversation_pairs(pairs)
+                        
+                        held = [row[0] - 1 for row in pending.values() if row[5] and str(row[5]) > pending_cutoff]
+                        watermark = min([last_id] + held)
+                        self._save_sync_watermark(watermark)
+                        
+                        progress = {
+                            'rows_scanned': rows_scanned,
+                            'total_rows': total_rows,
+                            'synced': synced_count,
+                            'watermark': watermark
+                        }
+                        logger.info(f"RAG sync: {rows_scanned}/{total_rows} rows scanned, "
+                                    f"{synced_count} conversations added")
+                        if progress_callback:
+                            progress_callback(progress)
+                        
+                        if len(rows) < self.sync_chunk_size:
+                            break
+                finally:
+                    conn.close()
                 
-                if self.add_conversation_to_vector_db(conv_id, user_msg, assistant_msg, metadata):
-                    synced_count += 1
-            
-            conn.close()
-            
+            except Exception as e:
+                logger.error(f"Error syncing with conversation database: {e}")
+            
+            self.last_sync = {
+                'synced': synced_count,
+                'rows_scanned': rows_scanned,
+                'watermark': watermark,
+                'backfill': backfill,
+                'duration_ms': round((time.perf_counter() - started) * 1000, 2),
+                'finished_at': datetime.now().isoformat()
+            }
             logger.info(f"Synced {synced_count} conversations with vector database")
             return synced_count
-            
-        except Exception as e:
-            logger.error(f"Error syncing with conversation database: {e}")
-            return 0
     
     def get_collection_stats(self) -> Dict[str, Any]:
         """Get statistics about the vector database collection"""
@@ -319,7 +538,12 @@ class RAGSystem:
                 'total_documents': total_documents,
                 'type_counts': type_counts,
                 'collection_name': self.collection_name,
-                'embedding_model': self.embedding_model_name
+                'embedding_model': self.embedding_model_name,
+                'embedding_backend': self.embedding_backend,
+                'embedding_space': self.embedding_space,
+                'embedding_cache': self.embedding_cache.get_stats() if self.embedding_cache else {'enabled': False},
+                'embedding_service': self.embedding_service.get_stats() if self.embedding_service else {'enabled': False},
+                'last_sync': self.last_sync
             }
             
         except Exception as e:
@@ -335,9 +559,16 @@ class RAGSystem:
             # Create a new empty collection
             self.collection = self.chroma_client.create_collection(
                 name=self.collection_name,
-                metadata={"description": "AI Companion conversation memory and knowledge base"}
+                metadata={
+                    "description": "AI Companion conversation memory and knowledge base",
+                    "embedding_space": self.embedding_space
+                }
             )
             
+            # Everything has to be synced again into the new collection
+            if os.path.exists(self.sync_state_path):
+                os.remove(self.sync_state_path)
+            
             logger.info(f"Cleared collection: {self.collection_name}")
             return True
             
@@ -355,11 +586,38 @@ class RAGEnhancedMemorySystem:
         self.config = config
         self.rag_system = RAGSystem(config)
         
-        # Auto-sync on initialization
-        self.rag_system.sync_with_conversation_db()
+        # Conversations reach the vector store through the outbox; the catch-up
+        # sync runs on the indexer thread instead of delaying startup
+        self.indexer = None
+        indexer_config = config.get('rag', {}).get('indexer', {})
+        if indexer_config.get('enabled', True):
+            try:
+                self.indexer = RAGOutboxIndexer(
+                    self.rag_system,
+                    batch_size=indexer_config.get('batch_size', 64),
+                    poll_interval=indexer_config.get('poll_interval', 1.0),
+                    max_attempts=indexer_config.get('max_attempts', 5)
+                )
+                self.indexer.start()
+            except Exception as e:
+                logger.error(f"Failed to start RAG outbox indexer, syncing inline: {e}")
+                self.indexer = None
+        if self.indexer is None:
+            # Without an indexer nothing drains the outbox; conversations are added inline instead
+            with closing(sqlite3.connect(self.rag_system.db_path)) as conn:
+                drop_rag_outbox(conn)
+                conn.commit()
+            self.rag_system.ensure_embedding_space()
+            self.rag_system.sync_with_conversation_db()
         
         logger.info("RAG Enhanced Memory System initialized")
     
+    def get_indexing_stats(self) -> Dict[str, Any]:
+        """Outbox indexer counters and lag"""
+        if self.indexer is None:
+            return {'enabled': False}
+        return {'enabled': True, **self.indexer.get_stats()}
+    
     def add_conversation(self, user_message: str, assistant_response: str, 
                         user_id: str = None, metadata: Dict[str, Any] = None):
         """Add conversation to both traditional and vector databases"""
@@ -0,0 +1,214 @@
+"""
+Shared message analysis for AI Companion application.
+Memory extraction, bonding XP, personality updates, memory importance scoring
+and basic emotion detection all look at the same text. The analyzer scans it
+once with precompiled patterns and hands every consumer the same features.
+"""
+
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import cached_property
+from typing import Dict, FrozenSet, Optional, Sequence, Tuple
+
+# Keyword groups matched as substrings of the lower-cased text; a group's count
+# is the number of its keywords present (each keyword counted once)
+KEYWORD_GROUPS: Dict[str, Tuple[str, ...]] = {
+    # MemorySystem._analyze_importance
+    'importance_high': ('love', 'hate', 'important', 'secret', 'personal', 'family', 'work',
+                        'passion', 'dream', 'goal'),
+    'importance_low': ('maybe', 'perhaps', 'casual', 'random', 'whatever', 'small talk'),
+    # Bonding XP
+    'personal_sharing': ('i feel', 'i think', 'i love', 'i hate', 'my favorite', "i'm worried",
+                         "i'm excited"),
+    'emotional_words': ('happy', 'sad', 'excited', 'worried', 'love', 'hate', 'feel'),
+    # PersonalitySystem.analyze_user_input
+    'positive': ('thank', 'love', 'great', 'awesome', 'wonderful', 'amazing', 'help', 'care',
+                 'kind', 'sweet', 'cute', 'beautiful', 'perfect'),
+    'negative': ('hate', 'stupid', 'annoying', 'bad', 'terrible', 'awful', 'shut up', 'go away',
+                 'leave', 'stop', 'angry', 'mad'),
+    'playful': ('play', 'game', 'fun', 'laugh', 'joke', 'silly', 'tease', 'dance', 'sing',
+                'story', 'adventure', 'explore'),
+    # detect_basic_emotions (in this order: ties go to the earlier emotion)
+    'emotion_happy': ('happy', 'joy', 'excited', 'great', 'wonderful', 'fantastic', 'excellent', '!'),
+    'emotion_sad': ('sad', 'sorry', 'unfortunate', 'disappointed', 'regret'),
+    'emotion_angry': ('angry', 'frustrated', 'annoyed', 'upset'),
+    'emotion_surprised': ('wow', 'amazing', 'incredible', 'unexpected', 'surprise'),
+    'emotion_confused': ('confused', 'puzzled', 'unclear', 'not sure', "don't understand"),
+    'emotion_neutral': ('okay', 'alright', 'understood', 'yes', 'no'),
+}
+
+EMOTION_GROUPS = ('happy', 'sad', 'angry', 'surprised', 'confused', 'neutral')
+_EMOTION_KEYS = tuple((emotion, f'emotion_{emotion}') for emotion in EMOTION_GROUPS)
+
+# Memory extraction and bonding patterns. Each comes with literals one of which
+# must be in the text for it to match; the literals are looked up together with
+# the keywords, so most patterns are skipped without a regex scan.
+NAME_PATTERNS = (
+    (re.compile(r"(?:my name is|i'm|i am|call me)\s+([a-zA-Z]+)"), ("my name is", "i'm", "i am", "call me")),
+    (re.compile(r"name.{0,10}([a-zA-Z]+)"), ("name",)),
+)
+PREFERENCE_PATTERNS = (
+    (re.compile(r"i (?:love|like|enjoy|prefer)\s+([^.,!?]+)"), ("i love", "i like", "i enjoy", "i prefer"),
+     'preference', 'medium'),
+    (re.compile(r"i (?:hate|dislike|don't like)\s+([^.,!?]+)"), ("i hate", "i dislike", "i don't like"),
+     'preference', 'medium'),
+    (re.compile(r"my favorite\s+([^.,!?]+)"), ("my favorite",), 'preference', 'high'),
+    (re.compile(r"i'm (?:into|interested in)\s+([^.,!?]+)"), ("i'm into", "i'm interested in"), 'interest', 'medium'),
+    (re.compile(r"i work (?:as|at|in)\s+([^.,!?]+)"), ("i work",), 'fact', 'high'),
+    (re.compile(r"i study\s+([^.,!?]+)"), ("i study",), 'fact', 'medium'),
+    (re.compile(r"i live in\s+([^.,!?]+)"), ("i live in",), 'fact', 'medium'),
+)
+EMOTION_PATTERNS = (
+    (re.compile(r"i (?:feel|am feeling|am)\s+(happy|sad|excited|worried|tired|stressed|angry|frustrated|lonely|anxious|depressed)"),
+     ("i feel", "i am")),
+    (re.compile(r"i'm\s+(happy|sad|excited|worried|tired|stressed|angry|frustrated|lonely|anxious|depressed)"),
+     ("i'm",)),
+)
+# Personal questions, compliments and affection directed at the avatar
+BONDING_PATTERNS = (
+    (re.compile(r'\b(your|you)\s+(name|like|think|feel|want)'), ('you',)),
+    (re.compile(r'\b(tell|about)\s+(yourself|you)'), ('you',)),
+    (re.compile(r'\b(how|what)\s+(are|do)\s+you'), ('you',)),
+    (re.compile(r'\b(i|me)\s+(love|like|care|trust)'), ('love', 'like', 'care', 'trust')),
+)
+
+_WORD = re.compile(r'\b\w+\b')
+
+
+@dataclass
+class TextFeatures:
+    """Everything the consumers read from one message; shared, so treat as read-only."""
+    text: str
+    lower: str
+    keywords: FrozenSet[str]
+    keyword_counts: Dict[str, int]
+    names: Tuple[str, ...] = ()
+    # (memory_type, matched text, importance)
+    preferences: Tuple[Tuple[str, str, str], ...] = ()
+    emotions: Tuple[str, ...] = ()
+    bonding_matches: int = 0
+    word_count: int = 0
+    is_question: bool = False
+    exclamations: int = 0
+    caps_ratio: float = 0.0
+    # detect_basic_emotions: emotions with keyword hits, and the one with the most
+    detected_emotions: Tuple[str, ...] = ()
+    primary_emotion: str = 'neutral'
+
+    @cached_property
+    def tokens(self) -> Tuple[str, ...]:
+        """Lower-cased words of the text (tokenized on first use)."""
+        return tuple(_WORD.findall(self.lower))
+
+    def count(self, group: str) -> int:
+        """Number of the group's keywords present in the text."""
+        return self.keyword_counts.get(group, 0)
+
+
+class TextAnalyzer:
+    """
+    One-pass analyzer with every keyword and pattern compiled once.
+
+    Keywords shared by several groups are looked up once per message (the same
+    ``keyword in text`` test the consumers used to repeat), and group counts are
+    derived from the keywords found. Results are kept in a small LRU so every
+    consumer of the same message shares one analysis.
+    """
+
+    def __init__(self, keyword_groups: Optional[Dict[str, Sequence[str]]] = None, cache_size: int = 256):
+        self.keyword_groups = {group: tuple(words) for group, words in (keyword_groups or KEYWORD_GROUPS).items()}
+        groups_of: Dict[str, list] = {}
+        for group, words in self.keyword_groups.items():
+            for word in dict.fromkeys(words):
+                groups_of.setdefault(word, []).append(group)
+        self.groups_of = {word: tuple(groups) for word, groups in groups_of.items()}
+        gates = [literals for patterns in (NAME_PATTERNS, PREFERENCE_PATTERNS, EMOTION_PATTERNS, BONDING_PATTERNS)
+                 for _, literals, *_ in patterns]
+        self.literals = tuple(dict.fromkeys([*self.groups_of, *(literal for group in gates for literal in group)]))
+        self.cache_size = max(0, int(cache_size))
+        self._cache: "OrderedDict[str, TextFeatures]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def find_keywords(self, lower: str) -> FrozenSet[str]:
+        """Keywords (of any group) contained in already lower-cased text."""
+        return frozenset(filter(lower.__contains__, self.groups_of))
+
+    def find_literals(self, lower: str) -> FrozenSet[str]:
+        """Keywords and pattern literals contained in already lower-cased text."""
+        return frozenset(filter(lower.__contains__, self.literals))
+
+    def analyze(self, text: str) -> TextFeatures:
+        """Analyze a message (served from the LRU when it was just analyzed)."""
+        text = text or ""
+        with self._lock:
+            features = self._cache.get(text)
+            if features is not None:
+                self._cache.move_to_end(text)
+                return features
+
+        features = self._analyze(text)
+
+        if self.cache_size:
+            with self._lock:
+                self._cache[text] = features
+                if len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return features
+
+    def _analyze(self, text: str) -> TextFeatures:
+        lower = text.lower()
+        found = self.find_literals(lower)
+        keywords = found.intersection(self.groups_of)
+        keyword_counts = dict.fromkeys(self.keyword_groups, 0)
+        for word in keywords:
+            for group in self.groups_of[word]:
+                keyword_counts[group] += 1
+
+        names = []
+        for pattern, literals in NAME_PATTERNS:
+            match = not found.isdisjoint(literals) and pattern.search(lower)
+            if match:
+                names.append(match.group(1).capitalize())
+        preferences = [
+            (memory_type, match.group(1).strip(), importance)
+            for pattern, literals, memory_type, importance in PREFERENCE_PATTERNS if not found.isdisjoint(literals)
+            for match in pattern.finditer(lower)
+        ]
+        emotions = [
+            match.group(1)
+            for pattern, literals in EMOTION_PATTERNS if not found.isdisjoint(literals)
+            for match in pattern.finditer(lower)
+        ]
+
+        emotion_scores = {emotion: keyword_counts.get(group, 0) for emotion, group in _EMOTION_KEYS}
+        detected = tuple(emotion for emotion, score in emotion_scores.items() if score)
+        return TextFeatures(
+            text=text,
+            lower=lower,
+            keywords=keywords,
+            keyword_counts=keyword_counts,
+            names=tuple(names),
+            preferences=tuple(preferences),
+            emotions=tuple(emotions),
+            bonding_matches=sum(1 for pattern, literals in BONDING_PATTERNS
+                                if not found.isdisjoint(literals) and pattern.search(lower)),
+            word_count=len(text.split()),
+            is_question='?' in text,
+            exclamations=text.count('!'),
+            caps_ratio=sum(map(str.isupper, text)) / max(len(text), 1),
+            detected_emotions=detected,
+            primary_emotion=max(detected, key=emotion_scores.get) if detected else 'neutral',
+        )
+
+
+_default_analyzer: Optional[TextAnalyzer] = None
+
+
+def get_text_analyzer() -> TextAnalyzer:
+    """Shared analyzer with the default keyword groups (compiled on first use)."""
+    global _default_analyzer
+    if _default_analyzer is None:
+        _default_analyzer = TextAnalyzer()
+    return _default_analyzer
@@ -11,6 +11,8 @@ from datetime import datetime
 import traceback
 import sqlite3
 from databases.database_manager import get_database_path
+from models.llm_scheduler import RequestPriority
+from models.text_analyzer import get_text_analyzer
 
 logger = logging.getLogger(__name__)
 chat_bp = Blueprint('chat', __name__)
@@ -18,9 +20,10 @@ chat_bp = Blueprint('chat', __name__)
 # app_routes_chat.py
 # Chat API routes with multi-avatar support
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 import logging
 import traceback
+import uuid
 from datetime import datetime
 
 # Blueprint definition
@@ -34,120 +37,25 @@ def api_chat():
         if not data:
             return jsonify({'error': 'No JSON data provided'}), 400
         
-        user_message = data.get('message', '').strip()
-        if not user_message:
+        chat_context = build_chat_context(data)
+        if not chat_context['user_message']:
             return jsonify({'error': 'No message provided'}), 400
         
-        # Multi-avatar context
-        avatar_id = data.get('avatar_id')
-        avatar_name = data.get('avatar_name', 'Assistant')
-        active_avatars = data.get('active_avatars', [])
-        conversation_context = data.get('conversation_context', [])
-        
-        # User context from frontend
-        user_info = data.get('user_info', {})
-        user_id = user_info.get('user_id')
-        user_display_name = user_info.get('display_name', 'User')
-        user_preferences = user_info.get('preferences', {})
-        
         # Import global handlers here to avoid circular imports
-        from app_globals import llm_handler, personality_system, app_state
+        from app_globals import llm_handler
         
         if llm_handler is None:
             return jsonify({'error': 'LLM handler not initialized'}), 503
         
-        # Prepare context for multi-avatar chat with user information
-        chat_context = {
-            'user_message': user_message,
-            'avatar_id': avatar_id,
-            'avatar_name': avatar_name,
-            'active_avatars_count': len(active_avatars),
-            'active_avatars': active_avatars,
-            'conversation_history': conversation_context,
-            'user_info': {
-                'user_id': user_id,
-                'display_name': user_display_name,
-                'preferences': user_preferences
-            },
-            'timestamp': datetime.now().isoformat()
-        }
-        
-        # Get avatar-specific information from database if available
-        avatar_info = get_avatar_database_info(avatar_id) if avatar_id else None
-        if avatar_info:
-            chat_context['avatar_description'] = avatar_info.get('description', '')
-            chat_context['avatar_motions'] = list(avatar_info.get('motions', {}).keys())
-        
-        # Generate response with avatar context
-        if avatar_id:
-            # Multi-avatar mode: include avatar context in prompt with model isolation
-            enhanced_prompt = build_avatar_prompt(user_message, chat_context)
-            response_text = llm_handler.generate_response(
-                enhanced_prompt,
-                user_id=str(user_id) if user_id else "default_user",
-                model_id=avatar_id  # Use avatar_id as model_id for isolation
-            )
-        else:
-            # Legacy single chat mode
-            response_text = llm_handler.generate_response(
-                user_message,
-                user_id=str(user_id) if user_id else "default_user"
-            )
-        
-        # Basic emotion detection (enhanced emotion system will be rebuilt later)
-        emotions, primary_emotion = detect_basic_emotions(response_text)
-        
-        # Store conversation in memory system if available and user is authenticated
-        try:
-            if (hasattr(llm_handler, 'memory_system') and llm_handler.memory_system and 
-                user_id is not None and user_id != ''):
-                llm_handler.memory_system.store_conversation(
-                    user_message, 
-                    response_text,
-                    metadata={
-                        'avatar_id': avatar_id,
-                        'avatar_name': avatar_name,
-                        'primary_emotion': primary_emotion,
-                        'active_avatars_count': len(active_avatars),
-                        'user_id': user_id,
-                        'user_display_name': user_display_name
-                    }
-                )
-                logging.info(f"Stored conversation in memory for user {user_id}")
-            else:
-                logging.info("Skipping memory storage - no authenticated user or memory system unavailable")
-        except Exception as e:
-            logging.warning(f"Failed to store conversation in memory: {e}")
-
-        # Store in conversation history database (only if user is authenticated)
+        # A newer message with the same client_id supersedes this one
+        cancel_token = llm_handler.cancellations.new_token(get_cancel_owner(data))
         try:
-            if user_id is not None and user_id != '':
-                store_conversation_message(user_id, avatar_id, user_message, response_text, {
-                    'user_display_name': user_display_name,
-                    'avatar_name': avatar_name,
-                    'primary_emotion': primary_emotion,
-                    'active_avatars_count': len(active_avatars)
-                })
-                logging.info(f"Stored conversation in database for user {user_id}")
-            else:
-                logging.info("Skipping database storage - no authenticated user")
-        except Exception as e:
-            logging.warning(f"Failed to store conversation in database: {e}")        # Log chat interaction
-        logging.info(f"Chat - User: {user_display_name} ({user_id}), "
-                    f"Avatar: {avatar_name} ({avatar_id}), "
-                    f"Active: {len(active_avatars)}, "
-                    f"Emotion: {primary_emotion}, "
-                    f"Message: {user_message[:50]}...")
-        
-        return jsonify({
-            'reply': response_text,
-            'emotions': emotions,
-            'primary_emotion': primary_emotion,
-            'avatar_id': avatar_id,
-            'avatar_name': avatar_name,
-            'timestamp': datetime.now().isoformat(),
-            'active_avatars_count': len(active_avatars)
-        })
+            response_text = generate_chat_reply(llm_handler, chat_context, cancel_token=cancel_token)
+            if cancel_token.cancelled:
+                return jsonify({'cancelled': True, 'reason': cancel_token.reason, 'reply': ''})
+            return jsonify(finalize_chat_reply(llm_handler, chat_context, response_text))
+        finally:
+            llm_handler.cancellations.release(cancel_token)
         
     except Exception as e:
         error_msg = f"Chat API error: {str(e)}"
@@ -160,6 +68,220 @@ def api_chat():
         }), 500
 
 
+@chat_routes.route('/api/chat/stream', methods=['POST'])
+def api_chat_stream():
+    """
+    Streaming chat endpoint (Server-Sent Events).
+    Emits a `chunk` event per decoded token, then a `done` event carrying the same
+    payload as /api/chat (final reply, emotions and metadata), or a `cancelled`
+    event if a newer message or /api/chat/cancel stopped the generation. Closing
+    the connection cancels the generation.
+    """
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({'error': 'No JSON data provided'}), 400
+    
+    chat_context = build_chat_context(data)
+    if not chat_context['user_message']:
+        return jsonify({'error': 'No message provided'}), 400
+    
+    from app_globals import llm_handler
+    
+    if llm_handler is None:
+        return jsonify({'error': 'LLM handler not initialized'}), 503
+    
+    cancel_token = llm_handler.cancellations.new_token(get_cancel_owner(data))
+    
+    def event_stream():
+        try:
+            stream = generate_chat_reply(llm_handler, chat_context, streaming=True, cancel_token=cancel_token)
+            if isinstance(stream, str):
+                response_text = stream
+            else:
+                tokens = []
+                while True:
+                    try:
+                        token = next(stream)
+                    except StopIteration as stop:
+                        response_text = stop.value if stop.value is not None else ''.join(tokens)
+                        break
+                    tokens.append(token)
+                    yield format_sse('chunk', {'token': token})
+            if cancel_token.cancelled:
+                yield format_sse('cancelled', {'reason': cancel_token.reason})
+                return
+            yield format_sse('done', finalize_chat_reply(llm_handler, chat_context, response_text))
+        except GeneratorExit:
+            # The client went away mid-stream; stop decoding for it
+            cancel_token.cancel("disconnected")
+            raise
+        except Exception as e:
+            logging.error(f"Chat stream error: {e}\n{traceback.format_exc()}")
+            yield format_sse('error', {
+                'error': f"Chat stream error: {str(e)}",
+                'reply': 'Sorry, I encountered an error while processing your message.'
+            })
+        finally:
+            llm_handler.cancellations.release(cancel_token)
+    
+    return Response(stream_with_context(event_stream()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # Don't let a reverse proxy buffer the stream
+    })
+
+
+@chat_routes.route('/api/chat/cancel', methods=['POST'])
+def api_chat_cancel():
+    """Cancel the client's in-flight chat generation (same client_id as the chat request)"""
+    data = request.get_json(silent=True) or {}
+    if not data.get('client_id'):
+        return jsonify({'error': 'client_id is required to cancel a generation'}), 400
+    
+    from app_globals import llm_handler
+    
+    if llm_handler is None:
+        return jsonify({'error': 'LLM handler not initialized'}), 503
+    
+    cancelled = llm_handler.cancellations.cancel(get_cancel_owner(data), "client")
+    return jsonify({'cancelled': cancelled})
+
+
+def get_cancel_owner(data):
+    """
+    Key an HTTP client's in-flight generation. Only requests carrying the same
+    explicit client_id supersede each other; without one each request gets its own
+    key, so other tabs or drawing observations never cancel a user's reply.
+    """
+    client_id = data.get('client_id')
+    if client_id:
+        return f"http:{client_id}"
+    return f"http:request:{uuid.uuid4().hex}"
+
+
+def format_sse(event, payload):
+    """Format a Server-Sent Events message with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+
+def build_chat_context(data):
+    """Extract the chat request fields shared by the blocking and streaming endpoints"""
+    # Multi-avatar context
+    avatar_id = data.get('avatar_id')
+    active_avatars = data.get('active_avatars', [])
+    
+    # User context from frontend
+    user_info = data.get('user_info', {})
+    user_id = user_info.get('user_id')
+    
+    # Prepare context for multi-avatar chat with user information
+    chat_context = {
+        'user_message': data.get('message', '').strip(),
+        'avatar_id': avatar_id,
+        'avatar_name': data.get('avatar_name', 'Assistant'),
+        'active_avatars_count': len(active_avatars),
+        'active_avatars': active_avatars,
+        'conversation_history': data.get('conversation_context', []),
+        'user_info': {
+            'user_id': user_id,
+            'display_name': user_info.get('display_name', 'User'),
+            'preferences': user_info.get('preferences', {})
+        },
+        'timestamp': datetime.now().isoformat()
+    }
+    
+    # Get avatar-specific information from database if available
+    avatar_info = get_avatar_database_info(avatar_id) if avatar_id else None
+    if avatar_info:
+        chat_context['avatar_description'] = avatar_info.get('description', '')
+        chat_context['avatar_motions'] = list(avatar_info.get('motions', {}).keys())
+    
+    return chat_context
+
+
+def generate_chat_reply(llm_handler, chat_context, streaming=False, cancel_token=None):
+    """Generate the reply (or token stream) for a chat request"""
+    user_id = chat_context['user_info']['user_id']
+    avatar_id = chat_context['avatar_id']
+    
+    # Generate response with avatar context
+    if avatar_id:
+        # Multi-avatar mode: include avatar context in prompt with model isolation
+        enhanced_prompt = build_avatar_prompt(chat_context['user_message'], chat_context)
+        return llm_handler.generate_response(
+            enhanced_prompt,
+            user_id=str(user_id) if user_id else "default_user",
+            streaming=streaming,
+            model_id=avatar_id,  # Use avatar_id as model_id for isolation
+            cancel_token=cancel_token
+        )
+    
+    # Legacy single chat mode
+    return llm_handler.generate_response(
+        chat_context['user_message'],
+        user_id=str(user_id) if user_id else "default_user",
+        streaming=streaming,
+        cancel_token=cancel_token
+    )
+
+
+def finalize_chat_reply(llm_handler, chat_context, response_text):
+    """Detect emotions, persist the exchange and build the chat response payload"""
+    user_message = chat_context['user_message']
+    avatar_id = chat_context['avatar_id']
+    avatar_name = chat_context['avatar_name']
+    active_avatars_count = chat_context['active_avatars_count']
+    user_id = chat_context['user_info']['user_id']
+    user_display_name = chat_context['user_info']['display_name']
+    
+    # Basic emotion detection (enhanced emotion system will be rebuilt later)
+    emotions, primary_emotion = detect_basic_emotions(response_text)
+    
+    memory_metadata = {
+        'avatar_id': avatar_id,
+        'avatar_name': avatar_name,
+        'primary_emotion': primary_emotion,
+        'active_avatars_count': active_avatars_count,
+        'user_id': user_id,
+        'user_display_name': user_display_name
+    }
+    history_metadata = {
+        'user_display_name': user_display_name,
+        'avatar_name': avatar_name,
+        'primary_emotion': primary_emotion,
+        'active_avatars_count': active_avatars_count
+    }
+    
+    # Queue memory and history storage on the handler's write-behind queue so the
+    # reply is not held up by bookkeeping (only for authenticated users)
+    if user_id is not None and user_id != '' and hasattr(llm_handler, 'store_chat_exchange'):
+        try:
+            llm_handler.store_chat_exchange(user_message, response_text, avatar_id, user_id,
+                                            memory_metadata, history_metadata)
+            logging.info(f"Queued conversation storage for user {user_id}")
+        except Exception as e:
+            logging.warning(f"Failed to queue conversation storage: {e}")
+    else:
+        store_chat_exchange_inline(llm_handler, user_id, avatar_id, user_message, response_text,
+                                   memory_metadata, history_metadata)
+    
+    # Log chat interaction
+    logging.info(f"Chat - User: {user_display_name} ({user_id}), "
+                f"Avatar: {avatar_name} ({avatar_id}), "
+                f"Active: {active_avatars_count}, "
+                f"Emotion: {primary_emotion}, "
+                f"Message: {user_message[:50]}...")
+    
+    return {
+        'reply': response_text,
+        'emotions': emotions,
+        'primary_emotion': primary_emotion,
+        'avatar_id': avatar_id,
+        'avatar_name': avatar_name,
+        'timestamp': datetime.now().isoformat(),
+        'active_avatars_count': active_avatars_count
+    }
+
+
 def get_avatar_database_info(avatar_id):
     """Get avatar information from database"""
     try:
@@ -207,38 +329,34 @@ def build_avatar_prompt(user_message, context):
 
 def detect_basic_emotions(text):
     """Basic emotion detection - will be enhanced when emotion system is rebuilt"""
-    text_lower = text.lower()
-    
-    # Simple keyword-based emotion detection
-    emotion_keywords = {
-        'happy': ['happy', 'joy', 'excited', 'great', 'wonderful', 'fantastic', 'excellent', '!'],
-        'sad': ['sad', 'sorry', 'unfortunate', 'disappointed', 'regret'],
-        'angry': ['angry', 'frustrated', 'annoyed', 'upset'],
-        'surprised': ['wow', 'amazing', 'incredible', 'unexpected', 'surprise'],
-        'confused': ['confused', 'puzzled', 'unclear', 'not sure', "don't understand"],
-        'neutral': ['okay', 'alright', 'understood', 'yes', 'no']
-    }
-    
-    detected_emotions = []
-    emotion_scores = {}
-    
-    for emotion, keywords in emotion_keywords.items():
-        score = sum(1 for keyword in keywords if keyword in text_lower)
-        if score > 0:
-            emotion_scores[emotion] = score
-            detected_emotions.append(emotion)
-    
-    # Determine primary emotion
-    if emotion_scores:
-        primary_emotion = max(emotion_scores, key=emotion_scores.get)
-    else:
-        primary_emotion = 'neutral'
-    
-    # Default to neutral if no emotions detected
-    if not detected_emotions:
-        detected_emotions = ['neutral']
-    
-    return detected_emotions, primary_emotion
+    # Keyword-based emotion detection from the shared one-pass analyzer
+    features = get_text_analyzer().analyze(text)
+    return list(features.detected_emotions) or ['neutral'], features.primary_emotion
+
+
+def store_chat_exchange_inline(llm_handler, user_id, avatar_id, user_message, response_text,
+                               memory_metadata, history_metadata):
+    """Store an exchange synchronously (handlers without a write-behind queue)"""
+    # Store conversation in memory system if available and user is authenticated
+    try:
+        if (hasattr(llm_handler, 'memory_system') and llm_handler.memory_system and 
+            user_id is not None and user_id != ''):
+            llm_handler.memory_system.store_conversation(user_message, response_text, metadata=memory_metadata)
+            logging.info(f"Stored conversation in memory for user {user_id}")
+        else:
+            logging.info("Skipping memory storage - no authenticated user or memory system unavailable")
+    except Exception as e:
+        logging.warning(f"Failed to store conversation in memory: {e}")
+
+    # Store in conversation history database (only if user is authenticated)
+    try:
+        if user_id is not None and user_id != '':
+            store_conversation_message(user_id, avatar_id, user_message, response_text, history_metadata)
+            logging.info(f"Stored conversation in database for user {user_id}")
+        else:
+            logging.info("Skipping database storage - no authenticated user")
+    except Exception as e:
+        logging.warning(f"Failed to store conversation in database: {e}")
 
 
 def store_conversation_message(user_id, avatar_id, user_message, ai_response, metadata):
@@ -446,7 +564,8 @@ Remember: You are {character_name}, not any other character."""
         response = llm_handler.generate_response(
             prompt,
             user_id=data.get('user_id', "autonomous_user"),
-            model_id=avatar_id  # Use avatar_id for isolation
+            model_id=avatar_id,  # Use avatar_id for isolation
+            priority=RequestPriority.GREETING if message_type == 'greeting' else RequestPriority.AUTONOMOUS
         )
         
         if response and response.strip():
@@ -524,7 +643,8 @@ Remember: You are {proper_character_name}, not any other character."""
         response = llm_handler.generate_response(
             prompt,
             user_id=str(user_id) if user_id else "autonomous_user",
-            model_id=avatar_id  # Use avatar_id as model_id for isolation
+            model_id=avatar_id,  # Use avatar_id as model_id for isolation
+            priority=RequestPriority.GREETING if message_type == 'greeting' else RequestPriority.AUTONOMOUS
         )
         
         if response and response.strip():
@@ -37,6 +37,10 @@ def initialize_rag_system():
             return True
         else:
             logger.info("RAG system disabled in configuration")
+            # Nothing drains the RAG outbox while RAG is off
+            from databases.database_manager import drop_rag_outbox, get_conversations_connection
+            with get_conversations_connection() as conn:
+                drop_rag_outbox(conn)
             return False
             
     except Exception as e:
@@ -59,6 +63,7 @@ def get_rag_status():
         return jsonify({
             'enabled': True,
             'status': 'active',
+            'indexing': stats.get('indexing', {}),
             'stats': stats
         }), 200
         
@@ -199,8 +204,9 @@ def sync_rag_system():
                 'error': 'RAG system not initialized'
             }), 400
         
-        # Sync existing conversations
-        synced_count = rag_memory_system.sync_rag_system()
+        # Sync new conversations; {"backfill": true} re-reads the whole history
+        data = request.get_json(silent=True) or {}
+        synced_count = rag_memory_system.sync_rag_system(backfill=bool(data.get('backfill', False)))
         
         return jsonify({
             'synced_conversations': synced_count,
@@ -72,8 +72,41 @@ def api_system_status():
         components_status = {}
         
         # Check LLM handler
+        llm_stats = None
         if hasattr(app_globals, 'llm_handler') and app_globals.llm_handler:
             components_status['llm'] = 'loaded'
+            llm_stats = {}
+            scheduler = getattr(app_globals.llm_handler, 'scheduler', None)
+            if scheduler:
+                llm_stats['scheduler'] = scheduler.get_stats()
+            response_cache = getattr(app_globals.llm_handler, 'response_cache', None)
+            if response_cache:
+                llm_stats['response_cache'] = response_cache.get_stats()
+            prefix_cache = getattr(app_globals.llm_handler, 'prefix_cache', None)
+            if prefix_cache:
+                llm_stats['prefix_cache'] = prefix_cache.get_stats()
+            state_store = getattr(app_globals.llm_handler, 'state_store', None)
+            if state_store:
+                llm_stats['session_state'] = state_store.get_stats()
+            worker_pool = getattr(app_globals.llm_handler, 'worker_pool', None)
+            if worker_pool:
+                llm_stats['worker_pool'] = worker_pool.get_stats()
+            post_response_queue = getattr(app_globals.llm_handler, 'post_response_queue', None)
+            if post_response_queue:
+                llm_stats['post_response_queue'] = post_response_queue.get_stats()
+            memory_system = getattr(app_globals.llm_handler, 'memory_system', None)
+            if memory_system and memory_system.access_tracker:
+                llm_stats['memory_access_tracking'] = memory_system.access_tracker.get_stats()
+            if memory_system and memory_system.context_cache:
+                llm_stats['memory_cache'] = memory_system.context_cache.get_stats()
+            if memory_system and memory_system.consolidator:
+                llm_stats['memory_consolidation'] = memory_system.consolidator.get_stats()
+            cancellations = getattr(app_globals.llm_handler, 'cancellations', None)
+            if cancellations:
+                llm_stats['cancellations'] = cancellations.get_stats()
+            lifecycle = getattr(app_globals.llm_handler, 'lifecycle', None)
+            if lifecycle:
+                llm_stats['lifecycle'] = lifecycle.get_stats()
         else:
             components_status['llm'] = 'not_loaded'
         
@@ -108,6 +141,7 @@ def api_system_status():
                 "vms_mb": round(memory_info.vms / 1024 / 1024, 2)
             },
             "components": components_status,
+            "llm": llm_stats,
             "models_loaded": models_loaded,
             "system": {
                 "cpu_count": psutil.cpu_count(),
@@ -2,8 +2,10 @@
 socketio_handlers.py
 SocketIO event handlers for the AI Companion backend.
 """
+from flask import request
 from flask_socketio import emit
 from app_globals import socketio, ai_app, app_state, audio_pipeline
+import app_globals
 import time
 import logging
 
@@ -26,8 +28,31 @@ def handle_connect():
 @socketio.on('disconnect')
 def handle_disconnect():
     app_state['connected_clients'] = max(0, app_state['connected_clients'] - 1)
+    # Nobody is left to read this client's reply; free its decode slot
+    cancel_generation(request.sid, "disconnected")
     logger.info(f"Client disconnected. Total clients: {app_state['connected_clients']}")
 
+@socketio.on('cancel_generation')
+def handle_cancel_generation(data=None):
+    cancelled = cancel_generation(request.sid, "client")
+    emit('generation_cancelled', {'cancelled': cancelled, 'timestamp': time.time()})
+
+def cancel_generation(sid, reason):
+    """Cancel the in-flight generation started by a SocketIO client"""
+    llm_handler = app_globals.llm_handler
+    if llm_handler is None or not hasattr(llm_handler, 'cancellations'):
+        return False
+    return llm_handler.cancellations.cancel(sid, reason)
+
+def start_generation(user_input):
+    """Process a message in the background, superseding this client's previous one"""
+    app_state['last_interaction'] = time.time()
+    llm_handler = app_globals.llm_handler
+    cancel_token = None
+    if llm_handler is not None and hasattr(llm_handler, 'cancellations'):
+        cancel_token = llm_handler.cancellations.new_token(request.sid)
+    socketio.start_background_task(ai_app._process_user_input_async, user_input, cancel_token)
+
 @socketio.on('send_message')
 def handle_message(data):
     if app_state['is_initializing']:
@@ -35,8 +60,7 @@ def handle_message(data):
         return
     user_input = data.get('message', '').strip()
     if user_input:
-        app_state['last_interaction'] = time.time()
-        socketio.start_background_task(ai_app._process_user_input_async, user_input)
+        start_generation(user_input)
 
 @socketio.on('chat_message')
 def handle_chat_message(data):
@@ -45,8 +69,7 @@ def handle_chat_message(data):
         return
     user_input = data.get('message', '').strip()
     if user_input:
-        app_state['last_interaction'] = time.time()
-        socketio.start_background_task(ai_app._process_user_input_async, user_input)
+        start_generation(user_input)
 
 @socketio.on('start_audio')
 def handle_start_audio():
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Embedding backend benchmark.
+
+Loads each embedding backend in a fresh interpreter and reports its startup
+time (imports + model load), resident memory after loading and encode
+throughput, then checks that its vectors agree with sentence-transformers
+(cosine similarity of the same texts).
+
+Usage:
+    python scripts/testing/benchmark_embedding_backends.py --export
+    python scripts/testing/benchmark_embedding_backends.py
+    python scripts/testing/benchmark_embedding_backends.py --backends sentence_transformers onnx onnx-int8 --json
+"""
+
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+WORDS = ["what", "do", "you", "remember", "about", "my", "favorite", "book", "trip", "to", "the", "mountains",
+         "last", "summer", "with", "family", "work", "coffee", "music", "cat", "feeling", "happy", "today"]
+
+
+def make_texts(count, seed=0):
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 40))) for _ in range(count)]
+
+
+def rss_mb():
+    """Current resident set size (peak if /proc is unavailable)."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def worker(args):
+    """Run inside a fresh interpreter: load one backend, time it and save its vectors."""
+    baseline_rss = rss_mb()
+    started = time.perf_counter()
+    from models.embedding_backends import load_embedding_model
+    backend = "onnx" if args.worker.startswith("onnx") else args.worker
+    config = {"onnx": {"model_dir": args.onnx_dir, "quantized": args.worker == "onnx-int8",
+                       "threads": args.threads}}
+    model = load_embedding_model(args.model, backend, config)
+    model.encode(["warm-up"], normalize_embeddings=True)
+    startup_s = time.perf_counter() - started
+    loaded_rss = rss_mb()
+
+    texts = make_texts(args.texts)
+    started = time.perf_counter()
+    vectors = model.encode(texts, batch_size=args.batch_size, normalize_embeddings=True)
+    elapsed = time.perf_counter() - started
+
+    import numpy as np
+    np.save(args.output, np.asarray(vectors, dtype=np.float32))
+    print(json.dumps({
+        "startup_s": round(startup_s, 2),
+        "rss_mb": loaded_rss,
+        "rss_delta_mb": round(loaded_rss - baseline_rss, 1),
+        "texts_per_s": round(len(texts) / elapsed, 1),
+        "torch_loaded": "torch" in sys.modules,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare embedding backends: startup, RSS, throughput, agreement")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2", help="sentence-transformers model name")
+    parser.add_argument("--backends", nargs="+", default=["sentence_transformers", "onnx", "onnx-int8"])
+    parser.add_argument("--onnx-dir", default="~/.local/share/ai2d_chat/models/embeddings/all-MiniLM-L6-v2-onnx")
+    parser.add_argument("--export", action="store_true", help="Export (and int8-quantize) the ONNX model first")
+    parser.add_argument("--texts", type=int, default=512, help="Texts encoded for the throughput run")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--threads", type=int, default=None, help="onnxruntime intra-op threads")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--output", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args)
+        return
+
+    if args.export:
+        from models.embedding_backends import export_onnx_model
+        export_onnx_model(args.model, args.onnx_dir, quantize=True)
+
+    import numpy as np
+    results, vectors = {}, {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in args.backends:
+            output = os.path.join(tmp, f"{backend}.npy")
+            command = [sys.executable, __file__, "--worker", backend, "--output", output,
+                       "--model", args.model, "--onnx-dir", args.onnx_dir, "--texts", str(args.texts),
+                       "--batch-size", str(args.batch_size)]
+            if args.threads:
+                command += ["--threads", str(args.threads)]
+            run = subprocess.run(command, capture_output=True, text=True)
+            if run.returncode != 0:
+                results[backend] = {"error": run.stderr.strip().splitlines()[-1] if run.stderr else "failed"}
+                continue
+            results[backend] = json.loads(run.stdout.strip().splitlines()[-1])
+            vectors[backend] = np.load(output)
+
+    reference = vectors.get("sentence_transformers")
+    for backend, backend_vectors in vectors.items():
+        if reference is not None:
+            cosine = (reference * backend_vectors).sum(axis=1)
+            results[backend]["min_cosine_vs_st"] = round(float(cosine.min()), 5)
+            results[backend]["mean_cosine_vs_st"] = round(float(cosine.mean()), 5)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'backend':<24}{'startup s':>10}{'RSS MB':>9}{'texts/s':>10}{'min cos':>9}{'mean cos':>10}")
+    for backend, result in results.items():
+        if "error" in result:
+            print(f"{backend:<24}error: {result['error']}")
+            continue
+        print(f"{backend:<24}{result['startup_s']:>10}{result['rss_mb']:>9}{result['texts_per_s']:>10}"
+              f"{result.get('min_cosine_vs_st', '-'):>9}{result.get('mean_cosine_vs_st', '-'):>10}")
+
+
+if __name__ == "__main__":
+    main()
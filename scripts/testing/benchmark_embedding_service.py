@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Embedding service benchmark.
+
+Simulates concurrent chats embedding one query each: every caller thread
+either calls SentenceTransformer.encode itself (the previous behaviour) or
+goes through the micro-batching EmbeddingService. Reports throughput and
+per-call latency percentiles at each concurrency level.
+
+Usage:
+    python scripts/testing/benchmark_embedding_service.py
+    python scripts/testing/benchmark_embedding_service.py --concurrency 1 4 16 --calls 200
+    python scripts/testing/benchmark_embedding_service.py --max-wait-ms 5 --json
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from models.embedding_service import EmbeddingService
+
+QUERY_WORDS = ["what", "do", "you", "remember", "about", "my", "favorite", "book", "trip", "to", "the",
+               "mountains", "last", "summer", "with", "family", "work", "coffee", "music", "cat"]
+
+
+def make_queries(count, seed=0):
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(QUERY_WORDS) for _ in range(rng.randint(5, 16))) for _ in range(count)]
+
+
+def run(concurrency, calls_per_caller, encode_one):
+    """Each caller embeds its own queries back to back; returns throughput and latency percentiles."""
+    latencies = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(concurrency + 1)
+
+    def caller(index):
+        queries = make_queries(calls_per_caller, seed=index)
+        barrier.wait()
+        local = []
+        for query in queries:
+            started = time.perf_counter()
+            encode_one(query)
+            local.append((time.perf_counter() - started) * 1000)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=caller, args=(index,)) for index in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "texts_per_s": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies), 2),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1], 2),
+        "max_ms": round(latencies[-1], 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-thread encode vs. the micro-batching embedding service")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2", help="SentenceTransformer model name")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16], help="Concurrent callers")
+    parser.add_argument("--calls", type=int, default=100, help="Queries per caller")
+    parser.add_argument("--max-batch", type=int, default=32, help="Service batch size")
+    parser.add_argument("--max-wait-ms", type=float, default=2.0, help="Service collection window")
+    parser.add_argument("--torch-threads", type=int, default=None, help="Worker intra-op threads")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    import torch
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(args.model)
+    model.encode(make_queries(8), normalize_embeddings=True)  # warm-up
+    default_threads = torch.get_num_threads()
+
+    results = {}
+    for concurrency in args.concurrency:
+        # Per-thread encode with torch's default thread count, as before
+        torch.set_num_threads(default_threads)
+        direct = run(concurrency, args.calls,
+                     lambda query: model.encode([query], normalize_embeddings=True, show_progress_bar=False))
+
+        service = EmbeddingService(model, max_batch=args.max_batch, max_wait_ms=args.max_wait_ms,
+                                   torch_threads=args.torch_threads)
+        service.start()
+        batched = run(concurrency, args.calls, lambda query: service.encode([query]))
+        stats = service.get_stats()
+        service.stop()
+        results[concurrency] = {
+            "direct": dict(direct, torch_threads=default_threads),
+            "service": dict(batched, torch_threads=stats["torch_threads"], avg_batch_texts=stats["avg_batch_texts"]),
+        }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'callers':>8}{'variant':>10}{'texts/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'max ms':>9}{'batch':>7}{'threads':>9}")
+    for concurrency, variants in results.items():
+        for name, result in variants.items():
+            batch = result.get("avg_batch_texts", 1)
+            print(f"{concurrency:>8}{name:>10}{result['texts_per_s']:>10}{result['p50_ms']:>9}"
+                  f"{result['p95_ms']:>9}{result['max_ms']:>9}{batch:>7}{result['torch_threads']:>9}")
+
+
+if __name__ == "__main__":
+    main()
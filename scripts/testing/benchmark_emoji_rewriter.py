@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Emoji rewriter micro-benchmark.
+
+Compares the previous per-tag ``re.sub`` loop and character-by-character emoji
+limiter with the single-pass compiled rewriter (whole text and token stream)
+on companion-style replies, and checks that all variants produce the same text.
+
+Usage:
+    python scripts/testing/benchmark_emoji_rewriter.py
+    python scripts/testing/benchmark_emoji_rewriter.py --iterations 20000 --json
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from models.emoji_rewriter import EMOJI_PATTERN, EMOTE_EMOJIS, PHRASE_EMOJIS, get_emoji_rewriter, limit_emojis
+
+RESPONSES = [
+    "*smile* Oh wow, Sam, you finished your first 30 km run?! *excited* That's amazing! "
+    "How are your legs feeling? *thumbs up*",
+    "*giggles* Biscuit sounds like such a little troublemaker! *cat* Did she really sit on "
+    "The Hobbit again? *laughs* What page were you on?",
+    "I'm so sorry you're feeling stressed about work *hug* Do you want to talk about what's "
+    "going on? I'm here for you *heart*",
+    "Sourdough night! *party* *celebrate* I love the smell of fresh bread *sparkles* "
+    "What are you planning to put on the first slice? *curious*",
+    "Hmm, that's a tricky one *thinking* Maybe we could look at it from a different angle? "
+    "No emotes here, just a plain reply with a few words in it.",
+]
+
+AVATAR_MESSAGES = [
+    "😊 Hey there! 🎉🎉 I just learned something new about the stars tonight 🤩✨🌸 and I can't wait "
+    "to share it with everyone, especially you, because you always ask the best questions about "
+    "space 💕👍😄 Did you know some stars we see have already burned out? 🌟 It's a little sad but "
+    "also beautiful 😢✨",
+    "That's such a lovely idea 😊 I've been wanting to try painting outdoors for a while now, and "
+    "doing it together sounds perfect. Should we bring snacks too? 🤗",
+]
+
+
+# The implementation the compiled rewriter replaces
+LEGACY_EMOTES = {rf'\*{re.escape(tag)}\*': emoji for tag, emoji in EMOTE_EMOJIS.items()}
+LEGACY_PHRASES = {rf'\b{re.escape(phrase)}\b': emoji for phrase, emoji in PHRASE_EMOJIS.items()}
+
+
+def legacy_rewrite(text):
+    for pattern, emoji in LEGACY_EMOTES.items():
+        text = re.sub(pattern, emoji, text, flags=re.IGNORECASE)
+    for pattern, emoji in LEGACY_PHRASES.items():
+        text = re.sub(pattern, emoji, text, flags=re.IGNORECASE)
+    return text
+
+
+def legacy_limit_emojis(text, max_emojis):
+    if len(EMOJI_PATTERN.findall(text)) <= max_emojis:
+        return text
+    emoji_count = 0
+    result = ""
+    for char in text:
+        if EMOJI_PATTERN.match(char):
+            if emoji_count < max_emojis:
+                result += char
+                emoji_count += 1
+        else:
+            result += char
+    return result.strip()
+
+
+def tokenize(text, size=4):
+    """Rough stand-in for LLM tokens: fixed-size chunks."""
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def stream_rewrite(rewriter, tokens):
+    stream = rewriter.stream()
+    return "".join(stream.feed(token) for token in tokens) + stream.flush()
+
+
+def time_per_call(fn, inputs, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for item in inputs:
+            fn(item)
+    elapsed = time.perf_counter() - start
+    return round(elapsed / (iterations * len(inputs)) * 1e6, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark emoji rewriting")
+    parser.add_argument("--iterations", type=int, default=5000, help="Passes over the sample texts")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    rewriter = get_emoji_rewriter()
+    tokenized = [tokenize(text) for text in RESPONSES]
+
+    for text, tokens in zip(RESPONSES, tokenized):
+        expected = legacy_rewrite(text)
+        assert rewriter.rewrite(text) == expected, f"rewrite mismatch: {text!r}"
+        assert stream_rewrite(rewriter, tokens) == expected, f"stream mismatch: {text!r}"
+    for text in AVATAR_MESSAGES:
+        assert limit_emojis(text, 4) == legacy_limit_emojis(text, 4), f"limit mismatch: {text!r}"
+
+    results = {
+        "rewrite_legacy_us": time_per_call(legacy_rewrite, RESPONSES, args.iterations),
+        "rewrite_compiled_us": time_per_call(rewriter.rewrite, RESPONSES, args.iterations),
+        "rewrite_stream_us": time_per_call(lambda tokens: stream_rewrite(rewriter, tokens),
+                                           tokenized, args.iterations),
+        "limit_legacy_us": time_per_call(lambda text: legacy_limit_emojis(text, 4),
+                                         AVATAR_MESSAGES, args.iterations),
+        "limit_single_pass_us": time_per_call(lambda text: limit_emojis(text, 4),
+                                              AVATAR_MESSAGES, args.iterations),
+    }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'variant':<24}{'us/call':>10}")
+    for name, value in results.items():
+        print(f"{name[:-3]:<24}{value:>10}")
+    print(f"\nrewrite speedup: {results['rewrite_legacy_us'] / results['rewrite_compiled_us']:.1f}x, "
+          f"limit speedup: {results['limit_legacy_us'] / results['limit_single_pass_us']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+LLM decoding benchmark harness.
+
+Loads a GGUF model with the optimization flags SystemDetector picks for this
+machine, then measures generation throughput for a set of variants on
+companion-style prompts (replies that echo the user's words, the character
+name and memory context).
+
+With --kv-presets the variants are the KV cache presets instead, and the report
+adds load time, resident memory, the estimated KV cache size and prompt
+throughput so the right preset can be picked per box.
+
+Usage:
+    python scripts/testing/benchmark_llm.py --model ~/.local/share/ai2d_chat/models/llm/model.gguf
+    python scripts/testing/benchmark_llm.py --model model.gguf --variants baseline lookup-2 lookup-10
+    python scripts/testing/benchmark_llm.py --model model.gguf --kv-presets --n-ctx 4096
+    python scripts/testing/benchmark_llm.py --model model.gguf --kv-presets f16 q8_0
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from utils.system_detector import KV_CACHE_PRESETS, SystemDetector, estimate_kv_cache_mb, kv_cache_llama_kwargs
+
+PROMPTS = [
+    "You are Haru, a warm and emotionally expressive AI companion.\n"
+    "What you know about the user: The user's name is Sam. Sam loves hiking in the Alps "
+    "and is training for a marathon in October.\n\n"
+    "Human: Haru, I finally finished my first 30 km training run for the marathon in October!\nYou:",
+    "You are Haru, a warm and emotionally expressive AI companion.\n"
+    "What you know about the user: Sam's favorite book is The Hobbit and Sam's cat is called Biscuit.\n\n"
+    "Human: Can you remind me what my cat Biscuit did last week when I was reading The Hobbit?\nYou:",
+    "You are Haru, a warm and emotionally expressive AI companion.\n"
+    "Recent conversation:\nHuman: I'm learning to bake sourdough bread.\n"
+    "You: Sourdough bread is such a fun project! How is your starter doing?\n\n"
+    "Human: My sourdough starter is bubbly now, so I'm baking my first sourdough loaf tonight.\nYou:",
+]
+
+
+def build_variants():
+    """Benchmark variants: name -> extra Llama constructor arguments."""
+    variants = {"baseline": {}}
+    try:
+        from llama_cpp.llama_speculative import LlamaPromptLookupDecoding
+        for num_pred_tokens in (2, 4, 10):
+            variants[f"lookup-{num_pred_tokens}"] = {
+                "draft_model": LlamaPromptLookupDecoding(num_pred_tokens=num_pred_tokens)
+            }
+    except ImportError:
+        print("llama-cpp-python has no prompt lookup decoding; only the baseline will run")
+    return variants
+
+
+def build_kv_variants(names):
+    """KV cache preset variants: name -> extra Llama constructor arguments."""
+    return {name: kv_cache_llama_kwargs(KV_CACHE_PRESETS[name]) for name in names or KV_CACHE_PRESETS}
+
+
+def resident_mb():
+    """Resident memory of this process in MB (None without psutil)."""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    except ImportError:
+        return None
+
+
+def kv_cache_estimate(model, n_ctx, kv_preset):
+    """Estimate the KV cache size from the GGUF metadata for a preset."""
+    metadata = getattr(model, "metadata", None) or {}
+    arch = metadata.get("general.architecture", "llama")
+    try:
+        n_layer = int(metadata[f"{arch}.block_count"])
+        n_embd = int(metadata[f"{arch}.embedding_length"])
+        n_head = int(metadata[f"{arch}.attention.head_count"])
+        n_head_kv = int(metadata.get(f"{arch}.attention.head_count_kv", n_head))
+    except (KeyError, ValueError):
+        return None
+    return estimate_kv_cache_mb(n_ctx, n_layer, n_embd // n_head * n_head_kv,
+                                kv_preset["type_k"], kv_preset["type_v"])
+
+
+def run_variant(model_path, base_kwargs, extra_kwargs, runs, max_tokens, kv_preset=None):
+    """Load the model for one variant and time greedy generations over the prompts."""
+    from llama_cpp import Llama
+
+    rss_before = resident_mb()
+    load_start = time.perf_counter()
+    model = Llama(model_path=model_path, verbose=False, **base_kwargs, **extra_kwargs)
+    load_time = time.perf_counter() - load_start
+    # Warm-up so page faults and first-eval overhead don't skew the first variant
+    model("Hello", max_tokens=4, temperature=0.0)
+    rss_after = resident_mb()
+
+    total_tokens = 0
+    total_time = 0.0
+    prompt_tokens = 0
+    prompt_time = 0.0
+    for _ in range(runs):
+        for prompt in PROMPTS:
+            # Prompt processing alone (one sampled token)
+            model.reset()
+            start = time.perf_counter()
+            result = model(prompt, max_tokens=1, temperature=0.0)
+            prompt_time += time.perf_counter() - start
+            prompt_tokens += result["usage"]["prompt_tokens"]
+
+            model.reset()
+            start = time.perf_counter()
+            result = model(prompt, max_tokens=max_tokens, temperature=0.0,
+                           stop=["Human:", "\n\n"])
+            total_time += time.perf_counter() - start
+            total_tokens += result["usage"]["completion_tokens"]
+
+    report = {
+        "completion_tokens": total_tokens,
+        "seconds": round(total_time, 3),
+        "tokens_per_second": round(total_tokens / total_time, 2) if total_time else 0.0,
+        "prompt_tokens_per_second": round(prompt_tokens / prompt_time, 2) if prompt_time else 0.0,
+        "load_seconds": round(load_time, 2),
+        "rss_mb": round(rss_after - rss_before, 1) if rss_before is not None else None,
+    }
+    if kv_preset is not None:
+        report["kv_cache_mb"] = kv_cache_estimate(model, base_kwargs["n_ctx"], kv_preset)
+    del model
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark local LLM decoding variants")
+    parser.add_argument("--model", required=True, help="Path to a GGUF model")
+    parser.add_argument("--variants", nargs="*", help="Variants to run (default: all)")
+    parser.add_argument("--kv-presets", nargs="*", metavar="PRESET",
+                        help=f"Compare KV cache presets instead ({', '.join(KV_CACHE_PRESETS)}; default: all)")
+    parser.add_argument("--runs", type=int, default=3, help="Passes over the prompt set per variant")
+    parser.add_argument("--max-tokens", type=int, default=128)
+    parser.add_argument("--n-ctx", type=int, default=2048)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    detector = SystemDetector()
+    flags = detector.get_optimization_flags()
+    base_kwargs = {
+        "n_ctx": args.n_ctx,
+        "n_threads": flags["n_threads"],
+        "n_gpu_layers": flags.get("n_gpu_layers", 0),
+        "use_mmap": flags.get("use_mmap", True),
+    }
+
+    kv_mode = args.kv_presets is not None
+    if kv_mode:
+        unknown = [name for name in args.kv_presets if name not in KV_CACHE_PRESETS]
+        if unknown:
+            parser.error(f"Unknown KV cache preset(s): {', '.join(unknown)}")
+        variants = build_kv_variants(args.kv_presets)
+    else:
+        variants = build_variants()
+    selected = args.variants or list(variants)
+    print(f"Tier: {detector.capabilities['performance_tier']}, flags: {base_kwargs}")
+    print(f"Tier speculative decoding preset: {flags.get('speculative_decoding')}")
+    print(f"Tier KV cache preset: {flags.get('kv_cache', {}).get('preset')}")
+
+    results = {}
+    for name in selected:
+        if name not in variants:
+            print(f"Unknown variant: {name} (available: {', '.join(variants)})")
+            continue
+        print(f"Running {name}...")
+        results[name] = run_variant(args.model, base_kwargs, variants[name], args.runs, args.max_tokens,
+                                    kv_preset=KV_CACHE_PRESETS[name] if kv_mode else None)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    baseline_name = "f16" if kv_mode else "baseline"
+    baseline = results.get(baseline_name, {}).get("tokens_per_second")
+    header = f"\n{'variant':<14}{'tokens':>8}{'seconds':>10}{'tok/s':>10}{'speedup':>10}"
+    if kv_mode:
+        header += f"{'prompt tok/s':>14}{'load s':>8}{'rss MB':>9}{'kv MB':>8}"
+    print(header)
+    for name, result in results.items():
+        speedup = f"{result['tokens_per_second'] / baseline:.2f}x" if baseline else "-"
+        line = (f"{name:<14}{result['completion_tokens']:>8}{result['seconds']:>10}"
+                f"{result['tokens_per_second']:>10}{speedup:>10}")
+        if kv_mode:
+            line += (f"{result['prompt_tokens_per_second']:>14}{result['load_seconds']:>8}"
+                     f"{str(result['rss_mb']):>9}{str(result['kv_cache_mb']):>8}")
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Memory search benchmark.
+
+Builds a throwaway conversations database with synthetic memories, indexes it
+the way an existing install is migrated (rows first, then the FTS5 table), and
+compares the LIKE keyword scan with the FTS5 search MemorySystem uses.
+
+Usage:
+    python scripts/testing/benchmark_memory_search.py
+    python scripts/testing/benchmark_memory_search.py --sizes 10000 100000 1000000 --users 10
+    python scripts/testing/benchmark_memory_search.py --sizes 100000 --queries 500 --json
+"""
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from databases.database_manager import ensure_memory_fts
+from models.memory_system import MemorySystem
+
+MEMORY_TYPES = ["fact", "preference", "interest", "emotional_state", "experience"]
+TEMPLATES = [
+    "User's {0} is called {1}",
+    "User loves {0} and {1} on weekends",
+    "User mentioned feeling {0} about the {1}",
+    "User is learning {0} with a friend from {1}",
+    "User prefers {0} over {1}",
+    "User went to {0} last week and talked about {1} a lot",
+]
+QUERY_FILLER = ["what", "do", "you", "remember", "about", "my", "the", "and", "tell", "me"]
+
+
+def build_vocabulary(size, seed):
+    """Pronounceable synthetic words with Zipf-like frequencies."""
+    rng = random.Random(seed)
+    consonants, vowels = "bcdfghklmnprstvz", "aeiou"
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(consonants) + rng.choice(vowels) for _ in range(rng.randint(2, 4))))
+    words = sorted(words)
+    cum_weights, total = [], 0.0
+    for rank in range(len(words)):
+        total += 1.0 / (rank + 1)
+        cum_weights.append(total)
+    return words, cum_weights
+
+
+def create_database(path, rows, users, vocabulary, seed):
+    """Create the memories table and fill it, then build the FTS index (the migration path)."""
+    words, cum_weights = vocabulary
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE memories (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT NOT NULL,
+            model_id TEXT NOT NULL DEFAULT 'default',
+            memory_type TEXT NOT NULL,
+            key_topic TEXT NOT NULL,
+            value_content TEXT NOT NULL,
+            importance_score REAL DEFAULT 0.5,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            last_accessed DATETIME DEFAULT CURRENT_TIMESTAMP,
+            access_count INTEGER DEFAULT 0
+        )
+    """)
+    conn.execute("CREATE INDEX idx_mem_user_model ON memories(user_id, model_id)")
+
+    start = time.perf_counter()
+    batch = []
+    for index in range(rows):
+        topic, other = rng.choices(words, cum_weights=cum_weights, k=2)
+        batch.append((
+            f"user{index % users}", "haru", rng.choice(MEMORY_TYPES), topic,
+            rng.choice(TEMPLATES).format(topic, other),
+            round(rng.uniform(0.1, 1.0), 2),
+            f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} 12:00:00",
+        ))
+        if len(batch) >= 50000:
+            conn.executemany("""
+                INSERT INTO memories (user_id, model_id, memory_type, key_topic, value_content,
+                                      importance_score, last_accessed)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, batch)
+            batch = []
+    if batch:
+        conn.executemany("""
+            INSERT INTO memories (user_id, model_id, memory_type, key_topic, value_content,
+                                  importance_score, last_accessed)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, batch)
+    conn.commit()
+    insert_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    ensure_memory_fts(conn)
+    conn.commit()
+    index_seconds = time.perf_counter() - start
+    return conn, insert_seconds, index_seconds
+
+
+def time_queries(search, queries):
+    """Run every query and return per-query latencies in ms and the average result count."""
+    latencies, results = [], 0
+    for user_id, keywords in queries:
+        start = time.perf_counter()
+        rows = search(user_id, keywords)
+        latencies.append((time.perf_counter() - start) * 1000)
+        results += len(rows)
+    latencies.sort()
+    return {
+        "p50_ms": round(statistics.median(latencies), 3),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1], 3),
+        "avg_results": round(results / len(queries), 1),
+    }
+
+
+def run_size(rows, args, vocabulary):
+    memory_system = MemorySystem(db_manager=None)
+    words, cum_weights = vocabulary
+    rng = random.Random(args.seed + rows)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "conversations.db")
+        conn, insert_seconds, index_seconds = create_database(path, rows, args.users, vocabulary, args.seed)
+        cursor = conn.cursor()
+
+        queries = []
+        for _ in range(args.queries):
+            terms = rng.choices(words, cum_weights=cum_weights, k=rng.randint(1, 3))
+            text = " ".join(rng.sample(QUERY_FILLER, 3) + terms)
+            queries.append((f"user{rng.randrange(args.users)}", memory_system._extract_keywords(text)))
+
+        like = time_queries(
+            lambda user_id, keywords: memory_system._search_memories_like(cursor, user_id, "haru", keywords, 15),
+            queries)
+        fts = time_queries(
+            lambda user_id, keywords: memory_system._search_memories_fts(cursor, user_id, "haru", keywords, 15),
+            queries)
+        conn.close()
+        size_mb = os.path.getsize(path) / (1024 * 1024)
+
+    return {
+        "rows": rows,
+        "rows_per_user": rows // args.users,
+        "insert_s": round(insert_seconds, 2),
+        "fts_migration_s": round(index_seconds, 2),
+        "db_mb": round(size_mb, 1),
+        "like": like,
+        "fts": fts,
+        "speedup_p50": round(like["p50_ms"] / fts["p50_ms"], 1) if fts["p50_ms"] else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark LIKE vs FTS5 memory search")
+    parser.add_argument("--sizes", type=int, nargs="*", default=[10000, 100000, 1000000],
+                        help="Total memory rows per run")
+    parser.add_argument("--users", type=int, default=10, help="Users the rows are spread over")
+    parser.add_argument("--queries", type=int, default=200, help="Queries timed per size")
+    parser.add_argument("--vocabulary", type=int, default=20000, help="Distinct words in memories")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    vocabulary = build_vocabulary(args.vocabulary, args.seed)
+    results = []
+    for rows in args.sizes:
+        print(f"Building {rows} memories...", file=sys.stderr)
+        results.append(run_size(rows, args, vocabulary))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"\n{'rows':>9}{'per user':>10}{'migrate s':>11}{'db MB':>8}"
+          f"{'LIKE p50':>10}{'LIKE p95':>10}{'FTS p50':>9}{'FTS p95':>9}{'speedup':>9}")
+    for result in results:
+        print(f"{result['rows']:>9}{result['rows_per_user']:>10}{result['fts_migration_s']:>11}{result['db_mb']:>8}"
+              f"{result['like']['p50_ms']:>10}{result['like']['p95_ms']:>10}"
+              f"{result['fts']['p50_ms']:>9}{result['fts']['p95_ms']:>9}{str(result['speedup_p50']) + 'x':>9}")
+
+
+if __name__ == "__main__":
+    main()
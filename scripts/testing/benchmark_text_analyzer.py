@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Text analyzer micro-benchmark.
+
+Compares the previous per-consumer scans of a user message (memory extraction,
+bonding XP, personality analysis, importance scoring, basic emotion detection
+and memory-search keywords, each lower-casing and searching the text on its
+own) with consumers reading one shared TextAnalyzer analysis, and checks that
+both give the same results.
+
+Usage:
+    python scripts/testing/benchmark_text_analyzer.py
+    python scripts/testing/benchmark_text_analyzer.py --iterations 5000 --json
+"""
+
+import argparse
+import gc
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from models.text_analyzer import TextAnalyzer
+
+MESSAGES = [
+    "Hi! My name is Sam and I love hiking in the mountains with my family.",
+    "I'm feeling stressed about work today... maybe we can talk about something fun?",
+    "What do you think about my favorite book, The Hobbit? I study literature at uni.",
+    "I live in Lisbon and I work as a nurse. I hate waking up early but I enjoy coffee!",
+    "Tell me about yourself! How are you doing? You're so sweet and cute, thank you!!",
+    "ok",
+    "I'm into board games and silly jokes, it's just small talk, whatever haha",
+    "WOW that is AMAZING news, I am excited and happy, this is wonderful!",
+]
+
+
+# The implementations the shared analyzer replaces
+def legacy_extract(user_input):
+    memories = []
+    user_lower = user_input.lower()
+    for pattern in [r"(?:my name is|i'm|i am|call me)\s+([a-zA-Z]+)", r"name.{0,10}([a-zA-Z]+)"]:
+        match = re.search(pattern, user_lower)
+        if match:
+            memories.append(('fact', 'user_name', f"User's name is {match.group(1).capitalize()}", 'high'))
+    for pattern, memory_type, importance in [
+        (r"i (?:love|like|enjoy|prefer)\s+([^.,!?]+)", 'preference', 'medium'),
+        (r"i (?:hate|dislike|don't like)\s+([^.,!?]+)", 'preference', 'medium'),
+        (r"my favorite\s+([^.,!?]+)", 'preference', 'high'),
+        (r"i'm (?:into|interested in)\s+([^.,!?]+)", 'interest', 'medium'),
+        (r"i work (?:as|at|in)\s+([^.,!?]+)", 'fact', 'high'),
+        (r"i study\s+([^.,!?]+)", 'fact', 'medium'),
+        (r"i live in\s+([^.,!?]+)", 'fact', 'medium'),
+    ]:
+        for match in re.finditer(pattern, user_lower):
+            content = match.group(1).strip()
+            if len(content) > 2:
+                memories.append((memory_type, content.split()[0], f"User {memory_type}: {content}", importance))
+    for pattern in [
+        r"i (?:feel|am feeling|am)\s+(happy|sad|excited|worried|tired|stressed|angry|frustrated|lonely|anxious|depressed)",
+        r"i'm\s+(happy|sad|excited|worried|tired|stressed|angry|frustrated|lonely|anxious|depressed)",
+    ]:
+        for match in re.finditer(pattern, user_lower):
+            memories.append(('emotional_state', 'current_mood', f"User felt {match.group(1)}", 'medium'))
+    return memories
+
+
+def legacy_bonding_xp(user_input):
+    base_xp = 5
+    user_lower = user_input.lower()
+    if any(i in user_lower for i in ['i feel', 'i think', 'i love', 'i hate', 'my favorite', "i'm worried", "i'm excited"]):
+        base_xp += 3
+    if '?' in user_input:
+        base_xp += 2
+    if any(w in user_lower for w in ['happy', 'sad', 'excited', 'worried', 'love', 'hate', 'feel']):
+        base_xp += 2
+    if len(user_input.split()) > 10:
+        base_xp += 1
+    return base_xp
+
+
+POSITIVE = ["thank", "love", "great", "awesome", "wonderful", "amazing", "help", "care", "kind", "sweet",
+            "cute", "beautiful", "perfect"]
+NEGATIVE = ["hate", "stupid", "annoying", "bad", "terrible", "awful", "shut up", "go away", "leave", "stop",
+            "angry", "mad"]
+PLAYFUL = ["play", "game", "fun", "laugh", "joke", "silly", "tease", "dance", "sing", "story", "adventure",
+           "explore"]
+
+
+def legacy_personality(user_input):
+    input_lower = user_input.lower()
+    caps_ratio = sum(1 for c in user_input if c.isupper()) / max(len(user_input), 1)
+    bonding = sum(1 for pattern in [
+        r'\b(your|you)\s+(name|like|think|feel|want)', r'\b(tell|about)\s+(yourself|you)',
+        r'\b(how|what)\s+(are|do)\s+you', r'\b(i|me)\s+(love|like|care|trust)'
+    ] if re.search(pattern, input_lower))
+    return {
+        'positivity': min(sum(1 for w in POSITIVE if w in input_lower) * 0.2, 1.0),
+        'negativity': min(sum(1 for w in NEGATIVE if w in input_lower) * 0.3, 1.0),
+        'playfulness': min(sum(1 for w in PLAYFUL if w in input_lower) * 0.25, 1.0),
+        'emotional_intensity': min((user_input.count('!') * 0.2) + (caps_ratio * 0.5), 1.0),
+        'bonding_signal': min(bonding * 0.3, 1.0),
+    }
+
+
+def legacy_importance(content, base_score=0.5):
+    content_lower = content.lower()
+    for word in ['love', 'hate', 'important', 'secret', 'personal', 'family', 'work', 'passion', 'dream', 'goal']:
+        if word in content_lower:
+            base_score = min(1.0, base_score + 0.1)
+    for word in ['maybe', 'perhaps', 'casual', 'random', 'whatever', 'small talk']:
+        if word in content_lower:
+            base_score = max(0.1, base_score - 0.1)
+    if len(content) > 100:
+        base_score = min(1.0, base_score + 0.05)
+    return base_score
+
+
+def legacy_emotions(text):
+    text_lower = text.lower()
+    emotion_keywords = {
+        'happy': ['happy', 'joy', 'excited', 'great', 'wonderful', 'fantastic', 'excellent', '!'],
+        'sad': ['sad', 'sorry', 'unfortunate', 'disappointed', 'regret'],
+        'angry': ['angry', 'frustrated', 'annoyed', 'upset'],
+        'surprised': ['wow', 'amazing', 'incredible', 'unexpected', 'surprise'],
+        'confused': ['confused', 'puzzled', 'unclear', 'not sure', "don't understand"],
+        'neutral': ['okay', 'alright', 'understood', 'yes', 'no'],
+    }
+    scores = {}
+    for emotion, keywords in emotion_keywords.items():
+        score = sum(1 for keyword in keywords if keyword in text_lower)
+        if score > 0:
+            scores[emotion] = score
+    return list(scores) or ['neutral'], max(scores, key=scores.get) if scores else 'neutral'
+
+
+def legacy_keywords(text):
+    return re.findall(r'\b\w+\b', text.lower())
+
+
+def legacy_turn(message):
+    return (legacy_extract(message), legacy_bonding_xp(message), legacy_personality(message),
+            legacy_importance(message), legacy_emotions(message), legacy_keywords(message))
+
+
+def shared_turn(analyzer, message):
+    """Each consumer asks the analyzer for the message, as the app's call sites do."""
+    features = analyzer.analyze(message)  # Memory extraction
+    memories = [('fact', 'user_name', f"User's name is {name}", 'high') for name in features.names]
+    memories += [(memory_type, content.split()[0], f"User {memory_type}: {content}", importance)
+                 for memory_type, content, importance in features.preferences if len(content) > 2]
+    memories += [('emotional_state', 'current_mood', f"User felt {emotion}", 'medium')
+                 for emotion in features.emotions]
+
+    features = analyzer.analyze(message)  # Bonding XP
+    xp = 5 + 3 * bool(features.count('personal_sharing')) + 2 * features.is_question \
+        + 2 * bool(features.count('emotional_words')) + (features.word_count > 10)
+
+    features = analyzer.analyze(message)  # Personality
+    personality = {
+        'positivity': min(features.count('positive') * 0.2, 1.0),
+        'negativity': min(features.count('negative') * 0.3, 1.0),
+        'playfulness': min(features.count('playful') * 0.25, 1.0),
+        'emotional_intensity': min((features.exclamations * 0.2) + (features.caps_ratio * 0.5), 1.0),
+        'bonding_signal': min(features.bonding_matches * 0.3, 1.0),
+    }
+
+    features = analyzer.analyze(message)  # Importance
+    importance = max(0.1, min(1.0, 0.5 + 0.1 * features.count('importance_high'))
+                     - 0.1 * features.count('importance_low'))
+    if len(message) > 100:
+        importance = min(1.0, importance + 0.05)
+
+    features = analyzer.analyze(message)  # Emotions
+    emotions = (list(features.detected_emotions) or ['neutral'], features.primary_emotion)
+
+    keywords = list(analyzer.analyze(message).tokens)  # Memory search keywords
+    return memories, xp, personality, importance, emotions, keywords
+
+
+def time_per_call(fn, inputs, repeats=5):
+    """Best of ``repeats`` runs over ``inputs``, in microseconds per call."""
+    best = None
+    gc.disable()
+    try:
+        for _ in range(repeats):
+            start = time.perf_counter()
+            for item in inputs:
+                fn(item)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+    finally:
+        gc.enable()
+    return round(best / len(inputs) * 1e6, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-consumer scans vs. the shared text analyzer")
+    parser.add_argument("--iterations", type=int, default=2000, help="Passes over the sample messages")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    for message in MESSAGES:
+        legacy = legacy_turn(message)
+        shared = shared_turn(TextAnalyzer(), message)
+        assert legacy[:3] == shared[:3] and legacy[4:] == shared[4:], f"mismatch: {message!r}"
+        assert abs(legacy[3] - shared[3]) < 1e-9, f"importance mismatch: {message!r}"
+
+    # Every turn is a new message, so the first consumer always misses the LRU
+    turns = [f"{message} {index}" for index in range(args.iterations) for message in MESSAGES]
+    analyzer = TextAnalyzer()
+    results = {
+        "legacy_turn_us": time_per_call(legacy_turn, turns),
+        "shared_turn_us": time_per_call(lambda message: shared_turn(analyzer, message), turns),
+        "analyze_us": time_per_call(TextAnalyzer(cache_size=0).analyze, turns),
+        "analyze_cached_us": time_per_call(analyzer.analyze, turns[-analyzer.cache_size:]),
+    }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'variant':<24}{'us/turn':>10}")
+    for name, value in results.items():
+        print(f"{name[:-3]:<24}{value:>10}")
+    print(f"\nper-turn speedup: {results['legacy_turn_us'] / results['shared_turn_us']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
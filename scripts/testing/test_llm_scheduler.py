@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Focused checks for the LLM request scheduler: preemption and requeue of
+autonomous work, non-preemptible streams, and cancellation of queued requests.
+Uses a fake slot model, so no llama.cpp model is needed.
+"""
+
+import os
+import sys
+import threading
+import time
+
+# Add the project root to the path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from models.llm_cancellation import CancellationToken, GenerationCancelled
+from models.llm_scheduler import LLMScheduler, RequestPriority
+
+
+def make_scheduler(**kwargs):
+    scheduler = LLMScheduler(lambda index: f"slot-{index}", **kwargs)
+    scheduler.start()
+    return scheduler
+
+
+def test_interactive_request_preempts_autonomous_generation():
+    scheduler = make_scheduler(parallel_slots=1)
+    started = threading.Event()
+    runs = []
+
+    def autonomous(model):
+        runs.append("autonomous")
+        started.set()
+        # A decode loop polling the stopping criteria
+        while not scheduler.should_stop():
+            time.sleep(0.01)
+            if len(runs) > 1:
+                return "autonomous done"
+        return "partial"
+
+    try:
+        background = scheduler.submit(autonomous, priority=RequestPriority.AUTONOMOUS)
+        assert started.wait(2)
+        interactive = scheduler.submit(lambda model: runs.append("interactive") or "reply")
+
+        assert interactive.result(timeout=2) == "reply"
+        assert background.result(timeout=2) == "autonomous done"
+        assert runs == ["autonomous", "interactive", "autonomous"]
+        stats = scheduler.get_stats()
+        assert stats["preempted"] == 1
+        assert stats["by_priority"]["autonomous"]["preempted"] == 1
+    finally:
+        scheduler.shutdown()
+
+
+def test_non_preemptible_stream_is_never_preempted():
+    scheduler = make_scheduler(parallel_slots=1)
+    started = threading.Event()
+    release = threading.Event()
+    stop_seen = []
+
+    def stream(model):
+        started.set()
+        release.wait(2)
+        stop_seen.append(scheduler.should_stop())
+        return "stream done"
+
+    try:
+        streaming = scheduler.submit(stream, priority=RequestPriority.AUTONOMOUS, preemptible=False)
+        assert started.wait(2)
+        interactive = scheduler.submit(lambda model: "reply")
+        release.set()
+
+        assert streaming.result(timeout=2) == "stream done"
+        assert interactive.result(timeout=2) == "reply"
+        assert stop_seen == [False]
+        assert scheduler.get_stats()["preempted"] == 0
+    finally:
+        scheduler.shutdown()
+
+
+def test_cancelled_queued_request_leaves_the_queue():
+    scheduler = make_scheduler(parallel_slots=1, max_queue_size=2)
+    started = threading.Event()
+    release = threading.Event()
+
+    def blocker(model):
+        started.set()
+        release.wait(2)
+        return "blocker done"
+
+    try:
+        running = scheduler.submit(blocker)
+        assert started.wait(2)
+        token = CancellationToken(owner="client")
+        queued = scheduler.submit(lambda model: "never", cancel_token=token)
+        scheduler.submit(lambda model: "kept")
+        assert scheduler.get_stats()["queue_depth"] == 2
+
+        token.cancel()
+        assert queued.cancelled()
+        # The cancelled request no longer counts toward max_queue_size
+        assert scheduler.get_stats()["queue_depth"] == 1
+        third = scheduler.submit(lambda model: "third")
+
+        release.set()
+        assert running.result(timeout=2) == "blocker done"
+        assert third.result(timeout=2) == "third"
+        assert scheduler.get_stats()["cancelled_in_queue"] == 1
+    finally:
+        scheduler.shutdown()
+
+
+def test_cancelled_running_request_fails_with_generation_cancelled():
+    scheduler = make_scheduler(parallel_slots=1)
+    started = threading.Event()
+
+    def generation(model):
+        started.set()
+        while not scheduler.should_stop():
+            time.sleep(0.01)
+        return "partial"
+
+    try:
+        token = CancellationToken(owner="client")
+        future = scheduler.submit(generation, cancel_token=token)
+        assert started.wait(2)
+        token.cancel()
+        try:
+            future.result(timeout=2)
+        except GenerationCancelled:
+            pass
+        else:
+            raise AssertionError("cancelled generation returned a result")
+        assert scheduler.get_stats()["cancelled_running"] == 1
+    finally:
+        scheduler.shutdown()
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✓ {name}")
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Focused checks for the out-of-process LLM worker proxy: streams that fail
+mid-way or are abandoned by the consumer must leave the worker usable, and a
+worker that ignores an abort is respawned instead of wedging its slot.
+The worker loop runs in a thread against a stand-in llama_cpp module, so no
+model is needed.
+"""
+
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import types
+
+# Add the project root to the path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from models.llm_worker_pool import LLMWorker, LLMWorkerError, _worker_main
+
+release_hung_streams = threading.Event()
+
+
+class FakeLlama:
+    """Streams numbered chunks; the prompt picks the failure mode."""
+
+    def __init__(self, model_path, verbose=False, **kwargs):
+        pass
+
+    def n_ctx(self):
+        return 512
+
+    def __call__(self, prompt, stopping_criteria=None, stream=False, **kwargs):
+        if not stream:
+            return {"choices": [{"text": prompt.upper()}]}
+        return self._stream(prompt, stopping_criteria)
+
+    def _stream(self, prompt, stopping_criteria):
+        for index in range(200):
+            if prompt == "fail" and index == 1:
+                raise RuntimeError("decode failed")
+            if prompt == "hang" and index == 1:
+                # Ignores the abort signal, like a decode stuck in native code
+                release_hung_streams.wait(30)
+                return
+            if stopping_criteria(None, None):
+                return
+            yield {"choices": [{"text": str(index)}]}
+            time.sleep(0.01)
+
+
+class FakeStoppingCriteriaList(list):
+    def __call__(self, input_ids, logits):
+        return any(criteria(input_ids, logits) for criteria in self)
+
+
+sys.modules.setdefault("llama_cpp", types.SimpleNamespace(
+    Llama=FakeLlama, StoppingCriteriaList=FakeStoppingCriteriaList))
+
+
+class ThreadProcess:
+    """Stands in for the worker's multiprocessing.Process."""
+
+    def __init__(self, thread):
+        self.thread = thread
+
+    def is_alive(self):
+        return self.thread.is_alive()
+
+    def join(self, timeout=None):
+        self.thread.join(timeout)
+
+    def kill(self):
+        pass
+
+
+def make_worker():
+    """An LLMWorker whose worker loop runs in a thread of this process."""
+    worker = LLMWorker(0, "fake.gguf", {})
+    parent_conn, child_conn = multiprocessing.Pipe()
+    abort_event = threading.Event()
+    thread = threading.Thread(target=_worker_main, args=(child_conn, "fake.gguf", {}, abort_event), daemon=True)
+    thread.start()
+    assert parent_conn.recv()[0] == "ready"
+    worker._conn = parent_conn
+    worker._abort_event = abort_event
+    worker._process = ThreadProcess(thread)
+    return worker
+
+
+def consume_in_thread(target, timeout=3.0):
+    """Run ``target`` in a thread and fail if it does not return in time (a wedged slot)."""
+    outcome = {}
+
+    def run():
+        try:
+            outcome["result"] = target()
+        except Exception as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "stream consumer is still blocked"
+    return outcome
+
+
+def test_error_mid_stream_does_not_wedge_the_worker():
+    worker = make_worker()
+    try:
+        outcome = consume_in_thread(lambda: [chunk["choices"][0]["text"] for chunk in worker("fail", stream=True)])
+        assert isinstance(outcome.get("error"), LLMWorkerError)
+        assert "decode failed" in str(outcome["error"])
+        # The pipe holds nothing stale: the next request gets its own reply
+        assert worker("ok")["choices"][0]["text"] == "OK"
+        assert worker.ping()
+    finally:
+        worker.stop(timeout=1)
+
+
+def test_abandoned_stream_is_aborted_and_drained():
+    worker = make_worker()
+    try:
+        def read_two():
+            stream = worker("count", stream=True)
+            chunks = [next(stream), next(stream)]
+            stream.close()
+            return chunks
+
+        outcome = consume_in_thread(read_two)
+        assert len(outcome["result"]) == 2
+        assert worker("next")["choices"][0]["text"] == "NEXT"
+    finally:
+        worker.stop(timeout=1)
+
+
+def test_local_stop_request_ends_the_stream():
+    worker = make_worker()
+    try:
+        seen = []
+
+        def stop_after_three(input_ids, logits):
+            return len(seen) >= 3
+
+        def read_all():
+            for chunk in worker("count", stream=True, stopping_criteria=stop_after_three):
+                seen.append(chunk)
+            return len(seen)
+
+        outcome = consume_in_thread(read_all)
+        assert 3 <= outcome["result"] < 200
+    finally:
+        worker.stop(timeout=1)
+
+
+def test_worker_ignoring_an_abort_is_respawned():
+    worker = make_worker()
+    worker.DRAIN_TIMEOUT = 0.3
+    restarts = []
+    worker.restart = lambda: restarts.append(True)
+    try:
+        def abandon():
+            stream = worker("hang", stream=True)
+            next(stream)
+            stream.close()
+
+        consume_in_thread(abandon)
+        assert restarts == [True]
+        assert "did not stop" in worker.last_error
+    finally:
+        release_hung_streams.set()
+        worker.stop(timeout=1)
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✓ {name}")
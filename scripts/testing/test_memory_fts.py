@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Focused checks for the memories_fts index: the migration of existing rows and
+the triggers that keep it in sync on insert, update and delete, scoped to one
+user/model pair. Uses an in-memory SQLite database.
+"""
+
+import os
+import sqlite3
+import sys
+
+# Add the project root to the path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from databases.database_manager import ensure_memory_fts, memory_fts_owner
+
+
+def make_connection():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("""
+        CREATE TABLE memories (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT NOT NULL,
+            model_id TEXT NOT NULL DEFAULT 'default',
+            memory_type TEXT NOT NULL,
+            key_topic TEXT NOT NULL,
+            value_content TEXT NOT NULL,
+            importance_score REAL DEFAULT 0.5,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            last_accessed DATETIME DEFAULT CURRENT_TIMESTAMP,
+            access_count INTEGER DEFAULT 0
+        )
+    """)
+    return conn
+
+
+def add_memory(conn, user_id, model_id, key_topic, value_content):
+    return conn.execute("""
+        INSERT INTO memories (user_id, model_id, memory_type, key_topic, value_content)
+        VALUES (?, ?, 'fact', ?, ?)
+    """, (user_id, model_id, key_topic, value_content)).lastrowid
+
+
+def search(conn, user_id, model_id, term):
+    match = f'owner : "{memory_fts_owner(user_id, model_id)}" AND {{key_topic value_content}} : ("{term}")'
+    return sorted(row[0] for row in conn.execute(
+        "SELECT rowid FROM memories_fts WHERE memories_fts MATCH ?", (match,)))
+
+
+def test_existing_memories_are_indexed_on_creation():
+    conn = make_connection()
+    first = add_memory(conn, "alice", "default", "pets", "Has a cat named Miso")
+    if not ensure_memory_fts(conn):
+        print("FTS5 unavailable in this SQLite build, skipping")
+        return
+    assert search(conn, "alice", "default", "cat") == [first]
+
+
+def test_triggers_keep_the_index_in_sync():
+    conn = make_connection()
+    if not ensure_memory_fts(conn):
+        print("FTS5 unavailable in this SQLite build, skipping")
+        return
+    cat = add_memory(conn, "alice", "default", "pets", "Has a cat named Miso")
+    add_memory(conn, "bob", "default", "pets", "Has a cat named Pixel")
+    add_memory(conn, "alice", "hiyori", "pets", "Has a cat named Luna")
+
+    # Scoped to the user/model pair
+    assert search(conn, "alice", "default", "cat") == [cat]
+
+    conn.execute("UPDATE memories SET value_content = 'Has a dog named Miso' WHERE id = ?", (cat,))
+    assert search(conn, "alice", "default", "cat") == []
+    assert search(conn, "alice", "default", "dog") == [cat]
+
+    # Access tracking does not touch the index (and must not corrupt it)
+    conn.execute("UPDATE memories SET access_count = access_count + 1 WHERE id = ?", (cat,))
+    assert search(conn, "alice", "default", "dog") == [cat]
+
+    conn.execute("DELETE FROM memories WHERE id = ?", (cat,))
+    assert search(conn, "alice", "default", "dog") == []
+    conn.execute("INSERT INTO memories_fts (memories_fts) VALUES ('integrity-check')")
+
+
+def test_ensure_is_idempotent():
+    conn = make_connection()
+    if not ensure_memory_fts(conn):
+        print("FTS5 unavailable in this SQLite build, skipping")
+        return
+    memory = add_memory(conn, "alice", "default", "food", "Loves ramen")
+    assert ensure_memory_fts(conn)
+    # A second call must not re-run the migration and index rows twice
+    assert search(conn, "alice", "default", "ramen") == [memory]
+    conn.execute("DELETE FROM memories WHERE id = ?", (memory,))
+    assert search(conn, "alice", "default", "ramen") == []
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✓ {name}")
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Focused checks for the write-behind PostResponseQueue: batched commits, retry
+of a failing job, dropping after max_attempts, and after_commit hooks running
+once per committed job. Uses a temporary SQLite database.
+"""
+
+import os
+import sqlite3
+import sys
+import tempfile
+
+# Add the project root to the path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from models.post_response_queue import PostResponseQueue
+
+
+def make_queue(db_path, **kwargs):
+    queue = PostResponseQueue(lambda: sqlite3.connect(db_path, timeout=30), flush_interval=0.02, **kwargs)
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("CREATE TABLE IF NOT EXISTS notes (value TEXT NOT NULL)")
+    return queue
+
+
+def stored_values(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return sorted(row[0] for row in conn.execute("SELECT value FROM notes"))
+
+
+def journal_rows(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute("SELECT job_type, attempts FROM post_response_jobs").fetchall()
+
+
+def store_notes(conn, payloads):
+    for payload in payloads:
+        if payload["value"] == "bad":
+            raise ValueError("bad payload")
+        conn.execute("INSERT INTO notes (value) VALUES (?)", (payload["value"],))
+    return [payload["value"] for payload in payloads]
+
+
+def test_bad_job_is_retried_alone_and_dropped_after_max_attempts():
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "jobs.db")
+        queue = make_queue(db_path, max_attempts=3)
+        queue.register("note", store_notes)
+        queue.start()
+        try:
+            for value in ["a", "bad", "b"]:
+                queue.enqueue("note", {"value": value})
+            assert queue.flush(timeout=5)
+        finally:
+            queue.stop()
+
+        # Good jobs of the failed batch were committed; the bad one left no partial writes
+        assert stored_values(db_path) == ["a", "b"]
+        assert journal_rows(db_path) == []
+        stats = queue.get_stats()
+        assert stats["processed"] == 2
+        assert stats["failed"] == 3
+        assert stats["dropped"] == 1
+        assert "bad payload" in stats["last_error"]
+
+
+def test_after_commit_runs_once_per_committed_job():
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "jobs.db")
+        queue = make_queue(db_path, max_attempts=2)
+        hook_calls = []
+        queue.register("note", store_notes,
+                       after_commit=lambda payloads, result: hook_calls.append(list(result)))
+        queue.start()
+        try:
+            for value in ["a", "bad", "b"]:
+                queue.enqueue("note", {"value": value})
+            assert queue.flush(timeout=5)
+        finally:
+            queue.stop()
+
+        # Side effects of jobs replayed by the retry are not repeated, and the dropped job has none
+        hook_values = sorted(value for call in hook_calls for value in call)
+        assert hook_values == ["a", "b"]
+        assert stored_values(db_path) == ["a", "b"]
+
+
+def test_failing_hook_does_not_undo_the_commit():
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "jobs.db")
+        queue = make_queue(db_path)
+
+        def failing_hook(payloads, result):
+            raise RuntimeError("cache unavailable")
+
+        queue.register("note", store_notes, after_commit=failing_hook)
+        queue.start()
+        try:
+            queue.enqueue("note", {"value": "a"})
+            assert queue.flush(timeout=5)
+        finally:
+            queue.stop()
+
+        assert stored_values(db_path) == ["a"]
+        assert journal_rows(db_path) == []
+        assert "cache unavailable" in queue.get_stats()["last_error"]
+
+
+def test_unfinished_jobs_are_recovered_on_start():
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "jobs.db")
+        # Journaled but never applied, e.g. the process exited first
+        first = make_queue(db_path)
+        first.start()
+        first.enqueue("note", {"value": "a"})
+        first.stop(timeout=0.2)
+        assert journal_rows(db_path) == [("note", 0)]
+
+        second = make_queue(db_path)
+        second.register("note", store_notes)
+        second.start()
+        try:
+            assert second.flush(timeout=5)
+        finally:
+            second.stop()
+        assert stored_values(db_path) == ["a"]
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✓ {name}")
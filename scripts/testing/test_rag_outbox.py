@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Focused checks for the RAG outbox: the conversations triggers that queue
+replies and deletions, draining them into the vector store, dropping a poison
+row after max_attempts, and removing the outbox when no indexer drains it.
+Uses a temporary SQLite database and a fake RAG system (no ChromaDB needed).
+"""
+
+import os
+import sqlite3
+import sys
+import tempfile
+
+# Add the project root to the path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from databases.database_manager import drop_rag_outbox
+from models.rag_indexer import RAGOutboxIndexer
+
+
+class FakeRAGSystem:
+    """Records what the indexer writes instead of embedding it."""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.indexed = {}
+        self.watermark = 0
+        self.fail_on = set()
+
+    def add_conversation_pairs(self, pairs):
+        for user_row, reply_row in pairs:
+            if reply_row[4] in self.fail_on:
+                raise RuntimeError(f"cannot embed {reply_row[4]!r}")
+        for user_row, reply_row in pairs:
+            self.indexed[reply_row[0]] = (user_row[4], reply_row[4])
+        return len(pairs)
+
+    def delete_conversations(self, conversation_ids):
+        for conversation_id in conversation_ids:
+            self.indexed.pop(conversation_id, None)
+
+    def advance_sync_watermark(self, conversation_id):
+        self.watermark = max(self.watermark, conversation_id)
+
+    def ensure_embedding_space(self):
+        pass
+
+    def sync_with_conversation_db(self):
+        pass
+
+
+def make_database(tmp):
+    db_path = os.path.join(tmp, "conversations.db")
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("""
+            CREATE TABLE conversations (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT NOT NULL,
+                model_id TEXT NOT NULL DEFAULT 'default',
+                message_type TEXT NOT NULL,
+                content TEXT NOT NULL,
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+    return db_path
+
+
+def add_exchange(db_path, user_text, reply_text):
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("INSERT INTO conversations (user_id, message_type, content) VALUES ('alice', 'user', ?)",
+                     (user_text,))
+        return conn.execute("INSERT INTO conversations (user_id, message_type, content) "
+                            "VALUES ('alice', 'assistant', ?)", (reply_text,)).lastrowid
+
+
+def outbox_rows(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute("SELECT conversation_id, operation, attempts FROM rag_outbox ORDER BY id").fetchall()
+
+
+def test_replies_and_deletions_are_drained():
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = make_database(tmp)
+        rag = FakeRAGSystem(db_path)
+        indexer = RAGOutboxIndexer(rag, batch_size=2, catch_up=False)
+
+        first = add_exchange(db_path, "hi", "hello!")
+        second = add_exchange(db_path, "how are you?", "great")
+        third = add_exchange(db_path, "bye", "see you")
+        # Only assistant replies are queued
+        assert [row[0] for row in outbox_rows(db_path)] == [first, second, third]
+
+        assert indexer.drain() == 3
+        assert rag.indexed == {first: ("hi", "hello!"), second: ("how are you?", "great"),
+                               third: ("bye", "see you")}
+        assert rag.watermark == third
+        assert outbox_rows(db_path) == []
+
+        with sqlite3.connect(db_path) as conn:
+            conn.execute("DELETE FROM conversations WHERE id = ?", (second,))
+        assert outbox_rows(db_path) == [(second, "delete", 0)]
+        assert indexer.drain() == 1
+        assert second not in rag.indexed
+        assert indexer.get_stats()["pending"] == 0
+
+
+def test_poison_row_is_dropped_after_max_attempts():
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = make_database(tmp)
+        rag = FakeRAGSystem(db_path)
+        rag.fail_on.add("poison")
+        indexer = RAGOutboxIndexer(rag, batch_size=10, catch_up=False, max_attempts=3)
+
+        good = add_exchange(db_path, "hi", "hello!")
+        poison = add_exchange(db_path, "what?", "poison")
+        later = add_exchange(db_path, "ok", "fine")
+
+        indexer.drain()
+        # The batch failed, but row-by-row retry indexed the good rows around the poison one
+        assert set(rag.indexed) == {good, later}
+        assert outbox_rows(db_path) == [(poison, "insert", 1)]
+
+        indexer.drain()
+        indexer.drain()
+        assert outbox_rows(db_path) == []
+        stats = indexer.get_stats()
+        assert stats["dropped"] == 1
+        assert "poison" in stats["last_error"]
+
+        # Draining works normally afterwards
+        newest = add_exchange(db_path, "again", "sure")
+        indexer.drain()
+        assert newest in rag.indexed
+
+
+def test_drop_rag_outbox_stops_queueing():
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = make_database(tmp)
+        RAGOutboxIndexer(FakeRAGSystem(db_path), catch_up=False)
+        add_exchange(db_path, "hi", "hello!")
+
+        with sqlite3.connect(db_path) as conn:
+            drop_rag_outbox(conn)
+        # Without an indexer nothing drains the outbox, so nothing may feed it either
+        add_exchange(db_path, "still there?", "yes")
+        with sqlite3.connect(db_path) as conn:
+            names = {row[0] for row in conn.execute("SELECT name FROM sqlite_master")}
+            assert "rag_outbox" not in names
+            assert not any(name.startswith("conversations_rag_outbox") for name in names)
+            assert conn.execute("SELECT COUNT(*) FROM conversations").fetchone()[0] == 4
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✓ {name}")
@@ -12,6 +12,50 @@ from pathlib import Path
 import json
 
 
+# KV cache / attention presets for llama.cpp. Quantized caches shrink the per-token
+# KV memory (q8_0 ~53%, q4_0 ~28% of f16) so low-RAM boxes can afford a usable
+# context; a quantized V cache needs flash attention. "truncate_reply" reserves only
+# min_reply_tokens when fitting the prompt and shortens the reply to what is left,
+# instead of trimming prompt sections to keep the full max_tokens free.
+KV_CACHE_PRESETS = {
+    "f16": {"type_k": "f16", "type_v": "f16", "flash_attn": False,
+            "n_batch": 512, "n_ubatch": 512, "context_shift": "trim_prompt"},
+    "f16-flash": {"type_k": "f16", "type_v": "f16", "flash_attn": True,
+                  "n_batch": 2048, "n_ubatch": 512, "context_shift": "trim_prompt"},
+    "q8_0": {"type_k": "q8_0", "type_v": "q8_0", "flash_attn": True,
+             "n_batch": 512, "n_ubatch": 256, "context_shift": "truncate_reply", "min_reply_tokens": 192},
+    "q8_0-q4_0": {"type_k": "q8_0", "type_v": "q4_0", "flash_attn": True,
+                  "n_batch": 256, "n_ubatch": 128, "context_shift": "truncate_reply", "min_reply_tokens": 128},
+}
+
+# Bytes per cached element for each KV cache type (ggml block sizes)
+KV_CACHE_TYPE_BYTES = {"f16": 2.0, "q8_0": 34 / 32, "q4_0": 18 / 32}
+
+# ggml tensor type ids llama.cpp takes for type_k / type_v
+KV_CACHE_GGML_TYPES = {"f16": 1, "q4_0": 2, "q8_0": 8}
+
+
+def kv_cache_llama_kwargs(kv_cache: Dict[str, any]) -> Dict[str, any]:
+    """Translate a KV cache preset into llama.cpp constructor arguments."""
+    kwargs = {
+        "n_batch": int(kv_cache["n_batch"]),
+        "n_ubatch": min(int(kv_cache["n_ubatch"]), int(kv_cache["n_batch"])),
+        "flash_attn": bool(kv_cache["flash_attn"]),
+    }
+    # f16 is llama.cpp's default, so only quantized types are passed
+    for key in ("type_k", "type_v"):
+        if kv_cache[key] != "f16":
+            kwargs[key] = KV_CACHE_GGML_TYPES[kv_cache[key]]
+    return kwargs
+
+
+def estimate_kv_cache_mb(n_ctx: int, n_layer: int, n_embd_kv: int,
+                         type_k: str = "f16", type_v: str = "f16") -> float:
+    """Estimate KV cache size in MB for one context (n_embd_kv = kv heads * head dim)."""
+    per_token = n_layer * n_embd_kv * (KV_CACHE_TYPE_BYTES[type_k] + KV_CACHE_TYPE_BYTES[type_v])
+    return round(n_ctx * per_token / (1024 * 1024), 1)
+
+
 class SystemDetector:
     """
     Detects system capabilities and recommends optimal AI model configurations.
@@ -417,8 +461,49 @@ class SystemDetector:
         else:
             flags["use_mlock"] = True
         
+        flags["speculative_decoding"] = self.get_speculative_decoding_preset(flags)
+        flags["kv_cache"] = self.get_kv_cache_preset(flags)
+        
         return flags
     
+    def get_kv_cache_preset(self, flags: Dict[str, any]) -> Dict[str, any]:
+        """
+        Get the KV cache / flash attention preset for this system.
+        
+        4-8 GB boards and mini-PCs quantize the cache to q8_0, smaller ones also
+        quantize V to q4_0; larger CPU machines keep f16, and GPU offload adds flash
+        attention with bigger batches.
+        """
+        tier = self.capabilities.get("performance_tier", "low")
+        if tier == "low":
+            name = "q8_0-q4_0"
+        elif tier == "low-medium":
+            name = "q8_0"
+        elif flags.get("n_gpu_layers", 0) > 0:
+            name = "f16-flash"
+        else:
+            name = "f16"
+        return {"preset": name, **KV_CACHE_PRESETS[name]}
+    
+    def get_speculative_decoding_preset(self, flags: Dict[str, any]) -> Optional[Dict[str, any]]:
+        """
+        Get the prompt-lookup speculative decoding preset for this system.
+        
+        Draft tokens are verified in one batch, which pays off when the model is
+        memory-bandwidth bound; on the weakest tier the extra verification work
+        outweighs the gain, so no preset is returned.
+        """
+        tier = self.capabilities.get("performance_tier", "low")
+        if tier == "low":
+            return None
+        
+        # Longer drafts help on GPU; CPU-only machines do best with short ones
+        return {
+            "mode": "prompt_lookup",
+            "num_pred_tokens": 10 if flags.get("n_gpu_layers", 0) > 0 else 2,
+            "max_ngram_size": 2
+        }
+    
     def get_system_summary(self) -> str:
         """Get a human-readable system summary."""
         info = self.system_info